@@ -1,31 +1,31 @@
 import os
+import time
 import asyncio
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, FSInputFile
-import aiosqlite
-import sqlite3
 from datetime import datetime, date, timedelta
 import json
 import re
-import aiohttp
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import platform
+from db_pool import acquire, get_pool_stats, get_blocking_stats
+import analytics
+import broadcast
+import export_cache
+import http_client
+import media_bridge
+import outbox
+import pdf_export
+import table_export
 from db import (
-    init_db, DB_PATH, get_setting, set_setting, get_all_settings, 
+    init_db, get_setting, set_setting, get_all_settings, 
     set_media_setting, get_media_setting, delete_media_setting, create_booking_by_admin,
     get_price_per_hour, set_price_per_hour, get_price_per_extra_guest, set_price_per_extra_guest,
     get_max_guests_included, set_max_guests_included,
-    add_expense, get_expenses, get_expenses_by_month, delete_expense, update_expense, get_expense_by_id,
+    add_expense, add_expenses_bulk, get_expenses, get_expenses_by_month, delete_expense, update_expense, get_expense_by_id,
     get_revenue_by_month, get_bookings_for_export, OPEN_HOUR, CLOSE_HOUR, MAX_BOOKING_DURATION,
-    add_price_rule, get_all_price_rules, get_price_rule_by_id, update_price_rule, delete_price_rule
+    add_price_rule, get_all_price_rules, get_price_rule_by_id, update_price_rule, delete_price_rule,
+    is_time_available, invalidate_availability, get_availability_cache_stats,
+    BOOKING_CONFLICT_HOURS, BOOKING_COLUMNS, get_bookings_page
 )
 
 # Загрузка .env (если установлен python-dotenv)
@@ -52,6 +52,15 @@ if ADMIN_USER_ID is None:
 # Состояния админа
 admin_states = {}
 
+# Выбранный формат выгрузки таблицы: admin_id -> "pdf" / "csv" / "xlsx"
+export_formats = {}
+
+# Как часто обновлять сообщение с ходом рассылки (секунды)
+BROADCAST_PROGRESS_INTERVAL = 3
+
+# Период тепловой карты загрузки (дней)
+HEATMAP_DAYS = 90
+
 # Состояния для редактирования текстов
 TEXT_EDITING_STATES = {
     "waiting_for_info_text": "info_text",
@@ -59,21 +68,10 @@ TEXT_EDITING_STATES = {
     "waiting_for_welcome_text": "welcome_text"
 }
 
-def get_db():
-    """Синхронное подключение к базе данных"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 async def notify_user(user_id, text):
-    """Уведомить пользователя через основной бот"""
-    url = f"https://api.telegram.org/bot{MAIN_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": user_id, "text": text}
+    """Уведомить пользователя через основной бот (через outbox)"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, timeout=5) as resp:
-                if resp.status != 200:
-                    print(f"[user notify error] Status: {resp.status}, Response: {await resp.text()}")
+        await outbox.notify(outbox.BOT_MAIN, user_id, text)
     except Exception as e:
         print(f"[user notify error] {e}")
 
@@ -83,13 +81,13 @@ def create_admin_menu():
         keyboard=[
             [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📅 Бронирования сегодня")],
             [KeyboardButton(text="📋 Все бронирования"), KeyboardButton(text="🔍 Найти бронирование")],
-            [KeyboardButton(text="📜 Прошедшие брони")],
+            [KeyboardButton(text="⏳ Идут сейчас"), KeyboardButton(text="📜 Прошедшие брони")],
             [KeyboardButton(text="✅ Подтвердить бронирование"), KeyboardButton(text="❌ Отменить бронирование")],
             [KeyboardButton(text="✏️ Редактировать бронирование"), KeyboardButton(text="🗑 Удалить бронирование")],
             [KeyboardButton(text="➕ Создать бронирование"), KeyboardButton(text="📱 Уведомить пользователя")],
             [KeyboardButton(text="💰 Управление ценами"), KeyboardButton(text="📉 Расходы")],
             [KeyboardButton(text="📄 Выгрузить таблицу"), KeyboardButton(text="⚙️ Настройки")],
-            [KeyboardButton(text="🔧 Расширенные настройки")]
+            [KeyboardButton(text="🔧 Расширенные настройки"), KeyboardButton(text="📣 Рассылка")]
         ],
         resize_keyboard=True,
         input_field_placeholder="Выберите действие"
@@ -99,9 +97,9 @@ def create_admin_menu():
 async def get_today_bookings():
     """Получить бронирования на сегодня"""
     today = date.today().strftime("%Y-%m-%d")
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT b.*, u.name, u.phone, u.telegram_id, u.username 
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT {BOOKING_COLUMNS}, u.name, u.phone, u.telegram_id, u.username 
             FROM bookings b 
             JOIN users u ON b.user_id = u.id 
             WHERE b.date = ? AND b.status != 'cancelled'
@@ -111,9 +109,9 @@ async def get_today_bookings():
 
 async def get_all_bookings(limit=50):
     """Получить все бронирования"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT b.*, u.name, u.phone, u.telegram_id, u.username 
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT {BOOKING_COLUMNS}, u.name, u.phone, u.telegram_id, u.username 
             FROM bookings b 
             JOIN users u ON b.user_id = u.id 
             WHERE b.status != 'cancelled'
@@ -122,52 +120,26 @@ async def get_all_bookings(limit=50):
         """, (limit,)) as cursor:
             return await cursor.fetchall()
 
-async def get_past_bookings(limit=50):
-    """Получить прошедшие бронирования (закончились более дня назад)
-    
-    Бронь считается прошедшей, если она закончилась на следующий день после окончания.
-    Например, если бронь закончилась 28.04.2026 в 22:00, то она станет прошедшей 29.04.2026.
-    """
-    today = date.today()
-    # Бронь считается прошедшей, если она закончилась хотя бы вчера
-    # То есть дата окончания + 1 день < сегодня
-    async with aiosqlite.connect(DB_PATH) as db:
-        bookings = []
-        async with db.execute("""
-            SELECT b.*, u.name, u.phone, u.telegram_id, u.username 
+async def get_upcoming_bookings(limit=10, statuses=('pending', 'confirmed')):
+    """Получить текущие и будущие бронирования (еще не закончились)"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    placeholders = ", ".join("?" for _ in statuses)
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT {BOOKING_COLUMNS}, u.name, u.phone, u.telegram_id, u.username 
             FROM bookings b 
             JOIN users u ON b.user_id = u.id 
-            WHERE b.status != 'cancelled'
-            ORDER BY b.date DESC, b.time DESC
-        """) as cursor:
-            all_bookings = await cursor.fetchall()
-        
-        for booking in all_bookings:
-            booking_date_str = booking[2]  # date
-            booking_time_str = booking[3]  # time
-            duration = booking[5]  # duration
-            
-            # Вычисляем дату и время окончания брони
-            booking_date = datetime.strptime(booking_date_str, "%Y-%m-%d").date()
-            booking_time = datetime.strptime(booking_time_str, "%H:%M").time()
-            booking_datetime = datetime.combine(booking_date, booking_time)
-            end_datetime = booking_datetime + timedelta(hours=duration)
-            end_date = end_datetime.date()
-            
-            # Бронь прошедшая, если дата окончания + 1 день <= сегодня
-            # (то есть на следующий день после окончания бронь становится прошедшей)
-            if end_date + timedelta(days=1) <= today:
-                bookings.append(booking)
-                if len(bookings) >= limit:
-                    break
-        
-        return bookings
+            WHERE b.end_at > ? AND b.status IN ({placeholders})
+            ORDER BY b.end_at ASC
+            LIMIT ?
+        """, (now, *statuses, limit)) as cursor:
+            return await cursor.fetchall()
 
 async def get_booking_by_id(booking_id):
     """Получить бронирование по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT b.*, u.name, u.phone, u.telegram_id, u.username 
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT {BOOKING_COLUMNS}, u.name, u.phone, u.telegram_id, u.username 
             FROM bookings b 
             JOIN users u ON b.user_id = u.id 
             WHERE b.id = ?
@@ -175,33 +147,24 @@ async def get_booking_by_id(booking_id):
             return await cursor.fetchone()
 
 async def get_statistics():
-    """Получить статистику"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Общая статистика
-        async with db.execute("SELECT COUNT(*) FROM bookings WHERE status != 'cancelled'") as cursor:
-            total_bookings = (await cursor.fetchone())[0]
-        
-        # Сегодняшние бронирования
-        today = date.today().strftime("%Y-%m-%d")
-        async with db.execute("SELECT COUNT(*) FROM bookings WHERE date = ? AND status != 'cancelled'", (today,)) as cursor:
-            today_bookings = (await cursor.fetchone())[0]
-        
-        # Завтрашние бронирования
-        tomorrow = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
-        async with db.execute("SELECT COUNT(*) FROM bookings WHERE date = ? AND status != 'cancelled'", (tomorrow,)) as cursor:
-            tomorrow_bookings = (await cursor.fetchone())[0]
-        
-        # Общая выручка
-        async with db.execute("SELECT SUM(total_price) FROM bookings WHERE status != 'cancelled'") as cursor:
-            total_revenue = (await cursor.fetchone())[0] or 0
-        
-        # Выручка за сегодня
-        async with db.execute("SELECT SUM(total_price) FROM bookings WHERE date = ? AND status != 'cancelled'", (today,)) as cursor:
-            today_revenue = (await cursor.fetchone())[0] or 0
-        
-        # Общие расходы
-        async with db.execute("SELECT SUM(amount) FROM expenses") as cursor:
-            total_expenses = (await cursor.fetchone())[0] or 0
+    """Получить статистику (по дневным агрегатам daily_stats)"""
+    today = date.today().strftime("%Y-%m-%d")
+    tomorrow = (date.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+    async with acquire() as db:
+        async with db.execute("""
+            SELECT 
+                SUM(bookings),
+                SUM(revenue),
+                SUM(expenses),
+                SUM(CASE WHEN date = ? THEN bookings ELSE 0 END),
+                SUM(CASE WHEN date = ? THEN revenue ELSE 0 END),
+                SUM(CASE WHEN date = ? THEN bookings ELSE 0 END)
+            FROM daily_stats
+        """, (today, today, tomorrow)) as cursor:
+            row = await cursor.fetchone()
+        total_bookings, total_revenue, total_expenses, today_bookings, today_revenue, tomorrow_bookings = (
+            value or 0 for value in row
+        )
         
         # Выручка по месяцам (последние 6 месяцев)
         revenue_by_month = await get_revenue_by_month()
@@ -224,7 +187,7 @@ def extract_booking_name_phone(booking):
     """Извлекает имя и телефон из notes бронирования.
     ВСЕГДА использует данные из notes, если они есть, т.к. каждая бронь имеет свои уникальные данные.
     """
-    # ВАЖНО: При запросе SELECT b.*, u.name, u.phone... структура такая:
+    # ВАЖНО: При запросе SELECT {BOOKING_COLUMNS}, u.name, u.phone... структура такая:
     # Индексы 0-9: поля из bookings (id, user_id, date, time, guests, duration, total_price, status, created_at, notes)
     # Индексы 10-13: поля из users (name, phone, telegram_id, username)
     # notes находится на индексе 9
@@ -331,8 +294,85 @@ def parse_expenses_from_text(text: str) -> list:
     
     return expenses
 
+def create_page_buttons(scope, page):
+    """Кнопки ◀️ / ▶️ для постраничного списка броней"""
+    buttons = []
+    for direction, booking_key, label in (("prev", page.prev_key, "◀️"), ("next", page.next_key, "▶️")):
+        if booking_key:
+            booking_date, booking_time, booking_id = booking_key
+            buttons.append(InlineKeyboardButton(
+                text=label,
+                callback_data=f"bookings_page_{scope}_{direction}_{booking_date}_{booking_time.replace(':', '')}_{booking_id}"
+            ))
+    return buttons
+
+def format_bookings_page(scope, page):
+    """Текст и клавиатура страницы списка броней (scope: all, past, current, find)"""
+    keyboard = []
+    if not page.rows:
+        empty_text = {
+            "all": "📋 Нет активных бронирований",
+            "past": "📜 Нет прошедших бронирований",
+            "current": "⏳ Сейчас нет идущих бронирований",
+            "find": "📋 Нет активных бронирований для поиска",
+        }[scope]
+        return empty_text, None
+    
+    # Строки: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id, u.username
+    # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
+    if scope == "all":
+        text = "📋 **Последние бронирования:**\n\n"
+        for booking in page.rows:
+            name, _ = extract_booking_name_phone(booking)
+            display_date = datetime.strptime(booking[2], "%Y-%m-%d").strftime("%d.%m")
+            text += f"📅 **{display_date} {booking[3]}** - {name} ({booking[4]} чел., {booking[5]} ч.)\n"
+            text += f"💰 {booking[6]} ₽ | ID: {booking[0]} | Статус: {booking[7]}\n\n"
+    elif scope in ("past", "current"):
+        text = "📜 **Прошедшие бронирования:**\n\n" if scope == "past" else "⏳ **Идут сейчас:**\n\n"
+        for booking in page.rows:
+            name, _ = extract_booking_name_phone(booking)
+            display_date = datetime.strptime(booking[2], "%Y-%m-%d").strftime("%d.%m.%Y")
+            end_time = (datetime.strptime(booking[3], "%H:%M") + timedelta(hours=booking[5])).strftime("%H:%M")
+            text += f"📅 **{display_date} {booking[3]}-{end_time}** - {name} ({booking[4]} чел., {booking[5]} ч.)\n"
+            text += f"💰 {booking[6]} ₽ | ID: {booking[0]} | Статус: {booking[7]}\n\n"
+    else:
+        text = "🔍 **Выберите бронирование для управления:**\n\n"
+        # Группируем по датам (строки уже отсортированы)
+        bookings_by_date = {}
+        for booking in page.rows:
+            bookings_by_date.setdefault(booking[2], []).append(booking)
+        
+        for booking_date, day_bookings in bookings_by_date.items():
+            display_date = datetime.strptime(booking_date, "%Y-%m-%d").strftime("%d.%m.%Y")
+            
+            # Если на один день несколько бронирований, показываем все
+            if len(day_bookings) > 1:
+                text += f"📅 **{display_date}** ({len(day_bookings)} бронирований):\n\n"
+            
+            for booking in day_bookings:
+                status_emoji = "✅" if booking[7] == "confirmed" else "⏳" if booking[7] == "pending" else "❌"
+                name, _ = extract_booking_name_phone(booking)
+                username = booking[13] if len(booking) > 13 and booking[13] and booking[13] != "None" else None
+                telegram_id = booking[12] if len(booking) > 12 else None
+                tg_link = f"@{username}" if username else (f"tg://user?id={telegram_id}" if telegram_id else "—")
+
+                text += f"{status_emoji} **{booking[3]}** - {name} ({booking[4]} чел., {booking[5]} ч.)\n"
+                text += f"🔗 {tg_link} | 💰 {booking[6]} ₽ | ID: {booking[0]}\n\n"
+
+                btn_text = f"{display_date} {booking[3]} - {name}"
+                if len(btn_text) > 60:  # Ограничение длины текста кнопки
+                    btn_text = f"{display_date} {booking[3]} - {name[:20]}"
+                keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"select_booking_{booking[0]}")])
+    
+    page_buttons = create_page_buttons(scope, page)
+    if page_buttons:
+        keyboard.append(page_buttons)
+    if scope == "find":
+        keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")])
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None
+
 def format_booking_info(booking):
-    # Структура результата запроса: b.* (id, user_id, date, time, guests, duration, total_price, status, created_at, notes), 
+    # Структура результата запроса: BOOKING_COLUMNS (id, user_id, date, time, guests, duration, total_price, status, created_at, notes), 
     # затем u.name, u.phone, u.telegram_id, u.username
     # Индексы: 0-9 из bookings (где notes на индексе 9), 10-13 из users
     date_str = datetime.strptime(booking[2], "%Y-%m-%d").strftime("%d.%m.%Y")
@@ -390,48 +430,34 @@ def create_booking_keyboard(booking_id, actions=['confirm', 'cancel', 'edit', 'd
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 async def init_admin_db():
-    """Инициализация таблицы администраторов"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS admins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE,
-                username TEXT,
-                name TEXT,
-                role TEXT DEFAULT 'admin',
-                created_at TEXT,
-                created_by INTEGER
-            )
-        ''')
-        await db.commit()
-        
-        # Добавляем главного админа если его нет
-        async with db.execute("SELECT COUNT(*) FROM admins WHERE telegram_id = ?", (ADMIN_USER_ID,)) as cursor:
-            count = (await cursor.fetchone())[0]
-            if count == 0:
-                await db.execute(
-                    "INSERT INTO admins (telegram_id, username, name, role, created_at) VALUES (?, ?, ?, 'super_admin', ?)",
-                    (ADMIN_USER_ID, "main_admin", "Главный администратор", datetime.now().isoformat())
-                )
-                await db.commit()
+    """Добавить главного администратора (таблицу создают миграции)"""
+    if ADMIN_USER_ID is None:
+        return
+    async with acquire() as db:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO admins (telegram_id, username, name, role, created_at) VALUES (?, ?, ?, 'super_admin', ?)",
+            (ADMIN_USER_ID, "main_admin", "Главный администратор", datetime.now().isoformat())
+        )
+        if cursor.rowcount:
+            await db.commit()
 
 async def is_admin(telegram_id: int) -> bool:
     """Проверить, является ли пользователь администратором"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT COUNT(*) FROM admins WHERE telegram_id = ?", (telegram_id,)) as cursor:
             count = (await cursor.fetchone())[0]
             return count > 0
 
 async def is_super_admin(telegram_id: int) -> bool:
     """Проверить, является ли пользователь супер-администратором"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT role FROM admins WHERE telegram_id = ?", (telegram_id,)) as cursor:
             result = await cursor.fetchone()
             return result and result[0] == 'super_admin'
 
 async def get_all_admins():
     """Получить список всех администраторов"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
             SELECT a.*, creator.name as created_by_name 
             FROM admins a 
@@ -440,196 +466,181 @@ async def get_all_admins():
         """) as cursor:
             return await cursor.fetchall()
 
-def register_cyrillic_font():
-    """Регистрирует кириллический шрифт для PDF"""
-    # Пробуем найти системные шрифты с поддержкой кириллицы
-    system = platform.system()
-    font_paths = []
-    
-    if system == 'Windows':
-        # Пути к шрифтам Windows
-        windir = os.environ.get('WINDIR', 'C:\\Windows')
-        font_paths = [
-            os.path.join(windir, 'Fonts', 'arial.ttf'),
-            os.path.join(windir, 'Fonts', 'arialbd.ttf'),
-            os.path.join(windir, 'Fonts', 'Arial.ttf'),
-            os.path.join(windir, 'Fonts', 'Arialbd.ttf'),
-            os.path.join(windir, 'Fonts', 'tahoma.ttf'),
-            os.path.join(windir, 'Fonts', 'tahomabd.ttf'),
-            os.path.join(windir, 'Fonts', 'Tahoma.ttf'),
-            os.path.join(windir, 'Fonts', 'Tahomabd.ttf'),
-        ]
-    elif system == 'Linux':
-        # Пути к шрифтам Linux
-        font_paths = [
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-            '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
-            '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
-        ]
-    elif system == 'Darwin':  # macOS
-        font_paths = [
-            '/Library/Fonts/Arial.ttf',
-            '/Library/Fonts/Arial Bold.ttf',
-        ]
-    
-    # Регистрируем шрифты
-    regular_font = None
-    bold_font = None
-    
-    for font_path in font_paths:
-        if os.path.exists(font_path):
-            try:
-                if 'bold' in font_path.lower() or 'bd' in font_path.lower():
-                    if not bold_font:
-                        pdfmetrics.registerFont(TTFont('CyrillicBold', font_path))
-                        bold_font = 'CyrillicBold'
-                else:
-                    if not regular_font:
-                        pdfmetrics.registerFont(TTFont('Cyrillic', font_path))
-                        regular_font = 'Cyrillic'
-                if regular_font and bold_font:
-                    break
-            except Exception as e:
-                print(f"Ошибка регистрации шрифта {font_path}: {e}")
-                continue
-    
-    # Если не нашли системные шрифты, используем встроенные (но они могут не поддерживать кириллицу)
-    if not regular_font:
-        regular_font = 'Helvetica'
-        bold_font = 'Helvetica-Bold'
-        print("⚠️ Кириллические шрифты не найдены, используется Helvetica (может отображаться некорректно)")
-    
-    return regular_font, bold_font
+async def generate_bookings_pdf(start_date: str = None, end_date: str = None, period_name: str = "Все время", on_progress=None) -> str:
+    """Генерировать PDF файл с таблицей бронирований
 
-async def generate_bookings_pdf(start_date: str = None, end_date: str = None, period_name: str = "Все время") -> str:
-    """Генерировать PDF файл с таблицей бронирований"""
+    Отрисовка идет в отдельном процессе (pdf_export), бот не блокируется.
+    """
     bookings = await get_bookings_for_export(start_date, end_date)
     
     if not bookings:
         return None
     
-    # Регистрируем кириллические шрифты
-    cyrillic_font, cyrillic_bold = register_cyrillic_font()
-    
     # Создаем временный файл
     filename = f"bookings_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     filepath = os.path.join(os.path.dirname(__file__), filename)
     
-    # Создаем PDF документ (альбомная ориентация для широкой таблицы)
-    doc = SimpleDocTemplate(filepath, pagesize=landscape(A4))
-    story = []
-    
-    # Стили
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName=cyrillic_bold
-    )
-    
-    # Создаем стиль для обычного текста с кириллицей
-    normal_style = ParagraphStyle(
-        'CyrillicNormal',
-        parent=styles['Normal'],
-        fontName=cyrillic_font
-    )
-    
-    # Заголовок
-    title = Paragraph(f"Сводная таблица бронирований - {period_name}", title_style)
-    story.append(title)
-    story.append(Spacer(1, 0.5*cm))
-    
-    # Информация о периоде и общая статистика
-    total_revenue = sum(b['total_price'] for b in bookings)
-    info_text = f"<b>Период:</b> {period_name}<br/>"
-    info_text += f"<b>Всего бронирований:</b> {len(bookings)}<br/>"
-    info_text += f"<b>Общая выручка:</b> {total_revenue:,} ₽"
-    info_para = Paragraph(info_text, normal_style)
-    story.append(info_para)
-    story.append(Spacer(1, 0.5*cm))
-    
-    # Подготовка данных для таблицы
-    table_data = []
-    
-    # Заголовки таблицы
-    headers = [
-        'ID', 'Дата', 'Время', 'Гости', 'Длит.', 
-        'Стоимость', 'Имя', 'Телефон', 'TG ID', 'Статус'
+    return await pdf_export.export_bookings_pdf(bookings, period_name, filepath, on_progress)
+
+EXPORT_FORMAT_PDF = "pdf"
+EXPORT_FORMAT_NAMES = {
+    EXPORT_FORMAT_PDF: "PDF",
+    table_export.FORMAT_CSV: "CSV (gzip)",
+    table_export.FORMAT_XLSX: "Excel (XLSX)",
+}
+
+def create_export_format_keyboard() -> InlineKeyboardMarkup:
+    """Выбор формата выгрузки таблицы"""
+    keyboard = [
+        [InlineKeyboardButton(text="📄 PDF", callback_data="export_format_pdf")],
+        [InlineKeyboardButton(text="🗜 CSV (gzip)", callback_data="export_format_csv")],
     ]
-    table_data.append(headers)
-    
-    # Данные бронирований
-    for booking in bookings:
-        date_str = datetime.strptime(booking['date'], '%Y-%m-%d').strftime('%d.%m.%Y')
-        time_str = booking['time']
-        end_time = (datetime.strptime(booking['time'], '%H:%M') + timedelta(hours=booking['duration'])).strftime('%H:%M')
-        time_range = f"{time_str}-{end_time}"
-        
-        tg_info = f"@{booking['username']}" if booking['username'] else f"ID:{booking['telegram_id']}" if booking['telegram_id'] else "—"
-        
-        status_ru = {
-            'pending': 'Ожидает',
-            'confirmed': 'Подтверждено',
-            'cancelled': 'Отменено'
-        }.get(booking['status'], booking['status'])
-        
-        row = [
-            str(booking['id']),
-            date_str,
-            time_range,
-            str(booking['guests']),
-            f"{booking['duration']}ч",
-            f"{booking['total_price']:,} ₽",
-            booking['name'] or '—',
-            booking['phone'] or '—',
-            tg_info,
-            status_ru
-        ]
-        table_data.append(row)
-    
-    # Создаем таблицу
-    table = Table(table_data, colWidths=[1*cm, 2*cm, 2*cm, 1*cm, 1*cm, 2*cm, 2.5*cm, 2.5*cm, 2*cm, 1.5*cm])
+    if table_export.is_xlsx_available():
+        keyboard.append([InlineKeyboardButton(text="📊 Excel (XLSX)", callback_data="export_format_xlsx")])
+    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def create_export_period_keyboard() -> InlineKeyboardMarkup:
+    """Выбор периода выгрузки таблицы"""
+    keyboard = [
+        [InlineKeyboardButton(text="📅 За все время", callback_data="export_all_time")],
+        [InlineKeyboardButton(text="📆 По месяцам", callback_data="export_by_month")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="export_formats")]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+async def send_bookings_export(callback: types.CallbackQuery, start_date: str, end_date: str,
+                               period_name: str, file_suffix: str):
+    """Сформировать выгрузку за период в выбранном админом формате и отправить файл"""
+    export_format = export_formats.get(callback.from_user.id, EXPORT_FORMAT_PDF)
+    format_name = EXPORT_FORMAT_NAMES.get(export_format, export_format)
     
-    # Стиль таблицы
-    table.setStyle(TableStyle([
-        # Заголовок
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a90e2')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), cyrillic_bold),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('TOPPADDING', (0, 0), (-1, 0), 12),
-        
-        # Данные
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 1), (-1, -1), cyrillic_font),
-        ('FONTSIZE', (0, 1), (-1, -1), 7),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        
-        # Чередование цветов строк
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
-    ]))
+    progress_text = f"⏳ Генерация {format_name} таблицы {period_name}..."
+    await callback.message.edit_text(progress_text)
+    await callback.answer()
     
-    story.append(table)
+    caption = f"📄 Сводная таблица бронирований {period_name}"
+    extension = "pdf" if export_format == EXPORT_FORMAT_PDF else table_export.FILE_EXTENSIONS[export_format]
+    filename = f"bookings_{file_suffix}.{extension}"
     
-    # Создаем PDF
-    doc.build(story)
+    try:
+        # Данные периода не менялись - отправляем готовый файл
+        cache_key = await export_cache.make_key(export_format, start_date, end_date)
+        cached = await export_cache.lookup(cache_key)
+        if cached:
+            filepath, file_id = cached
+            document = file_id or FSInputFile(filepath, filename=filename)
+        else:
+            filepath = await build_bookings_export(callback, export_format, start_date, end_date,
+                                                   period_name, progress_text)
+            if not filepath:
+                await callback.message.answer("❌ Нет данных для экспорта")
+                return
+            filepath = await export_cache.store(cache_key, filepath, extension)
+            file_id = None
+            document = FSInputFile(filepath, filename=filename)
+        
+        sent = await callback.message.answer_document(document=document, caption=caption)
+        if not file_id and sent.document:
+            await export_cache.remember_file_id(cache_key, sent.document.file_id)
+    except Exception as e:
+        await callback.message.answer(f"❌ Ошибка при генерации {format_name}: {str(e)}")
+        print(f"Ошибка генерации выгрузки ({export_format}): {e}")
+
+async def build_bookings_export(callback: types.CallbackQuery, export_format: str, start_date: str,
+                                end_date: str, period_name: str, progress_text: str):
+    """Сформировать файл выгрузки, вернуть путь (None - нет данных)"""
+    if export_format == EXPORT_FORMAT_PDF:
+        return await generate_bookings_pdf(
+            start_date=start_date,
+            end_date=end_date,
+            period_name=period_name[:1].upper() + period_name[1:],
+            on_progress=make_pdf_progress(callback.message, progress_text)
+        )
     
+    extension = table_export.FILE_EXTENSIONS[export_format]
+    filepath = os.path.join(
+        os.path.dirname(__file__),
+        f"bookings_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    )
+    rows_count = await table_export.export_bookings_table(export_format, filepath, start_date, end_date)
+    if not rows_count:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return None
     return filepath
 
+async def create_broadcast_menu():
+    """Текст и кнопки меню рассылок: сегменты и незавершенные рассылки"""
+    text = "📣 **Рассылка пользователям**\n\nВыберите, кому отправить сообщение:"
+    keyboard = []
+    for segment, name in broadcast.SEGMENT_NAMES.items():
+        days = broadcast.RECENT_DAYS_DEFAULT if segment == broadcast.SEGMENT_RECENT else None
+        count = await broadcast.count_recipients(segment, days)
+        if days:
+            name = f"{name} ({days} дн.)"
+        keyboard.append([InlineKeyboardButton(
+            text=f"{name}: {count}", callback_data=f"broadcast_segment_{segment}"
+        )])
+    
+    unfinished = await broadcast.list_unfinished_broadcasts()
+    if unfinished:
+        text += "\n\n⏸ Незавершенные рассылки можно продолжить:"
+        for item in unfinished[:5]:
+            keyboard.append([InlineKeyboardButton(
+                text=f"▶️ #{item['id']}: {item['sent'] + item['failed']} из {item['total']}",
+                callback_data=f"broadcast_resume_{item['id']}"
+            )])
+    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")])
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def format_broadcast_progress(item: dict):
+    """Текст и кнопки сообщения о ходе рассылки"""
+    status_names = {
+        broadcast.BROADCAST_RUNNING: "⏳ Идет отправка",
+        broadcast.BROADCAST_PAUSED: "⏸ Приостановлена",
+        broadcast.BROADCAST_DONE: "✅ Завершена",
+    }
+    text = (
+        f"📣 Рассылка #{item['id']} ({broadcast.SEGMENT_NAMES.get(item['segment'], item['segment'])})\n\n"
+        f"{status_names.get(item['status'], item['status'])}\n"
+        f"✅ Отправлено: {item['sent']}\n"
+        f"❌ Не доставлено: {item['failed']}\n"
+        f"📊 Всего получателей: {item['total']}"
+    )
+    if item['status'] == broadcast.BROADCAST_RUNNING:
+        button = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"broadcast_pause_{item['id']}")
+    elif item['status'] == broadcast.BROADCAST_PAUSED:
+        button = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"broadcast_resume_{item['id']}")
+    else:
+        return text, None
+    return text, InlineKeyboardMarkup(inline_keyboard=[[button]])
+
+def make_broadcast_progress(message: types.Message):
+    """Обновлять сообщение о ходе рассылки не чаще BROADCAST_PROGRESS_INTERVAL секунд"""
+    last_update = {"time": 0.0, "status": None}
+    
+    async def on_progress(item: dict):
+        now = time.monotonic()
+        if item['status'] == last_update["status"] and now - last_update["time"] < BROADCAST_PROGRESS_INTERVAL:
+            return
+        last_update.update(time=now, status=item['status'])
+        text, markup = format_broadcast_progress(item)
+        await message.edit_text(text, reply_markup=markup)
+    return on_progress
+
+def make_pdf_progress(message: types.Message, text: str):
+    """Обновлять сообщение «⏳ Генерация...» по мере готовности страниц"""
+    async def on_progress(page: int, total_pages: int):
+        await message.edit_text(f"{text}\n📄 Готово страниц: {page} из ~{total_pages}")
+    return on_progress
+
 async def main():
     await init_db()  # Инициализируем основные таблицы БД
     await init_admin_db()  # Инициализируем таблицу администраторов
-    bot = Bot(token=ADMIN_BOT_TOKEN)
+    # Отправка уведомлений из outbox (при запуске через main.py воркер общий с основным ботом)
+    outbox.start_worker({outbox.BOT_ADMIN: ADMIN_BOT_TOKEN, outbox.BOT_MAIN: MAIN_BOT_TOKEN})
+    bot = http_client.get_bot(ADMIN_BOT_TOKEN)
     dp = Dispatcher()
 
     @dp.message(Command("start"))
@@ -647,6 +658,30 @@ async def main():
         """
         await message.answer(welcome_text, reply_markup=create_admin_menu())
 
+    @dp.message(Command("diag"))
+    async def cmd_diag(message: types.Message):
+        """Диагностика: пул подключений к БД и кэши"""
+        if not await is_admin(message.from_user.id):
+            return
+        
+        pool = get_pool_stats()["async"] or {}
+        cache = get_availability_cache_stats()
+        diag_text = (
+            "🛠 Диагностика\n\n"
+            "🗄 Пул подключений к БД:\n"
+            f"• Подключений: {pool.get('created', 0)}/{pool.get('size', 0)} (свободно {pool.get('idle', 0)})\n"
+            f"• Выдач: {pool.get('checkouts', 0)}, с ожиданием: {pool.get('waits', 0)}\n"
+            f"• Ожидание: среднее {pool.get('avg_wait_ms', 0):.2f} мс, макс. {pool.get('max_wait_ms', 0):.2f} мс\n\n"
+            "📅 Кэш доступности:\n"
+            f"• Попаданий: {cache['hits']}, промахов: {cache['misses']} ({cache['hit_rate']:.0%})\n"
+            f"• Сбросов: {cache['invalidations']}, дат в кэше: {cache['size']}"
+        )
+        blocking = get_blocking_stats()
+        if blocking:
+            diag_text += "\n\n⚠️ Блокирующие вызовы sqlite3 в цикле событий:\n"
+            diag_text += "\n".join(f"• {location}: {count}" for location, count in blocking.items())
+        await message.answer(diag_text)
+
     @dp.message(F.text == "📊 Статистика")
     async def handle_statistics(message: types.Message):
         if not await is_admin(message.from_user.id):
@@ -689,7 +724,24 @@ async def main():
             profit = month_data['revenue'] - expense['total']
             stats_text += f"• {month_name}: {expense['total']:,} ₽ ({expense['count']} расходов) | Прибыль: {profit:,} ₽\n"
         
-        await message.answer(stats_text)
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔥 Загрузка по часам", callback_data="stats_heatmap")]
+        ])
+        await message.answer(stats_text, reply_markup=keyboard)
+
+    @dp.callback_query(F.data == "stats_heatmap")
+    async def handle_stats_heatmap(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        if not analytics.is_available():
+            await callback.answer("❌ Для отчета нужен пакет numpy", show_alert=True)
+            return
+        
+        heatmap = await analytics.get_occupancy_heatmap(days=HEATMAP_DAYS)
+        report = analytics.format_heatmap_report(heatmap, OPEN_HOUR, CLOSE_HOUR)
+        await callback.message.answer(report, parse_mode="Markdown")
+        await callback.answer()
 
     @dp.message(F.text == "📅 Бронирования сегодня")
     async def handle_today_bookings(message: types.Message):
@@ -717,109 +769,49 @@ async def main():
         if not await is_admin(message.from_user.id):
             return
         
-        bookings = await get_all_bookings(20)  # Показываем последние 20
-        if not bookings:
-            await message.answer("📋 Нет активных бронирований")
-            return
-        
-        text = "📋 **Последние бронирования:**\n\n"
-        for booking in bookings:
-            # get_all_bookings возвращает: b.*, u.name, u.phone, u.telegram_id, u.username
-            # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
-            name, _ = extract_booking_name_phone(booking)
-            date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
-            display_date = date_obj.strftime("%d.%m")
-            text += f"📅 **{display_date} {booking[3]}** - {name} ({booking[4]} чел., {booking[5]} ч.)\n"
-            text += f"💰 {booking[6]} ₽ | ID: {booking[0]} | Статус: {booking[7]}\n\n"
-        
-        await message.answer(text)
+        text, markup = format_bookings_page("all", await get_bookings_page("all"))
+        await message.answer(text, reply_markup=markup)
     
     @dp.message(F.text == "📜 Прошедшие брони")
     async def handle_past_bookings(message: types.Message):
         if not await is_admin(message.from_user.id):
             return
         
-        bookings = await get_past_bookings(limit=50)
-        
-        if not bookings:
-            await message.answer("📜 Нет прошедших бронирований")
+        text, markup = format_bookings_page("past", await get_bookings_page("past"))
+        await message.answer(text, reply_markup=markup)
+
+    @dp.message(F.text == "⏳ Идут сейчас")
+    async def handle_current_bookings(message: types.Message):
+        if not await is_admin(message.from_user.id):
             return
         
-        text = "📜 **Прошедшие бронирования:**\n\n"
-        for booking in bookings:
-            name, _ = extract_booking_name_phone(booking)
-            date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
-            display_date = date_obj.strftime("%d.%m.%Y")
-            end_time = (datetime.strptime(booking[3], "%H:%M") + timedelta(hours=booking[5])).strftime("%H:%M")
-            text += f"📅 **{display_date} {booking[3]}-{end_time}** - {name} ({booking[4]} чел., {booking[5]} ч.)\n"
-            text += f"💰 {booking[6]} ₽ | ID: {booking[0]} | Статус: {booking[7]}\n\n"
-        
-        await message.answer(text)
+        text, markup = format_bookings_page("current", await get_bookings_page("current"))
+        await message.answer(text, reply_markup=markup)
 
     @dp.message(F.text == "🔍 Найти бронирование")
     async def handle_find_booking(message: types.Message):
         if not await is_admin(message.from_user.id):
             return
         
-        # Получаем все бронирования (включая старые), сгруппированные по датам
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("""
-                SELECT b.*, u.name, u.phone, u.telegram_id, u.username 
-                FROM bookings b 
-                JOIN users u ON b.user_id = u.id 
-                WHERE b.status != 'cancelled'
-                ORDER BY b.date ASC, b.time ASC
-                LIMIT 50
-            """) as cursor:
-                bookings = await cursor.fetchall()
-        
-        if not bookings:
-            await message.answer("📋 Нет активных бронирований для поиска")
-            return
-        
-        # Группируем по датам
-        bookings_by_date = {}
-        for booking in bookings:
-            booking_date = booking[2]
-            if booking_date not in bookings_by_date:
-                bookings_by_date[booking_date] = []
-            bookings_by_date[booking_date].append(booking)
-        
-        text = "🔍 **Выберите бронирование для управления:**\n\n"
-        keyboard = []
-        
-        # Показываем все бронирования, сгруппированные по датам
-        for booking_date in sorted(bookings_by_date.keys()):
-            date_obj = datetime.strptime(booking_date, "%Y-%m-%d")
-            display_date = date_obj.strftime("%d.%m.%Y")
-            
-            # Если на один день несколько бронирований, показываем все
-            day_bookings = bookings_by_date[booking_date]
-            
-            if len(day_bookings) > 1:
-                text += f"📅 **{display_date}** ({len(day_bookings)} бронирований):\n\n"
-            
-            for booking in day_bookings:
-                # get_all_bookings возвращает: b.*, u.name, u.phone, u.telegram_id, u.username
-                # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
-                status_emoji = "✅" if booking[7] == "confirmed" else "⏳" if booking[7] == "pending" else "❌"
-                name, _ = extract_booking_name_phone(booking)
-                username = booking[13] if len(booking) > 13 and booking[13] and booking[13] != "None" else None
-                telegram_id = booking[12] if len(booking) > 12 else None
-                tg_link = f"@{username}" if username else (f"tg://user?id={telegram_id}" if telegram_id else "—")
-
-                text += f"{status_emoji} **{booking[3]}** - {name} ({booking[4]} чел., {booking[5]} ч.)\n"
-                text += f"🔗 {tg_link} | 💰 {booking[6]} ₽ | ID: {booking[0]}\n\n"
+        # Все бронирования (включая старые), начиная с самых ранних
+        text, markup = format_bookings_page("find", await get_bookings_page("find"))
+        await message.answer(text, reply_markup=markup)
 
-                btn_text = f"{display_date} {booking[3]} - {name}"
-                if len(btn_text) > 60:  # Ограничение длины текста кнопки
-                    btn_text = f"{display_date} {booking[3]} - {name[:20]}"
-                keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"select_booking_{booking[0]}")])
-        
-        keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")])
-        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    @dp.callback_query(F.data.regexp(r"^bookings_page_(all|past|current|find)_(next|prev)_\d{4}-\d{2}-\d{2}_\d{4}_\d+$"))
+    async def handle_bookings_page(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
         
-        await message.answer(text, reply_markup=markup)
+        _, _, scope, direction, booking_date, booking_time, booking_id = callback.data.split("_")
+        key = (booking_date, f"{booking_time[:2]}:{booking_time[2:]}", int(booking_id))
+        page = await get_bookings_page(scope, key, direction)
+        text, markup = format_bookings_page(scope, page)
+        try:
+            await callback.message.edit_text(text, reply_markup=markup)
+        except Exception as e:
+            # Страница не изменилась или сообщение слишком старое
+            print(f"Ошибка при смене страницы: {e}")
+        await callback.answer()
 
     @dp.message(F.text == "✅ Подтвердить бронирование")
     async def handle_confirm_booking_button(message: types.Message):
@@ -827,9 +819,9 @@ async def main():
             return
         
         # Показываем бронирования со статусом "pending" для подтверждения
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("""
-                SELECT b.*, u.name, u.phone, u.telegram_id 
+        async with acquire() as db:
+            async with db.execute(f"""
+                SELECT {BOOKING_COLUMNS}, u.name, u.phone, u.telegram_id 
                 FROM bookings b 
                 JOIN users u ON b.user_id = u.id 
                 WHERE b.status = 'pending'
@@ -846,7 +838,7 @@ async def main():
         keyboard = []
         
         for booking in bookings:
-            # get_pending_bookings возвращает: b.*, u.name, u.phone, u.telegram_id
+            # get_pending_bookings возвращает: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id
             # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id
             date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
             display_date = date_obj.strftime("%d.%m")
@@ -869,17 +861,8 @@ async def main():
         if not await is_admin(message.from_user.id):
             return
         
-        # Показываем активные бронирования для отмены
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("""
-                SELECT b.*, u.name, u.phone, u.telegram_id 
-                FROM bookings b 
-                JOIN users u ON b.user_id = u.id 
-                WHERE b.status IN ('pending', 'confirmed')
-                ORDER BY b.date ASC, b.time ASC
-                LIMIT 10
-            """) as cursor:
-                bookings = await cursor.fetchall()
+        # Показываем активные бронирования для отмены (текущие и будущие)
+        bookings = await get_upcoming_bookings(10)
         
         if not bookings:
             await message.answer("❌ Нет активных бронирований для отмены")
@@ -889,7 +872,7 @@ async def main():
         keyboard = []
         
         for booking in bookings:
-            # get_active_bookings возвращает: b.*, u.name, u.phone, u.telegram_id
+            # get_active_bookings возвращает: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id
             # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id
             date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
             display_date = date_obj.strftime("%d.%m")
@@ -923,7 +906,7 @@ async def main():
         keyboard = []
         
         for booking in bookings:
-            # get_active_bookings возвращает: b.*, u.name, u.phone, u.telegram_id
+            # get_active_bookings возвращает: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id
             # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id
             date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
             display_date = date_obj.strftime("%d.%m")
@@ -957,7 +940,7 @@ async def main():
         keyboard = []
         
         for booking in bookings:
-            # get_active_bookings возвращает: b.*, u.name, u.phone, u.telegram_id
+            # get_active_bookings возвращает: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id
             # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id
             date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
             display_date = date_obj.strftime("%d.%m")
@@ -995,7 +978,7 @@ async def main():
         
         if user_input.startswith("@"):  # Поиск по username
             username = user_input[1:].lower()
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with acquire() as db:
                 async with db.execute("SELECT telegram_id FROM users WHERE LOWER(username) = ?", (username,)) as cursor:
                     row = await cursor.fetchone()
                     if row:
@@ -1127,6 +1110,13 @@ async def main():
                     f"❌ Для времени {state['time']} доступно максимум {max_duration_for_time} ч."
                 )
                 return
+            # Те же правила занятости, что и в клиентском боте (с часом зазора вокруг броней)
+            if not await is_time_available(state["date"], state["time"], duration):
+                await message.answer(
+                    "❌ Это время пересекается с другим бронированием (с учетом часа зазора). "
+                    "Введите меньшую длительность или начните заново."
+                )
+                return
             admin_states[message.from_user.id] = {
                 "state": "creating_booking_name",
                 "date": state["date"],
@@ -1172,7 +1162,7 @@ async def main():
         
         try:
             # Создаем бронирование
-            booking_id = await create_booking_by_admin(
+            result = await create_booking_by_admin(
                 date=state["date"],
                 time=state["time"],
                 guests=state["guests"],
@@ -1183,9 +1173,21 @@ async def main():
                 status="confirmed"
             )
             
+            if result.conflict == BOOKING_CONFLICT_HOURS:
+                await message.answer(
+                    f"❌ Бронирование должно быть с {OPEN_HOUR:02d}:00 до {CLOSE_HOUR:02d}:00. "
+                    "Бронирование не создано."
+                )
+                del admin_states[message.from_user.id]
+                return
+            if result.conflict:
+                await message.answer("❌ Это время уже занято (с учетом зазора 1 час). Бронирование не создано.")
+                del admin_states[message.from_user.id]
+                return
+            
             await message.answer(
                 f"✅ Бронирование успешно создано!\n\n"
-                f"🆔 ID: {booking_id}\n"
+                f"🆔 ID: {result.booking_id}\n"
                 f"📅 Дата: {datetime.strptime(state['date'], '%Y-%m-%d').strftime('%d.%m.%Y')}\n"
                 f"🕐 Время: {state['time']}\n"
                 f"👥 Гости: {state['guests']}\n"
@@ -2099,23 +2101,24 @@ async def main():
             )
             return
         
-        # Добавляем расходы в базу данных
-        added_count = 0
-        total_amount = 0
-        failed_lines = []
+        # Добавляем все расходы одной транзакцией
+        try:
+            expense_ids = await add_expenses_bulk([
+                {"date": expense_date, "amount": amount, "description": description}
+                for amount, description in expenses
+            ])
+        except ValueError as e:
+            await message.answer(
+                f"❌ Расходы не добавлены, исправьте ошибки и отправьте список еще раз:\n{e}"
+            )
+            return
+        except Exception as e:
+            await message.answer(f"❌ Ошибка при добавлении расходов: {str(e)}")
+            print(f"Ошибка массового добавления расходов: {e}")
+            return
         
-        for i, (amount, description) in enumerate(expenses, 1):
-            try:
-                expense_id = await add_expense(
-                    expense_date=expense_date,
-                    amount=amount,
-                    category=None,
-                    description=description
-                )
-                added_count += 1
-                total_amount += amount
-            except Exception as e:
-                failed_lines.append(f"Строка {i}: {amount} {description} - ошибка: {str(e)}")
+        added_count = len(expense_ids)
+        total_amount = sum(amount for amount, _ in expenses)
         
         # Формируем отчет
         date_display = datetime.strptime(expense_date, "%Y-%m-%d").strftime("%d.%m.%Y")
@@ -2126,11 +2129,6 @@ async def main():
             f"💰 Общая сумма: {total_amount:,} ₽\n"
         )
         
-        if failed_lines:
-            report += f"\n⚠️ Ошибки при добавлении:\n" + "\n".join(failed_lines[:5])
-            if len(failed_lines) > 5:
-                report += f"\n... и еще {len(failed_lines) - 5} ошибок"
-        
         # Добавляем детали добавленных расходов (первые 10)
         if added_count > 0:
             report += "\n\n📋 Добавленные расходы:\n"
@@ -2430,39 +2428,41 @@ async def main():
         if not await is_admin(message.from_user.id):
             return
         
-        text = "📄 **Выгрузка сводной таблицы бронирований**\n\nВыберите период для экспорта:"
-        keyboard = [
-            [InlineKeyboardButton(text="📅 За все время", callback_data="export_all_time")],
-            [InlineKeyboardButton(text="📆 По месяцам", callback_data="export_by_month")],
-            [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")]
-        ]
-        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-        await message.answer(text, reply_markup=markup)
+        text = "📄 **Выгрузка сводной таблицы бронирований**\n\nВыберите формат:"
+        await message.answer(text, reply_markup=create_export_format_keyboard())
 
-    @dp.callback_query(F.data == "export_all_time")
-    async def handle_export_all_time(callback: types.CallbackQuery):
+    @dp.callback_query(F.data == "export_formats")
+    async def handle_export_formats(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        text = "📄 **Выгрузка сводной таблицы бронирований**\n\nВыберите формат:"
+        await callback.message.edit_text(text, reply_markup=create_export_format_keyboard())
+        await callback.answer()
+
+    @dp.callback_query(F.data.regexp(r"^export_format_(pdf|csv|xlsx)$"))
+    async def handle_export_format(callback: types.CallbackQuery):
         if not await is_admin(callback.from_user.id):
             return
         
-        await callback.message.edit_text("⏳ Генерация PDF таблицы за все время...")
+        export_format = callback.data.split("_")[-1]
+        export_formats[callback.from_user.id] = export_format
+        
+        text = (
+            f"📄 **Выгрузка сводной таблицы бронирований** ({EXPORT_FORMAT_NAMES[export_format]})\n\n"
+            "Выберите период для экспорта:"
+        )
+        await callback.message.edit_text(text, reply_markup=create_export_period_keyboard())
         await callback.answer()
+
+    @dp.callback_query(F.data == "export_all_time")
+    async def handle_export_all_time(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
         
-        try:
-            filepath = await generate_bookings_pdf(period_name="За все время")
-            
-            if filepath:
-                with open(filepath, 'rb') as pdf_file:
-                    await callback.message.answer_document(
-                        document=FSInputFile(filepath, filename=f"bookings_all_time_{datetime.now().strftime('%Y%m%d')}.pdf"),
-                        caption="📄 Сводная таблица бронирований за все время"
-                    )
-                # Удаляем временный файл
-                os.remove(filepath)
-            else:
-                await callback.message.answer("❌ Нет данных для экспорта")
-        except Exception as e:
-            await callback.message.answer(f"❌ Ошибка при генерации PDF: {str(e)}")
-            print(f"Ошибка генерации PDF: {e}")
+        await send_bookings_export(
+            callback, None, None, "за все время", f"all_time_{datetime.now().strftime('%Y%m%d')}"
+        )
 
     @dp.callback_query(F.data == "export_by_month")
     async def handle_export_by_month_menu(callback: types.CallbackQuery):
@@ -2511,43 +2511,19 @@ async def main():
         else:
             end_date = f"{month_obj.year}-{month_obj.month + 1:02d}-01"
         
-        await callback.message.edit_text(f"⏳ Генерация PDF таблицы за {month_name}...")
-        await callback.answer()
-        
-        try:
-            filepath = await generate_bookings_pdf(
-                start_date=start_date,
-                end_date=end_date,
-                period_name=month_name
-            )
-            
-            if filepath:
-                with open(filepath, 'rb') as pdf_file:
-                    await callback.message.answer_document(
-                        document=FSInputFile(filepath, filename=f"bookings_{month_str}.pdf"),
-                        caption=f"📄 Сводная таблица бронирований за {month_name}"
-                    )
-                # Удаляем временный файл
-                os.remove(filepath)
-            else:
-                await callback.message.answer("❌ Нет данных для экспорта")
-        except Exception as e:
-            await callback.message.answer(f"❌ Ошибка при генерации PDF: {str(e)}")
-            print(f"Ошибка генерации PDF: {e}")
+        await send_bookings_export(callback, start_date, end_date, f"за {month_name}", month_str)
 
     @dp.callback_query(F.data == "export_back")
     async def handle_export_back(callback: types.CallbackQuery):
         if not await is_admin(callback.from_user.id):
             return
         
-        text = "📄 **Выгрузка сводной таблицы бронирований**\n\nВыберите период для экспорта:"
-        keyboard = [
-            [InlineKeyboardButton(text="📅 За все время", callback_data="export_all_time")],
-            [InlineKeyboardButton(text="📆 По месяцам", callback_data="export_by_month")],
-            [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")]
-        ]
-        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-        await callback.message.edit_text(text, reply_markup=markup)
+        export_format = export_formats.get(callback.from_user.id, EXPORT_FORMAT_PDF)
+        text = (
+            f"📄 **Выгрузка сводной таблицы бронирований** ({EXPORT_FORMAT_NAMES[export_format]})\n\n"
+            "Выберите период для экспорта:"
+        )
+        await callback.message.edit_text(text, reply_markup=create_export_period_keyboard())
         await callback.answer()
 
     # Обработчики редактирования бронирований
@@ -2566,9 +2542,10 @@ async def main():
             formatted_date = date_obj.strftime("%Y-%m-%d")
             
             # Обновляем дату в базе данных
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with acquire() as db:
                 await db.execute("UPDATE bookings SET date = ? WHERE id = ?", (formatted_date, booking_id))
                 await db.commit()
+            invalidate_availability()
             
             await message.answer(f"✅ Дата бронирования обновлена на {new_date}")
             
@@ -2611,9 +2588,10 @@ async def main():
             formatted_time = time_obj.strftime("%H:%M")
             
             # Обновляем время в базе данных
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with acquire() as db:
                 await db.execute("UPDATE bookings SET time = ? WHERE id = ?", (formatted_time, booking_id))
                 await db.commit()
+            invalidate_availability()
             
             await message.answer(f"✅ Время бронирования обновлено на {new_time}")
             
@@ -2649,7 +2627,7 @@ async def main():
                 return
             
             # Обновляем количество гостей в базе данных
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with acquire() as db:
                 await db.execute("UPDATE bookings SET guests = ? WHERE id = ?", (guests, booking_id))
                 await db.commit()
             
@@ -2725,7 +2703,7 @@ async def main():
                 return
             
             # Обновляем стоимость в базе данных
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with acquire() as db:
                 await db.execute("UPDATE bookings SET total_price = ? WHERE id = ?", (price, booking_id))
                 await db.commit()
             
@@ -2767,7 +2745,7 @@ async def main():
                 return
             
             # Добавляем нового администратора
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with acquire() as db:
                 await db.execute(
                     "INSERT INTO admins (telegram_id, username, name, role, created_at, created_by) VALUES (?, ?, ?, 'admin', ?, ?)",
                     (new_admin_id, "new_admin", f"Администратор {new_admin_id}", datetime.now().isoformat(), message.from_user.id)
@@ -2861,6 +2839,126 @@ async def main():
         markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
         await message.answer(text, reply_markup=markup)
 
+    @dp.message(F.text == "📣 Рассылка")
+    async def handle_broadcast_menu(message: types.Message):
+        if not await is_admin(message.from_user.id):
+            return
+        
+        text, markup = await create_broadcast_menu()
+        await message.answer(text, reply_markup=markup)
+
+    @dp.callback_query(F.data.regexp(r"^broadcast_segment_(all|recent|upcoming)$"))
+    async def handle_broadcast_segment(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        segment = callback.data.split("_")[-1]
+        days = broadcast.RECENT_DAYS_DEFAULT if segment == broadcast.SEGMENT_RECENT else None
+        count = await broadcast.count_recipients(segment, days)
+        if not count:
+            await callback.answer("❌ В этом сегменте нет пользователей с Telegram", show_alert=True)
+            return
+        
+        admin_states[callback.from_user.id] = {
+            "state": "waiting_for_broadcast_text",
+            "segment": segment,
+            "days": days
+        }
+        await callback.message.edit_text(
+            f"📣 {broadcast.SEGMENT_NAMES[segment]}: {count} получателей\n\n"
+            "✏️ Отправьте текст рассылки:"
+        )
+        await callback.answer()
+
+    @dp.message(lambda message: admin_states.get(message.from_user.id, {}).get("state") == "waiting_for_broadcast_text")
+    async def handle_broadcast_text(message: types.Message):
+        if not await is_admin(message.from_user.id):
+            return
+        
+        if not message.text:
+            await message.answer("❌ Отправьте текст сообщения")
+            return
+        
+        state = admin_states[message.from_user.id]
+        state["state"] = "confirming_broadcast"
+        state["text"] = message.text
+        count = await broadcast.count_recipients(state["segment"], state["days"])
+        
+        keyboard = [
+            [InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm")],
+            [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]
+        ]
+        await message.answer(
+            f"📣 Отправить это сообщение {count} получателям?\n\n{message.text}",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        )
+
+    @dp.callback_query(F.data == "broadcast_confirm")
+    async def handle_broadcast_confirm(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        state = admin_states.get(callback.from_user.id, {})
+        if state.get("state") != "confirming_broadcast":
+            await callback.answer("❌ Рассылка уже запущена или отменена")
+            return
+        if not MAIN_BOT_TOKEN:
+            await callback.answer("❌ API_TOKEN основного бота не задан", show_alert=True)
+            return
+        del admin_states[callback.from_user.id]
+        
+        broadcast_id = await broadcast.create_broadcast(
+            state["text"], state["segment"], state["days"], callback.from_user.id
+        )
+        item = await broadcast.get_broadcast(broadcast_id)
+        item["status"] = broadcast.BROADCAST_RUNNING
+        text, markup = format_broadcast_progress(item)
+        await callback.message.edit_text(text, reply_markup=markup)
+        broadcast.start_broadcast(broadcast_id, MAIN_BOT_TOKEN, make_broadcast_progress(callback.message))
+        await callback.answer("📣 Рассылка запущена")
+
+    @dp.callback_query(F.data == "broadcast_cancel")
+    async def handle_broadcast_cancel(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        admin_states.pop(callback.from_user.id, None)
+        await callback.message.edit_text("❌ Рассылка отменена")
+        await callback.answer()
+
+    @dp.callback_query(F.data.regexp(r"^broadcast_pause_\d+$"))
+    async def handle_broadcast_pause(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        broadcast_id = int(callback.data.split("_")[-1])
+        if broadcast.pause_broadcast(broadcast_id):
+            await callback.answer("⏸ Рассылка остановится после текущей пачки")
+        else:
+            await callback.answer("Рассылка сейчас не идет")
+
+    @dp.callback_query(F.data.regexp(r"^broadcast_resume_\d+$"))
+    async def handle_broadcast_resume(callback: types.CallbackQuery):
+        if not await is_admin(callback.from_user.id):
+            return
+        
+        broadcast_id = int(callback.data.split("_")[-1])
+        item = await broadcast.get_broadcast(broadcast_id)
+        if not item or item["status"] == broadcast.BROADCAST_DONE:
+            await callback.answer("Рассылка уже завершена")
+            return
+        if not MAIN_BOT_TOKEN:
+            await callback.answer("❌ API_TOKEN основного бота не задан", show_alert=True)
+            return
+        
+        if broadcast.start_broadcast(broadcast_id, MAIN_BOT_TOKEN, make_broadcast_progress(callback.message)):
+            item["status"] = broadcast.BROADCAST_RUNNING
+            text, markup = format_broadcast_progress(item)
+            await callback.message.edit_text(text, reply_markup=markup)
+            await callback.answer("▶️ Рассылка продолжена")
+        else:
+            await callback.answer("Рассылка уже идет")
+
     @dp.message(F.text == "🔧 Расширенные настройки")
     async def handle_advanced_settings(message: types.Message):
         if not await is_admin(message.from_user.id):
@@ -2912,17 +3010,17 @@ async def main():
             await callback.answer("❌ Ошибка: неверный формат данных")
             return
         
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             async with db.execute("""
                 UPDATE bookings SET status = 'confirmed' WHERE id = ?
             """, (booking_id,)) as cursor:
-                await db.commit()
-                
-                if cursor.rowcount > 0:
-                    # Получаем информацию о бронировании для уведомления пользователя
-                    booking = await get_booking_by_id(booking_id)
-                    if booking:
-                        notification_text = f"""
+                updated = cursor.rowcount > 0
+            
+            if updated:
+                # Получаем информацию о бронировании для уведомления пользователя
+                booking = await get_booking_by_id(booking_id)
+                if booking:
+                    notification_text = f"""
 ✅ **Ваше бронирование подтверждено!**
 
 📅 Дата: {datetime.strptime(booking[2], '%Y-%m-%d').strftime('%d.%m.%Y')}
@@ -2932,16 +3030,21 @@ async def main():
 💰 Стоимость: {booking[6]} ₽
 
 Ждем вас в гости! 🏠
-                        """
-                        # get_booking_by_id возвращает: b.*, u.name, u.phone, u.telegram_id, u.username
-                        # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
-                        telegram_id = booking[12] if len(booking) > 12 else None
-                        if telegram_id:
-                            await notify_user(telegram_id, notification_text)
-                    
-                    await callback.message.edit_text("✅ Бронирование подтверждено!")
-                else:
-                    await callback.message.edit_text("❌ Ошибка при подтверждении бронирования")
+                    """
+                    # get_booking_by_id возвращает: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id, u.username
+                    # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
+                    telegram_id = booking[12] if len(booking) > 12 else None
+                    if telegram_id:
+                        # Уведомление пишется в outbox в одной транзакции с изменением брони
+                        await outbox.enqueue(db, outbox.BOT_MAIN, telegram_id, notification_text)
+            await db.commit()
+            invalidate_availability()
+        
+        if updated:
+            outbox.wake()
+            await callback.message.edit_text("✅ Бронирование подтверждено!")
+        else:
+            await callback.message.edit_text("❌ Ошибка при подтверждении бронирования")
 
     @dp.callback_query(F.data.regexp(r"^cancel_\d+$"))
     async def handle_cancel_booking(callback: types.CallbackQuery):
@@ -2954,33 +3057,38 @@ async def main():
             await callback.answer("❌ Ошибка: неверный формат данных")
             return
         
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             async with db.execute("""
                 UPDATE bookings SET status = 'cancelled' WHERE id = ?
             """, (booking_id,)) as cursor:
-                await db.commit()
-                
-                if cursor.rowcount > 0:
-                    # Получаем информацию о бронировании для уведомления пользователя
-                    booking = await get_booking_by_id(booking_id)
-                    if booking:
-                        notification_text = f"""
+                updated = cursor.rowcount > 0
+            
+            if updated:
+                # Получаем информацию о бронировании для уведомления пользователя
+                booking = await get_booking_by_id(booking_id)
+                if booking:
+                    notification_text = f"""
 ❌ **Ваше бронирование отменено администратором**
 
 📅 Дата: {datetime.strptime(booking[2], '%Y-%m-%d').strftime('%d.%m.%Y')}
 🕐 Время: {booking[3]}
 
 По всем вопросам обращайтесь к администрации.
-                        """
-                        # get_booking_by_id возвращает: b.*, u.name, u.phone, u.telegram_id, u.username
-                        # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
-                        telegram_id = booking[12] if len(booking) > 12 else None
-                        if telegram_id:
-                            await notify_user(telegram_id, notification_text)
-                    
-                    await callback.message.edit_text("❌ Бронирование отменено!")
-                else:
-                    await callback.message.edit_text("❌ Ошибка при отмене бронирования")
+                    """
+                    # get_booking_by_id возвращает: BOOKING_COLUMNS, u.name, u.phone, u.telegram_id, u.username
+                    # Индексы: 0-9 из bookings, 10=name, 11=phone, 12=telegram_id, 13=username
+                    telegram_id = booking[12] if len(booking) > 12 else None
+                    if telegram_id:
+                        # Уведомление пишется в outbox в одной транзакции с изменением брони
+                        await outbox.enqueue(db, outbox.BOT_MAIN, telegram_id, notification_text)
+            await db.commit()
+            invalidate_availability()
+        
+        if updated:
+            outbox.wake()
+            await callback.message.edit_text("❌ Бронирование отменено!")
+        else:
+            await callback.message.edit_text("❌ Ошибка при отмене бронирования")
 
     @dp.callback_query(F.data.regexp(r"^edit_\d+$"))
     async def handle_edit_booking(callback: types.CallbackQuery):
@@ -3130,9 +3238,10 @@ async def main():
         except ValueError:
             return  # На всякий случай, если что-то пошло не так
         
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             async with db.execute("DELETE FROM bookings WHERE id = ?", (booking_id,)) as cursor:
                 await db.commit()
+                invalidate_availability()
                 
                 if cursor.rowcount > 0:
                     await callback.message.edit_text("🗑 Бронирование удалено!")
@@ -3256,7 +3365,7 @@ async def main():
         admin_id = int(callback.data.split("_")[2])
         
         # Удаляем администратора из базы данных
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             await db.execute("DELETE FROM admins WHERE telegram_id = ?", (admin_id,))
             await db.commit()
         
@@ -3288,7 +3397,7 @@ async def main():
             return
         
         # Обновляем роль в базе данных
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             await db.execute("UPDATE admins SET role = ? WHERE telegram_id = ?", (new_role, admin_id))
             await db.commit()
         
@@ -3562,51 +3671,21 @@ async def main():
                 return
             
             # Проблема: file_id из админ-бота нельзя использовать в основном боте
-            # Решение: скачать файл и отправить через основной бот для получения правильного file_id
+            # Решение: загрузить файл через основной бот и взять file_id из его ответа (media_bridge.py)
             if MAIN_BOT_TOKEN:
-                # Создаем временный бот для скачивания файла
-                async with Bot(token=ADMIN_BOT_TOKEN) as admin_bot_temp:
-                    async with Bot(token=MAIN_BOT_TOKEN) as main_bot_temp:
-                        try:
-                            # Скачиваем файл через админ-бота
-                            file = await admin_bot_temp.get_file(file_id)
-                            
-                            # Скачиваем файл в память
-                            from io import BytesIO
-                            
-                            async with aiohttp.ClientSession() as session:
-                                url = f"https://api.telegram.org/file/bot{ADMIN_BOT_TOKEN}/{file.file_path}"
-                                async with session.get(url) as resp:
-                                    file_data = await resp.read()
-                            
-                            # Отправляем файл через основной бот для получения правильного file_id
-                            
-                            # Создаем временный файл в памяти
-                            photo_file = BytesIO(file_data)
-                            photo_file.name = "photo.jpg"
-                            
-                            # Отправляем через основной бот (себе)
-                            sent_message = await main_bot_temp.send_photo(
-                                chat_id=ADMIN_USER_ID,
-                                photo=FSInputFile(photo_file, filename="photo.jpg"),
-                                caption="Временное сообщение для получения file_id"
-                            )
-                            
-                            # Получаем правильный file_id из отправленного сообщения
-                            new_file_id = sent_message.photo[-1].file_id
-                            
-                            # Сохраняем правильный file_id
-                            await set_media_setting(section, new_file_id, "photo")
-                            
-                            # Удаляем временное сообщение
-                            await main_bot_temp.delete_message(chat_id=ADMIN_USER_ID, message_id=sent_message.message_id)
-                            
-                            await message.answer(f"✅ Фото успешно добавлено в раздел '{section_name}'!")
-                        except Exception as e:
-                            print(f"Ошибка при конвертации file_id: {e}")
-                            # Если не получилось, просто сохраняем оригинальный file_id
-                            await set_media_setting(section, file_id, "photo")
-                            await message.answer(f"⚠️ Фото сохранено, но может не отображаться в основном боте\n📷 File ID: {file_id[:50]}...")
+                try:
+                    # Файл идет из админ-бота в основной потоком; повторная загрузка берется из кэша
+                    new_file_id = await media_bridge.transfer_media(
+                        file_id, photo.file_unique_id, media_bridge.MEDIA_PHOTO,
+                        ADMIN_BOT_TOKEN, MAIN_BOT_TOKEN, ADMIN_USER_ID
+                    )
+                    await set_media_setting(section, new_file_id, "photo")
+                    await message.answer(f"✅ Фото успешно добавлено в раздел '{section_name}'!")
+                except Exception as e:
+                    print(f"Ошибка при конвертации file_id: {e}")
+                    # Если не получилось, просто сохраняем оригинальный file_id
+                    await set_media_setting(section, file_id, "photo")
+                    await message.answer(f"⚠️ Фото сохранено, но может не отображаться в основном боте\n📷 File ID: {file_id[:50]}...")
             else:
                 # Если токен основного бота не задан, просто сохраняем
                 await set_media_setting(section, file_id, "photo")
@@ -3650,51 +3729,21 @@ async def main():
                 return
             
             # Проблема: file_id из админ-бота нельзя использовать в основном боте
-            # Решение: скачать файл и отправить через основной бот для получения правильного file_id
+            # Решение: загрузить файл через основной бот и взять file_id из его ответа (media_bridge.py)
             if MAIN_BOT_TOKEN:
-                # Создаем временный бот для скачивания файла
-                async with Bot(token=ADMIN_BOT_TOKEN) as admin_bot_temp:
-                    async with Bot(token=MAIN_BOT_TOKEN) as main_bot_temp:
-                        try:
-                            # Скачиваем файл через админ-бота
-                            file = await admin_bot_temp.get_file(file_id)
-                            
-                            # Скачиваем файл в память
-                            from io import BytesIO
-                            
-                            async with aiohttp.ClientSession() as session:
-                                url = f"https://api.telegram.org/file/bot{ADMIN_BOT_TOKEN}/{file.file_path}"
-                                async with session.get(url) as resp:
-                                    file_data = await resp.read()
-                            
-                            # Отправляем файл через основной бот для получения правильного file_id
-                            
-                            # Создаем временный файл в памяти
-                            video_file = BytesIO(file_data)
-                            video_file.name = "video.mp4"
-                            
-                            # Отправляем через основной бот (себе)
-                            sent_message = await main_bot_temp.send_video(
-                                chat_id=ADMIN_USER_ID,
-                                video=FSInputFile(video_file, filename="video.mp4"),
-                                caption="Временное сообщение для получения file_id"
-                            )
-                            
-                            # Получаем правильный file_id из отправленного сообщения
-                            new_file_id = sent_message.video.file_id
-                            
-                            # Сохраняем правильный file_id
-                            await set_media_setting(section, new_file_id, "video")
-                            
-                            # Удаляем временное сообщение
-                            await main_bot_temp.delete_message(chat_id=ADMIN_USER_ID, message_id=sent_message.message_id)
-                            
-                            await message.answer(f"✅ Видео успешно добавлено в раздел '{section_name}'!")
-                        except Exception as e:
-                            print(f"Ошибка при конвертации file_id видео: {e}")
-                            # Если не получилось, просто сохраняем оригинальный file_id
-                            await set_media_setting(section, file_id, "video")
-                            await message.answer(f"⚠️ Видео сохранено, но может не отображаться в основном боте\n🎥 File ID: {file_id[:50]}...")
+                try:
+                    # Файл идет из админ-бота в основной потоком; повторная загрузка берется из кэша
+                    new_file_id = await media_bridge.transfer_media(
+                        file_id, message.video.file_unique_id, media_bridge.MEDIA_VIDEO,
+                        ADMIN_BOT_TOKEN, MAIN_BOT_TOKEN, ADMIN_USER_ID
+                    )
+                    await set_media_setting(section, new_file_id, "video")
+                    await message.answer(f"✅ Видео успешно добавлено в раздел '{section_name}'!")
+                except Exception as e:
+                    print(f"Ошибка при конвертации file_id видео: {e}")
+                    # Если не получилось, просто сохраняем оригинальный file_id
+                    await set_media_setting(section, file_id, "video")
+                    await message.answer(f"⚠️ Видео сохранено, но может не отображаться в основном боте\n🎥 File ID: {file_id[:50]}...")
             else:
                 # Если токен основного бота не задан, просто сохраняем
                 await set_media_setting(section, file_id, "video")
@@ -0,0 +1,168 @@
+"""
+Аналитика загрузки антикафе: тепловая карта «день недели × час».
+
+Брони загружаются из базы одним запросом в массивы NumPy (день недели,
+час начала, длительность, гости, стоимость), дальше все расчеты -
+векторные: каждая бронь разворачивается в занятые ею часы через
+np.repeat, а суммы по ячейкам считает np.bincount. Поэтому отчет
+строится быстро и на сотнях тысяч броней.
+
+NumPy - необязательная зависимость: без нее отчет недоступен,
+остальные функции ботов работают как обычно.
+"""
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from db_pool import acquire
+
+DAYS_PER_WEEK = 7
+HOURS_PER_DAY = 24
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+# Градации заполненности для текстовой тепловой карты
+HEAT_LEVELS = "·░▒▓█"
+
+
+def is_available() -> bool:
+    """Установлен ли NumPy"""
+    return np is not None
+
+
+async def load_booking_arrays(start_date: str, end_date: str) -> Dict:
+    """Брони за период [start_date, end_date] в виде массивов NumPy
+
+    День недели считается от понедельника (0) до воскресенья (6).
+    """
+    async with acquire() as db:
+        async with db.execute("""
+            SELECT
+                CAST(strftime('%w', date) AS INTEGER),
+                CAST(substr(time, 1, 2) AS INTEGER),
+                duration, guests, total_price
+            FROM bookings
+            WHERE date BETWEEN ? AND ? AND status != 'cancelled'
+        """, (start_date, end_date)) as cursor:
+            rows = await cursor.fetchall()
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return {
+        # strftime('%w'): воскресенье = 0, переводим в понедельник = 0
+        "weekday": (data[:, 0].astype(np.int64) + 6) % DAYS_PER_WEEK,
+        "start_hour": data[:, 1].astype(np.int64),
+        "duration": data[:, 2].astype(np.int64),
+        "guests": data[:, 3],
+        "price": data[:, 4],
+    }
+
+
+def weekday_counts(start_date: str, end_date: str):
+    """Сколько раз каждый день недели встречается в периоде"""
+    days = np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1)
+    # 1970-01-01 - четверг (3, если понедельник = 0)
+    return np.bincount((days.astype(np.int64) + 3) % DAYS_PER_WEEK, minlength=DAYS_PER_WEEK)
+
+
+def compute_heatmap(arrays: Dict, day_counts) -> Dict:
+    """Загрузка, средний размер компании и выручка по ячейкам 7×24
+
+    Бронь, переходящая через полночь, занимает часы следующего дня недели.
+    """
+    duration = np.maximum(arrays["duration"], 0)
+    total_hours = int(duration.sum())
+    slots = DAYS_PER_WEEK * HOURS_PER_DAY
+
+    # Индекс брони для каждого занятого часа и смещение часа внутри брони
+    booking_index = np.repeat(np.arange(len(duration)), duration)
+    first_hour = np.repeat(np.cumsum(duration) - duration, duration)
+    offset = np.arange(total_hours) - first_hour
+
+    week_hour = (
+        arrays["weekday"][booking_index] * HOURS_PER_DAY
+        + arrays["start_hour"][booking_index]
+        + offset
+    ) % slots
+
+    booked = np.bincount(week_hour, minlength=slots).astype(np.float64)
+    guests = np.bincount(week_hour, weights=arrays["guests"][booking_index], minlength=slots)
+    hourly_price = np.divide(
+        arrays["price"], duration, out=np.zeros(len(duration)), where=duration > 0
+    )
+    revenue = np.bincount(week_hour, weights=hourly_price[booking_index], minlength=slots)
+
+    booked = booked.reshape(DAYS_PER_WEEK, HOURS_PER_DAY)
+    guests = guests.reshape(DAYS_PER_WEEK, HOURS_PER_DAY)
+    revenue = revenue.reshape(DAYS_PER_WEEK, HOURS_PER_DAY)
+
+    # Доля дней, когда час был занят (одновременно может идти только одна бронь)
+    utilisation = np.divide(
+        booked, day_counts[:, None], out=np.zeros_like(booked), where=day_counts[:, None] > 0
+    )
+    avg_guests = np.divide(guests, booked, out=np.zeros_like(guests), where=booked > 0)
+    revenue_per_hour = np.divide(revenue, booked, out=np.zeros_like(revenue), where=booked > 0)
+
+    return {
+        "bookings": len(duration),
+        "booked_hours": total_hours,
+        "utilisation": utilisation,
+        "avg_guests": avg_guests,
+        "revenue_per_hour": revenue_per_hour,
+        "total_revenue": float(arrays["price"].sum()),
+    }
+
+
+async def get_occupancy_heatmap(days: int = 90, end_date: Optional[str] = None) -> Dict:
+    """Тепловая карта загрузки за последние days дней"""
+    end = date.fromisoformat(end_date) if end_date else date.today()
+    start = end - timedelta(days=days - 1)
+    arrays = await load_booking_arrays(start.isoformat(), end.isoformat())
+    heatmap = compute_heatmap(arrays, weekday_counts(start.isoformat(), end.isoformat()))
+    heatmap["start_date"] = start.isoformat()
+    heatmap["end_date"] = end.isoformat()
+    return heatmap
+
+
+def format_heatmap_report(heatmap: Dict, first_hour: int, last_hour: int) -> str:
+    """Текстовый отчет для админ-бота по часам [first_hour, last_hour)"""
+    hours = slice(first_hour, last_hour)
+    utilisation = heatmap["utilisation"][:, hours]
+    levels = np.minimum((utilisation * (len(HEAT_LEVELS) - 1)).round().astype(int), len(HEAT_LEVELS) - 1)
+
+    start = date.fromisoformat(heatmap["start_date"]).strftime("%d.%m.%Y")
+    end = date.fromisoformat(heatmap["end_date"]).strftime("%d.%m.%Y")
+    lines = [
+        f"🔥 Загрузка по дням недели и часам ({start} - {end})",
+        "",
+        "```",
+        "    " + "".join(f"{hour:02d} " for hour in range(first_hour, last_hour)),
+    ]
+    for weekday, row in enumerate(levels):
+        lines.append(f"{WEEKDAY_NAMES[weekday]}  " + "".join(f"{HEAT_LEVELS[level]}  " for level in row))
+    lines.append("```")
+    lines.append(f"Шкала: {' '.join(HEAT_LEVELS)} (0% → 100% дней занято)")
+
+    booked_hours = heatmap["booked_hours"]
+    lines.append("")
+    lines.append(f"• Бронирований: {heatmap['bookings']}, занятых часов: {booked_hours}")
+    if booked_hours:
+        lines.append(f"• Выручка за занятый час: {heatmap['total_revenue'] / booked_hours:,.0f} ₽")
+
+    # Самые загруженные ячейки
+    flat = utilisation.ravel()
+    top = [index for index in np.argsort(flat)[::-1][:5] if flat[index] > 0]
+    if top:
+        lines.append("")
+        lines.append("🏆 Самые загруженные часы:")
+        width = last_hour - first_hour
+        for index in top:
+            weekday, hour = divmod(int(index), width)
+            hour += first_hour
+            lines.append(
+                f"• {WEEKDAY_NAMES[weekday]} {hour:02d}:00 - {flat[index]:.0%}, "
+                f"в среднем {heatmap['avg_guests'][weekday, hour]:.1f} гостей, "
+                f"{heatmap['revenue_per_hour'][weekday, hour]:,.0f} ₽/ч"
+            )
+    return "\n".join(lines)
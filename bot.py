@@ -1,15 +1,19 @@
 import os
 import asyncio
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
-import aiosqlite
-import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 from datetime import datetime, date, timedelta
+from typing import Dict, Optional
 import json
-import aiohttp
+import http_client
+import outbox
 from calendar import monthrange
-from db import DB_PATH, get_available_times as db_get_available_times, get_setting, get_media_setting, calculate_booking_price, get_price_per_hour, get_price_per_extra_guest, get_max_guests_included, get_all_admin_ids, OPEN_HOUR, CLOSE_HOUR, MAX_BOOKING_DURATION, get_price_rule_for_booking
+from db_pool import acquire
+from occupancy import hour_of
+from db import init_db, get_available_times as db_get_available_times, get_setting, get_media_setting, get_settings_version, DEFAULT_TEXTS, quote_many, OPEN_HOUR, CLOSE_HOUR, MAX_BOOKING_DURATION, get_availability_range, invalidate_availability, book_slot
 
 # Загрузка .env (если установлен python-dotenv)
 try:
@@ -29,69 +33,8 @@ user_states = {}
 # URL вашего веб-приложения (замените на реальный URL)
 WEBAPP_URL = "https://628164fc148f.ngrok-free.app/"
 
-def get_db():
-    """Синхронное подключение к базе данных"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-async def init_db():
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                phone TEXT,
-                telegram_id INTEGER UNIQUE,
-                username TEXT,
-                created_at TEXT
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                date TEXT,
-                time TEXT,
-                guests INTEGER,
-                duration INTEGER,
-                total_price REAL,
-                status TEXT CHECK(status IN ('pending', 'confirmed', 'cancelled')) DEFAULT 'pending',
-                created_at TEXT,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS time_slots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                time TEXT UNIQUE,
-                is_available BOOLEAN DEFAULT 1
-            )
-        ''')
-        await db.commit()
-        
-        # Миграция: обновляем NULL значения в поле name
-        try:
-            await db.execute("UPDATE users SET name = 'Пользователь' WHERE name IS NULL")
-            await db.commit()
-        except Exception as e:
-            print(f"Migration error: {e}")
-        
-        # Добавляем временные слоты если их нет
-        async with db.execute("SELECT COUNT(*) FROM time_slots") as cursor:
-            count = (await cursor.fetchone())[0]
-            if count == 0:
-                # Слоты с 00:00 до 23:00 включительно
-                time_slots = []
-                for hour in range(0, 24):
-                    time_slots.append(f"{hour:02d}:00")
-                for time_slot in time_slots:
-                    await db.execute("INSERT INTO time_slots (time) VALUES (?)", (time_slot,))
-                await db.commit()
-
 async def get_or_create_user(telegram_id: int, username: str = None, name: str = None):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)) as cursor:
             user = await cursor.fetchone()
             if not user:
@@ -145,23 +88,22 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
         user_name = message.from_user.full_name
         
         # Создаем или получаем пользователя (без обновления имени и телефона)
-        conn = get_db()
-        cur = conn.cursor()
-        
-        # Ищем пользователя по Telegram ID
-        cur.execute("SELECT id, name, phone FROM users WHERE telegram_id = ?", (telegram_id,))
-        user = cur.fetchone()
-        
-        if user:
-            db_user_id, db_name, db_phone = user
-            user_id = db_user_id
-        else:
-            # Создаем нового пользователя с Telegram именем
-            cur.execute(
-                "INSERT INTO users (name, phone, telegram_id, created_at) VALUES (?, ?, ?, ?)",
-                (user_name, "Не указан", telegram_id, datetime.now().isoformat())
-            )
-            user_id = cur.lastrowid
+        async with acquire() as db:
+            # Ищем пользователя по Telegram ID
+            async with db.execute("SELECT id, username FROM users WHERE telegram_id = ?", (telegram_id,)) as cursor:
+                user = await cursor.fetchone()
+            
+            if user:
+                user_id, booking_username = user
+            else:
+                # Создаем нового пользователя с Telegram именем
+                cursor = await db.execute(
+                    "INSERT INTO users (name, phone, telegram_id, created_at) VALUES (?, ?, ?, ?)",
+                    (user_name, "Не указан", telegram_id, datetime.now().isoformat())
+                )
+                user_id = cursor.lastrowid
+                booking_username = None
+                await db.commit()
         
         # Для notes ВСЕГДА используем данные, которые ввел пользователь (booking_name, booking_phone)
         # Эти данные передаются из handle_phone_input и содержат имя и телефон, которые пользователь ВВЕЛ
@@ -171,84 +113,23 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
         display_phone = booking_phone if booking_phone else "Не указан"
         
         # Расчет стоимости с использованием настроек цен
-        total_price = await calculate_booking_price(guests, duration, date, time)
-        
-        # Проверяем доступность времени
-        cur.execute("""
-            SELECT time, duration FROM bookings 
-            WHERE date = ? AND status != 'cancelled'
-        """, (date,))
-        existing_bookings = cur.fetchall()
+        price_quote = (await quote_many([(date, time, guests, duration)]))[0]
+        total_price = price_quote['total_price']
         
-        # Проверяем бронирования с предыдущего дня, которые могут продолжаться на текущий день
-        prev_date = (datetime.strptime(date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
-        cur.execute("""
-            SELECT time, duration FROM bookings 
-            WHERE date = ? AND status != 'cancelled'
-        """, (prev_date,))
-        prev_day_bookings = cur.fetchall()
-        
-        # Проверяем пересечения с учетом буфера ДО и ПОСЛЕ (1 час)
-        booking_start = datetime.strptime(time, '%H:%M')
-        booking_end = booking_start + timedelta(hours=duration)
-
-        if booking_start.hour < OPEN_HOUR or booking_start.hour >= CLOSE_HOUR:
+        # Проверяем рабочее время
+        start_hour = hour_of(time)
+        if start_hour < OPEN_HOUR or start_hour >= CLOSE_HOUR:
             await message.answer("❌ Забронировать можно только с 10:00 до 22:00. Выберите другое время.")
-            conn.close()
             return
 
-        closing_datetime = booking_start.replace(hour=CLOSE_HOUR, minute=0)
-        if booking_end > closing_datetime:
-            max_hours = CLOSE_HOUR - booking_start.hour
+        if start_hour + duration > CLOSE_HOUR:
+            max_hours = CLOSE_HOUR - start_hour
             await message.answer(
                 f"❌ Бронирование должно завершаться до {CLOSE_HOUR:02d}:00. "
                 f"Для этого времени доступно максимум {max_hours} ч."
             )
-            conn.close()
             return
         
-        # Проверяем пересечения с бронированиями текущего дня
-        for existing_time, existing_duration in existing_bookings:
-            exist_start = datetime.strptime(existing_time, '%H:%M')
-            exist_end = exist_start + timedelta(hours=existing_duration)
-            
-            # Проверяем пересечение с учетом зазора ДО (1 час) и ПОСЛЕ (1 час)
-            buffer_start = exist_start - timedelta(hours=1)  # Зазор ДО начала брони
-            buffer_end = exist_end + timedelta(hours=1)      # Зазор ПОСЛЕ окончания брони
-            
-            # Проверяем пересечение: новая бронь не должна начинаться в зоне зазора или самой брони
-            if booking_start < buffer_end and booking_end > buffer_start:
-                reason = "В это время уже есть другое бронирование!"
-                await message.answer(f"❌ {reason} Пожалуйста, выберите другое время.")
-                conn.close()
-                return
-        
-        # Проверяем пересечения с бронированиями предыдущего дня
-        for existing_time, existing_duration in prev_day_bookings:
-            exist_start = datetime.strptime(existing_time, '%H:%M')
-            exist_start_hour = exist_start.hour
-            
-            # Проверяем, переходит ли бронирование через полночь
-            # Если start_hour + duration >= 24, то бронирование продолжается на следующий день
-            if exist_start_hour + existing_duration >= 24:
-                # Рассчитываем, до какого часа на следующий день продолжается бронирование
-                hours_into_next_day = (exist_start_hour + existing_duration) % 24
-                
-                # Время окончания бронирования на следующий день
-                next_day_end = datetime.strptime(f"{hours_into_next_day:02d}:00", '%H:%M')
-                
-                # Зазор ПОСЛЕ окончания бронирования (1 час)
-                buffer_end = next_day_end + timedelta(hours=1)
-                
-                # Проверяем пересечение: новая бронь не должна начинаться в зоне брони или зазора
-                if booking_start < buffer_end and booking_end > datetime.strptime("00:00", '%H:%M'):
-                    reason = "В это время помещение занято бронированием с предыдущего дня!"
-                    await message.answer(f"❌ {reason} Пожалуйста, выберите другое время.")
-                    conn.close()
-                    return
-        
-
-        
         # ВСЕГДА формируем notes для бронирования с именем и телефоном, которые ввел пользователь
         # booking_name и booking_phone - это данные, которые пользователь ВВЕЛ для ЭТОГО бронирования
         # Каждое бронирование имеет свои уникальные данные в notes
@@ -262,51 +143,6 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
         notes = " | ".join(notes_parts)
         print(f"[DEBUG create_booking] Сохраняем notes: '{notes}' (booking_name={booking_name}, booking_phone={booking_phone})")
         
-        # Создаем бронирование (ВСЕГДА сохраняем имя и телефон в notes для уникальности каждого бронирования)
-        cur.execute(
-            "INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status, notes, created_at) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)",
-            (user_id, date, time, guests, duration, total_price, notes, datetime.now().isoformat())
-        )
-        conn.commit()
-        booking_id = cur.lastrowid
-        conn.close()
-        
-        # Формируем информацию о стоимости
-        # Получаем актуальные цены из правила или стандартных настроек
-        rule = await get_price_rule_for_booking(date, time)
-        if rule:
-            price_per_hour = rule['price_per_hour']
-            price_per_extra = rule['price_per_extra_guest']
-            max_included = rule['max_guests_included']
-            payment_type = rule['extra_guest_payment_type']
-        else:
-            price_per_hour = await get_price_per_hour()
-            price_per_extra = await get_price_per_extra_guest()
-            max_included = await get_max_guests_included()
-            payment_type = 'per_booking'
-        
-        price_info = f"💰 Стоимость: {total_price}₽"
-        if guests > max_included:
-            extra_guests = guests - max_included
-            if payment_type == 'per_hour':
-                price_info += f"\n   ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽/час за {extra_guests} гостей сверх {max_included})"
-            else:
-                price_info += f"\n   ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽ за {extra_guests} гостей сверх {max_included})"
-        else:
-            price_info += f"\n   ({price_per_hour}₽/час)"
-        
-        # Уведомляем пользователя о создании бронирования (ожидает подтверждения)
-        await message.answer(
-            f"⏳ Бронирование создано и ожидает подтверждения!\n\n"
-            f"📅 Дата: {date}\n"
-            f"🕐 Время: {time}\n"
-            f"👥 Гости: {guests}\n"
-            f"⏱ Длительность: {duration} ч.\n"
-            f"{price_info}\n\n"
-            f"🆔 ID брони: {booking_id}\n\n"
-            f"📞 Мы свяжемся с вами для подтверждения бронирования!"
-        )
-        
         # Получаем username пользователя
         username = message.from_user.username
         # Для уведомления админу ВСЕГДА используем имя и телефон, которые ввел пользователь
@@ -314,12 +150,6 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
         admin_display_name = booking_name if booking_name else display_name
         admin_display_phone = booking_phone if booking_phone else display_phone
         
-        # Получаем username из БД
-        cur = get_db().cursor()
-        cur.execute("SELECT username FROM users WHERE telegram_id = ?", (telegram_id,))
-        user_row = cur.fetchone()
-        booking_username = user_row[0] if user_row and user_row[0] else None
-        
         # Формируем тег
         if booking_username and booking_username != "None":
             tg_tag = f"@{booking_username}"
@@ -336,15 +166,7 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
         else:
             end_time = end_time_obj.strftime('%H:%M')
         # Формируем информацию о стоимости для админа (используем те же значения, что и для пользователя)
-        admin_price_info = f"💰 Стоимость: {total_price}₽"
-        if guests > max_included:
-            extra_guests = guests - max_included
-            if payment_type == 'per_hour':
-                admin_price_info += f" ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽/час за {extra_guests} гостей сверх {max_included})"
-            else:
-                admin_price_info += f" ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽ за {extra_guests} гостей сверх {max_included})"
-        else:
-            admin_price_info += f" ({price_per_hour}₽/час)"
+        admin_price_info = f"💰 Стоимость: {total_price}₽ {format_price_breakdown(price_quote, guests)}"
         
         # Уведомляем админа (используем имя и телефон, которые ввел пользователь для ЭТОГО бронирования)
         notification_text = f"🆕 Новая заявка из бота!\n"
@@ -358,8 +180,42 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
         notification_text += f"👥 Гости: {guests}\n"
         notification_text += f"⏱ Длительность: {duration} ч.\n"
         notification_text += f"{admin_price_info}\n"
-        notification_text += f"🆔 ID брони: {booking_id}"
-        await notify_admin(notification_text)
+        
+        async def enqueue_admin_notification(db, booking_id):
+            # Уведомление пишется в outbox в одной транзакции с бронью
+            await outbox.enqueue_admins(
+                db, notification_text + f"🆔 ID брони: {booking_id}",
+                event=outbox.EVENT_NEW,
+                summary=outbox.format_booking_line(booking_id, date, time, guests, duration, admin_display_name),
+                starts_at=f"{date} {time}"
+            )
+        
+        # Создаем бронирование (ВСЕГДА сохраняем имя и телефон в notes для уникальности каждого бронирования)
+        # Проверка пересечений и вставка выполняются атомарно
+        result = await book_slot(
+            user_id, date, time, guests, duration, total_price, "pending", notes,
+            on_created=enqueue_admin_notification
+        )
+        if result.conflict:
+            await message.answer("❌ В это время уже есть другое бронирование! Пожалуйста, выберите другое время.")
+            return
+        booking_id = result.booking_id
+        outbox.wake()
+        
+        # Формируем информацию о стоимости
+        price_info = f"💰 Стоимость: {total_price}₽\n   {format_price_breakdown(price_quote, guests)}"
+        
+        # Уведомляем пользователя о создании бронирования (ожидает подтверждения)
+        await message.answer(
+            f"⏳ Бронирование создано и ожидает подтверждения!\n\n"
+            f"📅 Дата: {date}\n"
+            f"🕐 Время: {time}\n"
+            f"👥 Гости: {guests}\n"
+            f"⏱ Длительность: {duration} ч.\n"
+            f"{price_info}\n\n"
+            f"🆔 ID брони: {booking_id}\n\n"
+            f"📞 Мы свяжемся с вами для подтверждения бронирования!"
+        )
         
     except Exception as e:
         await message.answer(f"❌ Ошибка при создании бронирования: {str(e)}")
@@ -367,7 +223,7 @@ async def create_booking(message: types.Message, date: str, time: str, guests: i
 
 async def get_user_bookings(user_id: int):
     """Получить бронирования пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
             SELECT * FROM bookings 
             WHERE user_id = ? AND status != 'cancelled'
@@ -388,6 +244,78 @@ def create_main_menu():
     )
     return keyboard
 
+# Готовые ответы на /start, «Информация» и «Помощь»: раздел -> ответ.
+# Строятся из настроек один раз и сбрасываются, когда меняется версия
+# настроек (админ поменял текст или медиа), поэтому частые команды
+# не ходят в базу.
+CAPTION_MAX_LENGTH = 1024  # Ограничение Telegram на подпись к медиа
+_rendered_responses: Dict[str, "RenderedResponse"] = {}
+_rendered_version: Optional[int] = None
+# Пользователи, уже записанные в базу этим процессом (для /start):
+# последние KNOWN_USERS_MAX по времени обращения, остальные снова проверяются в базе
+KNOWN_USERS_MAX = 10000
+_known_users: "OrderedDict[int, None]" = OrderedDict()
+
+@dataclass(frozen=True)
+class RenderedResponse:
+    """Готовый ответ раздела"""
+    text: str
+    caption: str
+    media_kind: Optional[str] = None  # "video" / "photo" / None
+    file_id: Optional[str] = None
+    keyboard: Optional[ReplyKeyboardMarkup] = None
+
+    def personalize(self, first_name: str):
+        """Текст и подпись с подставленным {first_name}"""
+        if "{first_name}" not in self.text:
+            return self.text, self.caption
+        text = self.text.replace("{first_name}", first_name or "Пользователь")
+        return text, text[:CAPTION_MAX_LENGTH]
+
+async def _render_section(section: str) -> RenderedResponse:
+    """Собрать ответ раздела из настроек"""
+    key = f"{section}_text"
+    text = (await get_setting(key, DEFAULT_TEXTS[key])).strip()
+    # Приоритет: видео > фото
+    media_kind, file_id = None, None
+    for kind in ("video", "photo"):
+        media_id = (await get_media_setting(section, kind)).strip()
+        if media_id:
+            media_kind, file_id = kind, media_id
+            break
+    keyboard = create_main_menu() if section == "welcome" else None
+    return RenderedResponse(text, text[:CAPTION_MAX_LENGTH], media_kind, file_id, keyboard)
+
+async def get_rendered_response(section: str) -> RenderedResponse:
+    """Готовый ответ раздела (welcome / info / help)"""
+    global _rendered_version
+    version = await get_settings_version()
+    if version != _rendered_version:
+        _rendered_responses.clear()
+        _rendered_version = version
+    response = _rendered_responses.get(section)
+    if response is None:
+        response = await _render_section(section)
+        _rendered_responses[section] = response
+    return response
+
+async def send_rendered_response(message: types.Message, section: str):
+    """Отправить готовый ответ раздела: медиа с подписью или только текст"""
+    response = await get_rendered_response(section)
+    text, caption = response.personalize(message.from_user.first_name)
+    if response.media_kind:
+        try:
+            if response.media_kind == "video":
+                await message.answer_video(video=response.file_id, caption=caption, reply_markup=response.keyboard)
+            else:
+                await message.answer_photo(photo=response.file_id, caption=caption, reply_markup=response.keyboard)
+            return
+        except Exception as e:
+            print(f"Ошибка при отправке медиа раздела {section}: {e}")
+            # Нерабочий file_id не пробуем снова до следующего изменения настроек
+            _rendered_responses[section] = replace(response, media_kind=None, file_id=None)
+    await message.answer(text, reply_markup=response.keyboard)
+
 def create_webapp_keyboard():
     """Создать клавиатуру с кнопкой веб-приложения"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -438,10 +366,20 @@ async def create_calendar_keyboard(year: int, month: int):
     for _ in range(first_weekday):
         week.append(InlineKeyboardButton(text=" ", callback_data="noop"))
     today_d = date.today()
+    # Свободные слоты на все дни месяца - одним запросом
+    free_by_date = await get_availability_range(
+        date(year, month, 1).isoformat(), date(year, month, days_in_month).isoformat()
+    )
     for d in range(1, days_in_month + 1):
         cur = date(year, month, d)
-        label = f"{d:02d}"
-        cb = f"date_{cur.strftime('%Y-%m-%d')}" if cur >= today_d else "noop"
+        free_count = free_by_date.get(cur.isoformat(), 0)
+        if cur < today_d:
+            label, cb = f"{d:02d}", "noop"
+        elif free_count == 0:
+            # Свободного времени нет - день не выбирается
+            label, cb = "✖️", "day_full"
+        else:
+            label, cb = f"{d}·{free_count}", f"date_{cur.strftime('%Y-%m-%d')}"
         week.append(InlineKeyboardButton(text=label, callback_data=cb))
         if len(week) == 7:
             rows.append(week)
@@ -457,16 +395,24 @@ async def create_date_keyboard():
     """Создать клавиатуру с датами"""
     keyboard = []
     dates = await get_available_dates()
+    free_by_date = await get_availability_range(dates[0], dates[-1])
     
     for i, date_str in enumerate(dates):
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         display_date = date_obj.strftime("%d.%m")
         day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date_obj.weekday()]
+        free_count = free_by_date.get(date_str, 0)
         
-        keyboard.append([InlineKeyboardButton(
-            text=f"{display_date} ({day_name})", 
-            callback_data=f"date_{date_str}"
-        )])
+        if free_count == 0:
+            keyboard.append([InlineKeyboardButton(
+                text=f"✖️ {display_date} ({day_name}) — мест нет",
+                callback_data="day_full"
+            )])
+        else:
+            keyboard.append([InlineKeyboardButton(
+                text=f"{display_date} ({day_name}) · свободных слотов: {free_count}",
+                callback_data=f"date_{date_str}"
+            )])
     # Календарь для выбора других дат
     keyboard.append([InlineKeyboardButton(text="📅 Другая дата", callback_data="choose_other_date")])
     keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
@@ -512,35 +458,17 @@ def create_cancel_booking_keyboard(bookings):
     keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-async def notify_admin(text):
-    """Отправить уведомление всем администраторам"""
-    if not ADMIN_BOT_TOKEN:
-        print("⚠️ ADMIN_BOT_TOKEN не задан. Отправка уведомления администраторам отключена.")
-        return
-    
-    # Получаем список всех администраторов
-    admin_ids = await get_all_admin_ids()
-    
-    if not admin_ids:
-        # Если нет админов в БД, используем ADMIN_USER_ID из переменной окружения (для обратной совместимости)
-        if ADMIN_USER_ID:
-            admin_ids = [ADMIN_USER_ID]
-        else:
-            print("⚠️ Нет администраторов для отправки уведомлений.")
-            return
-    
-    url = f"https://api.telegram.org/bot{ADMIN_BOT_TOKEN}/sendMessage"
-    
-    # Отправляем уведомление всем администраторам
-    for admin_id in admin_ids:
-        payload = {"chat_id": admin_id, "text": text}
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=5) as resp:
-                    if resp.status != 200:
-                        print(f"[admin notify error] Status: {resp.status} for admin {admin_id}, Response: {await resp.text()}")
-        except Exception as e:
-            print(f"[admin notify error] for admin {admin_id}: {e}")
+def format_price_breakdown(price_quote: dict, guests: int) -> str:
+    """Расшифровка стоимости: цена за час и доплата за гостей сверх включенных"""
+    price_per_hour = price_quote['price_per_hour']
+    price_per_extra = price_quote['price_per_extra_guest']
+    max_included = price_quote['max_guests_included']
+    if guests > max_included:
+        extra_guests = guests - max_included
+        if price_quote['extra_guest_payment_type'] == 'per_hour':
+            return f"({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽/час за {extra_guests} гостей сверх {max_included})"
+        return f"({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽ за {extra_guests} гостей сверх {max_included})"
+    return f"({price_per_hour}₽/час)"
 
 async def main():
     # Проверка переменных окружения
@@ -559,67 +487,21 @@ async def main():
         return
 
     await init_db()
-    bot = Bot(token=API_TOKEN)
+    # Отправка уведомлений из outbox (при запуске через main.py воркер общий с админ-ботом)
+    outbox.start_worker({outbox.BOT_MAIN: API_TOKEN, outbox.BOT_ADMIN: ADMIN_BOT_TOKEN})
+    bot = http_client.get_bot(API_TOKEN)
     dp = Dispatcher()
 
     @dp.message(Command("start"))
     async def cmd_start(message: types.Message):
-        await get_or_create_user(message.from_user.id, message.from_user.username, message.from_user.full_name or "Пользователь")
-        
-        # Получаем приветственный текст из настроек
-        welcome_text = await get_setting("welcome_text", f"""
-🏠 Добро пожаловать в антикафе «ЧиллиВили»!
-
-Привет, {message.from_user.first_name}! 👋
-
-💸 Наши актуальные цены
-— Платишь за время. Всё остальное — уже включено.
-
-В ЧиллиВили не нужно выбирать между капучино и уютом. У нас всё просто: ты платишь только за время, а внутри тебя уже ждут:
-
-✔️ Настольные игры, приставки, уютные зоны
-✔️ Wi-Fi и зарядки
-✔️ Атмосфера — как дома, только лучше
-✔️ Микрофоны что бы покричать караоке
-
-💰 Цены:
-🕒 800 ₽ / час до 8 человек
-👥 +500 ₽ за каждого человека сверх 8 человек (на всё время пребывания)
-
-❗Минимальное посещение — 1 час
-❗Оплата почасовая (всё честно — ты платишь только за то, сколько был)
-
-📍 Часы работы: по договоренности
-📍 По всем вопросам поддержка 24/7: @ChilliWiliKirov
-
-Выберите действие из меню ниже:
-        """)
-        
-        # Заменяем плейсхолдер {first_name} на реальное имя
-        welcome_text = welcome_text.replace("{first_name}", message.from_user.first_name or "Пользователь")
-        
-        # Проверяем, есть ли медиа для приветствия
-        photo_id = await get_media_setting("welcome", "photo")
-        video_id = await get_media_setting("welcome", "video")
-        
-        # Обрезаем caption если слишком длинный (максимум 1024 символа для Telegram)
-        caption = welcome_text[:1024] if len(welcome_text) > 1024 else welcome_text
-        
-        # Приоритет: видео > фото
-        if video_id and video_id.strip():
-            try:
-                await message.answer_video(video=video_id, caption=caption, reply_markup=create_main_menu())
-            except Exception as e:
-                print(f"Ошибка при отправке видео: {e}")
-                await message.answer(welcome_text, reply_markup=create_main_menu())
-        elif photo_id and photo_id.strip():
-            try:
-                await message.answer_photo(photo=photo_id, caption=caption, reply_markup=create_main_menu())
-            except Exception as e:
-                print(f"Ошибка при отправке фото: {e}")
-                await message.answer(welcome_text, reply_markup=create_main_menu())
+        if message.from_user.id in _known_users:
+            _known_users.move_to_end(message.from_user.id)
         else:
-            await message.answer(welcome_text, reply_markup=create_main_menu())
+            await get_or_create_user(message.from_user.id, message.from_user.username, message.from_user.full_name or "Пользователь")
+            _known_users[message.from_user.id] = None
+            if len(_known_users) > KNOWN_USERS_MAX:
+                _known_users.popitem(last=False)
+        await send_rendered_response(message, "welcome")
 
     # @dp.message(F.text == "📱 Открыть приложение")
     # async def handle_webapp_button(message: types.Message):
@@ -669,37 +551,16 @@ async def main():
             return
         
         text = "📝 Ваши бронирования:\n\n"
-        for booking in bookings:
+        # Цены для всех броней считаются за один проход
+        quotes = await quote_many([(b[2], b[3], b[4], b[5]) for b in bookings])
+        for booking, price_quote in zip(bookings, quotes):
             date_obj = datetime.strptime(booking[2], "%Y-%m-%d")
             display_date = date_obj.strftime("%d.%m.%Y")
             guests = booking[4]
             total_price = booking[6]
-            booking_date = booking[2]
-            booking_time = booking[3]
-            
-            # Получаем актуальные цены из правила или стандартных настроек
-            rule = await get_price_rule_for_booking(booking_date, booking_time)
-            if rule:
-                price_per_hour = rule['price_per_hour']
-                price_per_extra = rule['price_per_extra_guest']
-                max_included = rule['max_guests_included']
-                payment_type = rule['extra_guest_payment_type']
-            else:
-                price_per_hour = await get_price_per_hour()
-                price_per_extra = await get_price_per_extra_guest()
-                max_included = await get_max_guests_included()
-                payment_type = 'per_booking'
             
             # Формируем информацию о стоимости
-            price_info = f"💰 {total_price} ₽"
-            if guests > max_included:
-                extra_guests = guests - max_included
-                if payment_type == 'per_hour':
-                    price_info += f" ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽/час за {extra_guests} гостей сверх {max_included})"
-                else:
-                    price_info += f" ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽ за {extra_guests} гостей сверх {max_included})"
-            else:
-                price_info += f" ({price_per_hour}₽/час)"
+            price_info = f"💰 {total_price} ₽ {format_price_breakdown(price_quote, guests)}"
             
             text += f"📅 {display_date} в {booking[3]}\n"
             text += f"👥 {guests} гостей\n"
@@ -726,130 +587,11 @@ async def main():
 
     @dp.message(F.text == "ℹ️ Информация")
     async def handle_info_button(message: types.Message):
-        # Получаем текст информации из настроек
-        info_text = await get_setting("info_text", """
-🏠 Антикафе «ЧиллиВили»
-
-📍 По всем вопросам поддержка 24/7: @ChilliWiliKirov
-📍 Адрес: ул. Современная, 5
-📞 Телефон: +7 (951) 353-44-35
-🌐 Сайт: https://vk.com/chilivilivili?from=groups
-
-🕐 Часы работы: по договоренности
-
-💸 Наши актуальные цены
-— Платишь за время. Всё остальное — уже включено.
-
-💰 Цены:
-🕒 800 ₽ / час до 8 человек
-👥 +500 ₽ за каждого человека сверх 8 человек (на всё время пребывания)
-
-❗Минимальное посещение — 1 час
-❗Оплата почасовая (всё честно — ты платишь только за то, сколько был)
-
-🛋 А что включено?
-✅ Пространство для работы и отдыха
-✅ Кино, приставки, настолки
-✅ Идеальные условия для душевного вечера, уютного дня или спонтанной встречи
-✅ Wi-Fi и зарядки
-✅ Атмосфера — как дома, только лучше
-✅ Микрофоны что бы покричать караоке
-
-📋 Правила:
-• Бронирование за 2 часа
-• Отмена за 1 час
-• Оплата при входе
-
-Загляни в ЧиллиВили — тут время действительно твоё.
-Только бронируй заранее, особенно в выходные 😉
-        """)
-        
-        # Проверяем, есть ли медиа для этого раздела
-        photo_id = await get_media_setting("info", "photo")
-        video_id = await get_media_setting("info", "video")
-        
-        # Отладочная информация
-        print(f"DEBUG info: photo_id={photo_id[:50] if photo_id else 'None'}..., video_id={video_id[:50] if video_id else 'None'}...")
-        
-        # Обрезаем caption если слишком длинный (максимум 1024 символа для Telegram)
-        caption = info_text[:1024] if len(info_text) > 1024 else info_text
-        
-        # Приоритет: видео > фото
-        if video_id and video_id.strip():
-            try:
-                print(f"Отправка видео для info: file_id={video_id[:50]}...")
-                await message.answer_video(video=video_id, caption=caption)
-            except Exception as e:
-                print(f"Ошибка при отправке видео: {e}")
-                await message.answer(info_text)
-        elif photo_id and photo_id.strip():
-            try:
-                print(f"Отправка фото для info: file_id={photo_id[:50]}...")
-                await message.answer_photo(photo=photo_id, caption=caption)
-            except Exception as e:
-                print(f"Ошибка при отправке фото: {e}, file_id={photo_id[:50] if photo_id else 'None'}")
-                await message.answer(info_text)
-        else:
-            print(f"DEBUG: Медиа не найдено для info (photo_id={photo_id}, video_id={video_id})")
-        await message.answer(info_text)
+        await send_rendered_response(message, "info")
 
     @dp.message(F.text == "❓ Помощь")
     async def handle_help_button(message: types.Message):
-        # Получаем текст помощи из настроек
-        help_text = await get_setting("help_text", """
-🏠 Антикафе «ЧиллиВили» - справка
-
-💡 Как забронировать:
-1. Нажмите "🏠 Забронировать ЧиллиВили!" для быстрого бронирования
-2. Выберите дату, время, количество гостей и длительность
-3. Получите подтверждение
-
-💸 Наша ценовая политика:
-— Платишь за время. Всё остальное — уже включено.
-
-💰 Цены:
-🕒 800 ₽ / час до 8 человек
-👥 +500 ₽ за каждого человека сверх 8 человек (на всё время пребывания)
-
-🛋 Что включено в стоимость:
-✅ Пространство для работы и отдыха
-✅ Настольные игры, приставки
-✅ Wi-Fi и зарядки
-✅ Атмосфера — как дома, только лучше
-✅ Микрофоны что бы покричать караоке
-
-📋 Важно:
-• Бронирование за 2 часа
-• Отмена за 1 час до времени
-• Оплата при входе
-• Минимум 1 час
-• Оплата почасовая 
-
-📍 По всем вопросам поддержка 24/7: @ChilliWiliKirov
-        """)
-        
-        # Проверяем, есть ли медиа для этого раздела
-        photo_id = await get_media_setting("help", "photo")
-        video_id = await get_media_setting("help", "video")
-        
-        # Обрезаем caption если слишком длинный (максимум 1024 символа для Telegram)
-        caption = help_text[:1024] if len(help_text) > 1024 else help_text
-        
-        # Приоритет: видео > фото
-        if video_id and video_id.strip():
-            try:
-                await message.answer_video(video=video_id, caption=caption)
-            except Exception as e:
-                print(f"Ошибка при отправке видео: {e}")
-                await message.answer(help_text)
-        elif photo_id and photo_id.strip():
-            try:
-                await message.answer_photo(photo=photo_id, caption=caption)
-            except Exception as e:
-                print(f"Ошибка при отправке фото: {e}")
-                await message.answer(help_text)
-        else:
-            await message.answer(help_text)
+        await send_rendered_response(message, "help")
 
     @dp.callback_query(F.data.regexp(r"^date_"))
     async def handle_date_selection(callback: types.CallbackQuery):
@@ -1040,7 +782,7 @@ async def main():
         )
         # Сохраняем имя и телефон только для этого бронирования
         # (они будут использованы в create_booking, но не изменят данные пользователя)
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             # Обновляем имя и телефон только если они пустые (None или "Пользователь")
             async with db.execute("SELECT name, phone FROM users WHERE telegram_id = ?", (message.from_user.id,)) as cursor:
                 user_data = await cursor.fetchone()
@@ -1090,9 +832,10 @@ async def main():
         )
         
         # Получаем информацию о бронировании перед отменой
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with acquire() as db:
             async with db.execute("""
-                SELECT b.*, u.name, u.phone, u.username, u.telegram_id
+                SELECT b.id, b.user_id, b.date, b.time, b.guests, b.duration, b.total_price,
+                       u.name, u.phone, u.username, u.telegram_id
                 FROM bookings b 
                 JOIN users u ON b.user_id = u.id 
                 WHERE b.id = ? AND b.user_id = ? AND b.status != 'cancelled'
@@ -1109,75 +852,69 @@ async def main():
                     SET status = 'cancelled' 
                     WHERE id = ? AND user_id = ? AND status != 'cancelled'
                 """, (booking_id, user_id)) as cursor:
-                    await db.commit()
-                    
-                    if cursor.rowcount > 0:
-                        await callback.message.edit_text("✅ Бронирование отменено!")
-                        
-                        # Отправляем уведомление админу
-                        booking_date = booking_info[2]
-                        booking_time = booking_info[3]
-                        guests = booking_info[4]
-                        duration = booking_info[5]
-                        total_price = booking_info[6]
-                        user_name = booking_info[7]
-                        user_phone = booking_info[8]
-                        user_username = booking_info[9]
-                        user_telegram_id = booking_info[10]
-                        
-                        # Формируем тег пользователя
-                        if user_username:
-                            tg_tag = f"@{user_username}"
-                        else:
-                            tg_tag = f"tg://user?id={user_telegram_id}"
-                        
-                        # Формируем информацию о стоимости (получаем актуальные цены из правила)
-                        rule = await get_price_rule_for_booking(booking_date, booking_time)
-                        if rule:
-                            price_per_hour = rule['price_per_hour']
-                            price_per_extra = rule['price_per_extra_guest']
-                            max_included = rule['max_guests_included']
-                            payment_type = rule['extra_guest_payment_type']
-                        else:
-                            price_per_hour = await get_price_per_hour()
-                            price_per_extra = await get_price_per_extra_guest()
-                            max_included = await get_max_guests_included()
-                            payment_type = 'per_booking'
-                        
-                        admin_price_info = f"💰 Стоимость: {total_price}₽"
-                        if guests > max_included:
-                            extra_guests = guests - max_included
-                            if payment_type == 'per_hour':
-                                admin_price_info += f" ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽/час за {extra_guests} гостей сверх {max_included})"
-                            else:
-                                admin_price_info += f" ({price_per_hour}₽/час + {extra_guests}×{price_per_extra}₽ за {extra_guests} гостей сверх {max_included})"
-                        else:
-                            admin_price_info += f" ({price_per_hour}₽/час)"
-                        
-                        # Вычисляем время окончания
-                        start_time = datetime.strptime(booking_time, '%H:%M')
-                        end_time_obj = start_time + timedelta(hours=duration)
-                        if end_time_obj.day > start_time.day:
-                            end_time = f"{end_time_obj.strftime('%H:%M')} (+1 день)"
-                        else:
-                            end_time = end_time_obj.strftime('%H:%M')
-                        
-                        await notify_admin(
-                            f"❌ **Бронирование отменено пользователем!**\n\n"
-                            f"👤 Имя: {user_name}\n"
-                            f"📞 Телефон: {user_phone}\n"
-                            f"Тег: {tg_tag}\n"
-                            f"🧩 TG ID: {user_telegram_id}\n"
-                            f"📅 Дата: {booking_date}\n"
-                            f"🕐 Время: {booking_time}\n"
-                            f"⏰ Окончание: {end_time}\n"
-                            f"👥 Гости: {guests}\n"
-                            f"⏱ Длительность: {duration} ч.\n"
-                            f"{admin_price_info}\n"
-                            f"🆔 ID брони: {booking_id}"
-                        )
+                    cancelled = cursor.rowcount > 0
+                
+                if cancelled:
+                    # Отправляем уведомление админу
+                    booking_date = booking_info[2]
+                    booking_time = booking_info[3]
+                    guests = booking_info[4]
+                    duration = booking_info[5]
+                    total_price = booking_info[6]
+                    user_name = booking_info[7]
+                    user_phone = booking_info[8]
+                    user_username = booking_info[9]
+                    user_telegram_id = booking_info[10]
+
+                    # Формируем тег пользователя
+                    if user_username:
+                        tg_tag = f"@{user_username}"
                     else:
-                        await callback.message.edit_text("❌ Бронирование не найдено или уже отменено")
+                        tg_tag = f"tg://user?id={user_telegram_id}"
+
+                    # Формируем информацию о стоимости (актуальные цены из правила или настроек)
+                    price_quote = (await quote_many([(booking_date, booking_time, guests, duration)]))[0]
+                    admin_price_info = f"💰 Стоимость: {total_price}₽ {format_price_breakdown(price_quote, guests)}"
+
+                    # Вычисляем время окончания
+                    start_time = datetime.strptime(booking_time, '%H:%M')
+                    end_time_obj = start_time + timedelta(hours=duration)
+                    if end_time_obj.day > start_time.day:
+                        end_time = f"{end_time_obj.strftime('%H:%M')} (+1 день)"
+                    else:
+                        end_time = end_time_obj.strftime('%H:%M')
+
+                    admin_text = (
+                        f"❌ **Бронирование отменено пользователем!**\n\n"
+                        f"👤 Имя: {user_name}\n"
+                        f"📞 Телефон: {user_phone}\n"
+                        f"Тег: {tg_tag}\n"
+                        f"🧩 TG ID: {user_telegram_id}\n"
+                        f"📅 Дата: {booking_date}\n"
+                        f"🕐 Время: {booking_time}\n"
+                        f"⏰ Окончание: {end_time}\n"
+                        f"👥 Гости: {guests}\n"
+                        f"⏱ Длительность: {duration} ч.\n"
+                        f"{admin_price_info}\n"
+                        f"🆔 ID брони: {booking_id}"
+                    )
+                    # Уведомление админам пишется в outbox в одной транзакции с отменой
+                    await outbox.enqueue_admins(
+                        db, admin_text,
+                        event=outbox.EVENT_CANCELLED,
+                        summary=outbox.format_booking_line(
+                            booking_id, booking_date, booking_time, guests, duration, user_name
+                        ),
+                        starts_at=f"{booking_date} {booking_time}"
+                    )
+                await db.commit()
+                invalidate_availability()
+                
+                if cancelled:
+                    outbox.wake()
+                    await callback.message.edit_text("✅ Бронирование отменено!")
+                else:
+                    await callback.message.edit_text("❌ Бронирование не найдено или уже отменено")
 
     @dp.callback_query(F.data == "choose_other_date")
     async def handle_choose_other_date(callback: types.CallbackQuery):
@@ -1196,6 +933,10 @@ async def main():
     async def handle_noop(callback: types.CallbackQuery):
         await callback.answer()
 
+    @dp.callback_query(F.data == "day_full")
+    async def handle_day_full(callback: types.CallbackQuery):
+        await callback.answer("❌ На эту дату нет свободного времени. Выберите другой день.", show_alert=True)
+
     # Обработка команд для совместимости
     @dp.message(Command("book"))
     async def cmd_book(message: types.Message):
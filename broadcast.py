@@ -0,0 +1,291 @@
+"""
+Рассылка сообщения сегменту пользователей через основной бот.
+
+Получатели читаются из users пачками по возрастанию id (last_user_id -
+точка продолжения), поэтому список из тысяч пользователей не держится
+в памяти. Отправка идет через TokenBucket с ограничением
+BROADCAST_RATE сообщений в секунду - ниже общего лимита Telegram
+(около 30 в секунду). Лимит на один чат (1 сообщение в секунду)
+соблюдается сам собой: broadcast_deliveries не дает отправить рассылку
+одному чату дважды, в том числе после продолжения с точки.
+После каждой пачки точка продолжения и счетчики сохраняются в broadcasts,
+так что рассылку можно приостановить (pause_broadcast) и продолжить
+(start_broadcast) даже после перезапуска ботов.
+"""
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import notifications
+from db_pool import acquire
+
+SEGMENT_ALL = "all"
+SEGMENT_RECENT = "recent"
+SEGMENT_UPCOMING = "upcoming"
+SEGMENT_NAMES = {
+    SEGMENT_ALL: "Все пользователи",
+    SEGMENT_RECENT: "Бронировали недавно",
+    SEGMENT_UPCOMING: "С предстоящими бронями",
+}
+RECENT_DAYS_DEFAULT = 30
+
+BROADCAST_RUNNING = "running"
+BROADCAST_PAUSED = "paused"
+BROADCAST_DONE = "done"
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_BATCH_SIZE = 50
+# Ответы, после которых повтор бесполезен (бот заблокирован, чат не найден)
+PERMANENT_STATUSES = {400, 403, 404}
+# Остальные ошибки (5xx, сеть) повторяем с удвоением паузы
+BROADCAST_MAX_ATTEMPTS = 3
+BROADCAST_RETRY_DELAY = 1.0
+
+# Запущенные рассылки этого процесса: broadcast_id -> задача
+_running: Dict[int, asyncio.Task] = {}
+_pause_requested = set()
+_bucket: Optional["TokenBucket"] = None
+
+ProgressCallback = Callable[[Dict], Awaitable[None]]
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate событий в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: float = 5):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """Остановить выдачу на seconds секунд (ответ 429 от Telegram)"""
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+        self.tokens = 0
+
+
+def _get_bucket() -> TokenBucket:
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(BROADCAST_RATE)
+    return _bucket
+
+
+def _segment_filter(segment: str, days: Optional[int]):
+    """Условие WHERE для сегмента и его параметры"""
+    if segment == SEGMENT_RECENT:
+        since = (date.today() - timedelta(days=days or RECENT_DAYS_DEFAULT)).isoformat()
+        return """
+            AND EXISTS (
+                SELECT 1 FROM bookings b
+                WHERE b.user_id = users.id AND b.status != 'cancelled' AND b.created_at >= ?
+            )
+        """, [since]
+    if segment == SEGMENT_UPCOMING:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return """
+            AND EXISTS (
+                SELECT 1 FROM bookings b
+                WHERE b.user_id = users.id AND b.status != 'cancelled' AND b.end_at > ?
+            )
+        """, [now]
+    if segment == SEGMENT_ALL:
+        return "", []
+    raise ValueError(f"Неизвестный сегмент рассылки: {segment}")
+
+
+async def count_recipients(segment: str, days: Optional[int] = None) -> int:
+    """Сколько чатов попадает в сегмент"""
+    condition, params = _segment_filter(segment, days)
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT COUNT(DISTINCT telegram_id) FROM users
+            WHERE telegram_id IS NOT NULL {condition}
+        """, params) as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def _next_recipients(segment: str, days: Optional[int], after_user_id: int, limit: int) -> List[tuple]:
+    """Следующая пачка (user_id, telegram_id) после after_user_id"""
+    condition, params = _segment_filter(segment, days)
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT id, telegram_id FROM users
+            WHERE telegram_id IS NOT NULL AND id > ? {condition}
+            ORDER BY id
+            LIMIT ?
+        """, [after_user_id, *params, limit]) as cursor:
+            return await cursor.fetchall()
+
+
+async def create_broadcast(text: str, segment: str, days: Optional[int] = None, created_by: int = None) -> int:
+    """Создать рассылку (еще не запущена), вернуть ее ID"""
+    total = await count_recipients(segment, days)
+    async with acquire() as db:
+        cursor = await db.execute("""
+            INSERT INTO broadcasts (text, segment, segment_days, status, total, created_by, created_at)
+            VALUES (?, ?, ?, 'paused', ?, ?, ?)
+        """, (text, segment, days, total, created_by, datetime.now().isoformat()))
+        await db.commit()
+        return cursor.lastrowid
+
+
+async def get_broadcast(broadcast_id: int) -> Optional[Dict]:
+    async with acquire() as db:
+        async with db.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)) as cursor:
+            row = await cursor.fetchone()
+            if not row:
+                return None
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, row))
+
+
+async def list_unfinished_broadcasts() -> List[Dict]:
+    """Незавершенные рассылки, которые сейчас не идут (можно продолжить)"""
+    async with acquire() as db:
+        async with db.execute("""
+            SELECT id, segment, total, sent, failed, created_at FROM broadcasts
+            WHERE status != 'done'
+            ORDER BY id DESC
+        """) as cursor:
+            rows = await cursor.fetchall()
+            columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in rows if row[0] not in _running]
+
+
+async def _send_one(token: str, chat_id: int, text: str) -> notifications.DeliveryResult:
+    """Отправить одному получателю с учетом лимита
+
+    На 429 - ждать retry_after и повторить; временные ошибки повторяются
+    до BROADCAST_MAX_ATTEMPTS раз, ответы из PERMANENT_STATUSES - нет.
+    """
+    bucket = _get_bucket()
+    attempts = 0
+    while True:
+        await bucket.acquire()
+        result = await notifications.send_message(token, chat_id, text)
+        if result.status == 429:
+            retry_after = result.retry_after or 1
+            bucket.block(retry_after)
+            await asyncio.sleep(retry_after)
+            continue
+        attempts += 1
+        if result.ok or result.status in PERMANENT_STATUSES or attempts >= BROADCAST_MAX_ATTEMPTS:
+            return result
+        await asyncio.sleep(BROADCAST_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+async def run_broadcast(broadcast_id: int, token: str, on_progress: Optional[ProgressCallback] = None) -> Dict:
+    """Отправлять рассылку с точки продолжения до конца или до паузы"""
+    broadcast = await get_broadcast(broadcast_id)
+    if broadcast is None or broadcast["status"] == BROADCAST_DONE:
+        return broadcast
+    _pause_requested.discard(broadcast_id)
+
+    async with acquire() as db:
+        await db.execute("UPDATE broadcasts SET status = 'running' WHERE id = ?", (broadcast_id,))
+        await db.commit()
+    broadcast["status"] = BROADCAST_RUNNING
+
+    text = broadcast["text"]
+    while broadcast_id not in _pause_requested:
+        rows = await _next_recipients(
+            broadcast["segment"], broadcast["segment_days"], broadcast["last_user_id"], BROADCAST_BATCH_SIZE
+        )
+        if not rows:
+            broadcast["status"] = BROADCAST_DONE
+            break
+
+        # Чаты, которым эта рассылка уже ушла (дубли telegram_id, продолжение с точки)
+        chat_ids = list({chat_id for _, chat_id in rows})
+        placeholders = ", ".join("?" * len(chat_ids))
+        async with acquire() as db:
+            async with db.execute(f"""
+                SELECT chat_id FROM broadcast_deliveries
+                WHERE broadcast_id = ? AND chat_id IN ({placeholders})
+            """, [broadcast_id, *chat_ids]) as cursor:
+                done = {row[0] for row in await cursor.fetchall()}
+        pending = [chat_id for chat_id in chat_ids if chat_id not in done]
+
+        results = await asyncio.gather(*(_send_one(token, chat_id, text) for chat_id in pending))
+        sent = sum(1 for result in results if result.ok)
+        broadcast["sent"] += sent
+        broadcast["failed"] += len(results) - sent
+        broadcast["last_user_id"] = rows[-1][0]
+
+        async with acquire() as db:
+            await db.executemany("""
+                INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, chat_id, ok, error)
+                VALUES (?, ?, ?, ?)
+            """, [(broadcast_id, r.chat_id, int(r.ok), r.error) for r in results])
+            await db.execute("""
+                UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ? WHERE id = ?
+            """, (broadcast["last_user_id"], broadcast["sent"], broadcast["failed"], broadcast_id))
+            await db.commit()
+
+        if on_progress:
+            try:
+                await on_progress(dict(broadcast))
+            except Exception as e:
+                print(f"[broadcast] ошибка обновления прогресса: {e}")
+
+    if broadcast["status"] != BROADCAST_DONE:
+        broadcast["status"] = BROADCAST_PAUSED
+    _pause_requested.discard(broadcast_id)
+    async with acquire() as db:
+        await db.execute(
+            "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ?",
+            (broadcast["status"], datetime.now().isoformat() if broadcast["status"] == BROADCAST_DONE else None,
+             broadcast_id)
+        )
+        await db.commit()
+    if on_progress:
+        try:
+            await on_progress(dict(broadcast))
+        except Exception as e:
+            print(f"[broadcast] ошибка обновления прогресса: {e}")
+    return broadcast
+
+
+def start_broadcast(broadcast_id: int, token: str, on_progress: Optional[ProgressCallback] = None) -> bool:
+    """Запустить или продолжить рассылку в фоне (False - она уже идет)"""
+    if broadcast_id in _running:
+        return False
+    task = asyncio.ensure_future(run_broadcast(broadcast_id, token, on_progress))
+    _running[broadcast_id] = task
+    task.add_done_callback(lambda _: _running.pop(broadcast_id, None))
+    return True
+
+
+def pause_broadcast(broadcast_id: int) -> bool:
+    """Попросить рассылку остановиться после текущей пачки (False - она не идет)"""
+    if broadcast_id not in _running:
+        return False
+    _pause_requested.add(broadcast_id)
+    return True
+
+
+async def stop_all():
+    """Приостановить все рассылки (при остановке ботов); продолжить можно после запуска"""
+    for broadcast_id in list(_running):
+        _pause_requested.add(broadcast_id)
+    if _running:
+        await asyncio.wait(set(_running.values()))
@@ -0,0 +1,69 @@
+"""
+Общие фикстуры тестов: временная база со всеми миграциями и пул, настроенный на нее.
+
+Тест получает путь через фикстуру temp_db, наполняет базу через seed_user /
+seed_booking и дальше работает с db.py как обычно. После теста пул
+закрывается, а путь к базе, размер пула и кэши db.py возвращаются к прежним.
+"""
+import asyncio
+
+import aiosqlite
+import pytest
+
+import db
+import db_pool
+from migrations import run_migrations
+
+GUEST_NAME = "Гость"
+GUEST_PHONE = "+70000000000"
+
+
+async def seed_user(conn, user_id: int = 1, name: str = GUEST_NAME, phone: str = GUEST_PHONE,
+                    telegram_id: int = None, username: str = None) -> int:
+    """Добавить пользователя (коммит - на вызывающем)"""
+    await conn.execute(
+        "INSERT INTO users (id, name, phone, telegram_id, username) VALUES (?, ?, ?, ?, ?)",
+        (user_id, name, phone, telegram_id, username)
+    )
+    return user_id
+
+
+async def seed_booking(conn, booking_date: str, time: str = "12:00", duration: int = 2,
+                       status: str = "confirmed", user_id: int = 1, guests: int = 2,
+                       total_price: int = 1000) -> int:
+    """Добавить бронь (коммит - на вызывающем), вернуть ее ID"""
+    cursor = await conn.execute(
+        "INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (user_id, booking_date, time, guests, duration, total_price, status)
+    )
+    return cursor.lastrowid
+
+
+def _reset_db_caches():
+    """Кэши db.py могли остаться от базы другого теста"""
+    db.invalidate_availability()
+    db._settings_cache = None
+    db._price_rule_index = None
+    db._bootstrapped = False
+
+
+async def _migrate(db_path: str):
+    async with aiosqlite.connect(db_path) as conn:
+        await run_migrations(conn)
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """Путь к временной базе со всеми миграциями; пулы db_pool смотрят на нее"""
+    db_path = str(tmp_path / "test.db")
+    asyncio.run(_migrate(db_path))
+    previous_path, previous_size = db_pool.DB_PATH, db_pool.DB_POOL_SIZE
+    db_pool.configure(db_path)
+    _reset_db_caches()
+    try:
+        yield db_path
+    finally:
+        asyncio.run(db_pool.close_pool())
+        db_pool.configure(previous_path, size=previous_size)
+        _reset_db_caches()
@@ -1,7 +1,16 @@
-import aiosqlite
 import sqlite3
-from typing import Optional, List, Dict
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Optional, List, Dict
 from datetime import datetime, date, timedelta
+from time import monotonic
+
+from db_pool import DB_PATH, acquire
+from migrations import SCHEMA_VERSION, apply_pending_migrations, get_schema_version
+from pricing import DEFAULT_PAYMENT_TYPE, PriceRuleIndex, quote
+from occupancy import (
+    build_day_mask, conflicts, earliest_start_hour, free_start_hours, free_start_times, hour_of,
+    neighbour_dates
+)
 
 OPEN_HOUR = 10
 CLOSE_HOUR = 22
@@ -9,137 +18,103 @@ OPEN_TIME_STR = f"{OPEN_HOUR:02d}:00"
 CLOSE_TIME_STR = f"{CLOSE_HOUR:02d}:00"
 MAX_BOOKING_DURATION = CLOSE_HOUR - OPEN_HOUR
 
-DB_PATH = "chillivili.db"
+# Причины, по которым бронь не может быть создана
+BOOKING_CONFLICT_BUSY = "busy"  # пересечение с другой бронью или зазором
+BOOKING_CONFLICT_HOURS = "outside_hours"  # вне рабочего времени
+
+
+@dataclass(frozen=True)
+class BookingResult:
+    """Результат попытки создать бронь"""
+    booking_id: Optional[int] = None
+    conflict: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.booking_id is not None
+
+# Версия начальных данных (слоты, зоны, тексты и цены по умолчанию).
+# Увеличьте, если они изменились, например вместе с OPEN_HOUR / CLOSE_HOUR.
+SEED_VERSION = 1
+
+# Инициализация уже выполнена в этом процессе (оба бота под main.py)
+_bootstrapped = False
+
+async def _bootstrap_is_current(db) -> bool:
+    """Схема и начальные данные уже актуальны"""
+    if await get_schema_version(db) < SCHEMA_VERSION:
+        return False
+    async with db.execute("SELECT version FROM table_versions WHERE name = 'seed_data'") as cursor:
+        row = await cursor.fetchone()
+    return bool(row) and row[0] >= SEED_VERSION
+
+async def _seed_defaults(db):
+    """Начальные данные; существующие значения не перезаписываются"""
+    # Базовые временные слоты
+    await db.execute(
+        "DELETE FROM time_slots WHERE time < ? OR time >= ?",
+        (OPEN_TIME_STR, CLOSE_TIME_STR)
+    )
+    await db.executemany(
+        "INSERT OR IGNORE INTO time_slots (time) VALUES (?)",
+        [(f"{hour:02d}:00",) for hour in range(OPEN_HOUR, CLOSE_HOUR)]
+    )
+    
+    # Базовые зоны (у таблицы нет уникального ключа - проверяем по имени)
+    await db.executemany(
+        "INSERT INTO zones (name, capacity) SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM zones WHERE name = ?)",
+        [(name, capacity, name) for name, capacity in DEFAULT_ZONES]
+    )
+    
+    # Тексты и цены по умолчанию: правки админа сохраняются
+    now = datetime.now().isoformat()
+    settings = [(key, value, "text") for key, value in DEFAULT_TEXTS.items()]
+    settings += [(key, value, "number") for key, value in DEFAULT_PRICES.items()]
+    await db.executemany("""
+        INSERT OR IGNORE INTO bot_settings (setting_key, setting_value, setting_type, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(key, value, setting_type, now, now) for key, value, setting_type in settings])
+    
+    await db.execute(
+        "INSERT OR REPLACE INTO table_versions (name, version) VALUES ('seed_data', ?)",
+        (SEED_VERSION,)
+    )
 
 async def init_db():
-    """Инициализация базы данных для антикафе"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Таблица пользователей
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT,
-                telegram_id INTEGER UNIQUE,
-                username TEXT,
-                created_at TEXT
-            )
-        ''')
-        
-        # Таблица бронирований
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                time TEXT NOT NULL,
-                guests INTEGER NOT NULL,
-                duration INTEGER NOT NULL,
-                total_price INTEGER NOT NULL,
-                status TEXT DEFAULT 'pending',
-                notes TEXT,
-                created_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Таблица временных слотов
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS time_slots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                time TEXT NOT NULL UNIQUE
-            )
-        ''')
-        
-        # Таблица зон антикафе
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS zones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                capacity INTEGER NOT NULL
-            )
-        ''')
-        
-        # Таблица настроек бота
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS bot_settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                setting_key TEXT UNIQUE NOT NULL,
-                setting_value TEXT,
-                setting_type TEXT DEFAULT 'text',
-                created_at TEXT,
-                updated_at TEXT
-            )
-        ''')
-        
-        # Таблица расходов
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                amount INTEGER NOT NULL,
-                category TEXT,
-                description TEXT,
-                created_at TEXT
-            )
-        ''')
-        
-        # Таблица правил ценообразования
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS price_rules (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                start_time TEXT NOT NULL,
-                end_time TEXT NOT NULL,
-                price_per_hour INTEGER NOT NULL,
-                price_per_extra_guest INTEGER NOT NULL,
-                extra_guest_payment_type TEXT NOT NULL DEFAULT 'per_booking',
-                max_guests_included INTEGER NOT NULL DEFAULT 8,
-                created_at TEXT,
-                updated_at TEXT
-            )
-        ''')
-        
-        await db.commit()
-        
-        # Миграции: добавляем недостающие колонки
-        try:
-            await db.execute('ALTER TABLE users ADD COLUMN username TEXT')
-            await db.commit()
-        except sqlite3.OperationalError:
-            # Колонка уже существует, игнорируем ошибку
-            pass
-        
-        try:
-            await db.execute('ALTER TABLE bookings ADD COLUMN notes TEXT')
-            await db.commit()
-        except sqlite3.OperationalError:
-            # Колонка уже существует, игнорируем ошибку
-            pass
-        
-        # Добавляем базовые временные слоты
-        await db.execute(
-            "DELETE FROM time_slots WHERE time < ? OR time >= ?",
-            (OPEN_TIME_STR, CLOSE_TIME_STR)
-        )
-        times = [f"{hour:02d}:00" for hour in range(OPEN_HOUR, CLOSE_HOUR)]
-        for time in times:
-            await db.execute('INSERT OR IGNORE INTO time_slots (time) VALUES (?)', (time,))
-        
-        # Добавляем базовые зоны
-        zones = [('Зона 1', 10), ('Зона 2', 15), ('Зона 3', 20)]
-        for zone in zones:
-            await db.execute('INSERT OR IGNORE INTO zones (name, capacity) VALUES (?, ?)', zone)
-        
-        await db.commit()
-        
-        # Инициализируем настройки по умолчанию
-        await init_default_settings()
+    """Инициализация базы данных для антикафе
+
+    Миграции схемы и начальные данные применяются в одной транзакции.
+    Если схема и данные уже актуальны, выполняется один запрос.
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    
+    started = monotonic()
+    applied = 0
+    async with acquire() as db:
+        if not await _bootstrap_is_current(db):
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                # Перечитываем версии под блокировкой: другой процесс мог успеть раньше
+                applied = await apply_pending_migrations(db)
+                await _seed_defaults(db)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            invalidate_settings()
+    
+    _bootstrapped = True
+    elapsed_ms = (monotonic() - started) * 1000
+    if applied:
+        print(f"[db] Инициализация БД: {elapsed_ms:.1f} мс, применено миграций: {applied}")
+    else:
+        print(f"[db] Инициализация БД: {elapsed_ms:.1f} мс")
 
 async def get_or_create_user(telegram_id: int, username: str = None, name: str = None) -> int:
     """Получить или создать пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,)) as cursor:
             user = await cursor.fetchone()
             if not user:
@@ -154,7 +129,7 @@ async def get_or_create_user(telegram_id: int, username: str = None, name: str =
 
 async def get_user_by_telegram_id(telegram_id: int) -> Optional[dict]:
     """Получить пользователя по telegram_id"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)) as cursor:
             row = await cursor.fetchone()
             if row:
@@ -170,131 +145,260 @@ async def get_available_dates() -> List[str]:
         dates.append(date_obj.strftime("%Y-%m-%d"))
     return dates
 
-async def get_available_times(selected_date: str) -> List[str]:
-    """Получить доступные временные слоты для выбранной даты"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем все временные слоты
-        async with db.execute("SELECT time FROM time_slots ORDER BY time") as cursor:
-            all_times = [row[0] for row in await cursor.fetchall()]
-        all_times = [t for t in all_times if OPEN_TIME_STR <= t < CLOSE_TIME_STR]
+# Кэш занятости по датам: дата -> (версия таблицы bookings, маска)
+# Версию увеличивают триггеры на bookings, поэтому изменения из веб-сервера
+# или другого бота тоже сбрасывают кэш. Версию перечитываем не чаще раза
+# в AVAILABILITY_VERSION_TTL секунд, а после записи в этом процессе - сразу.
+AVAILABILITY_VERSION_TTL = 1.0
+_availability_cache: Dict[str, tuple] = {}
+_availability_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_bookings_version: Optional[int] = None
+_bookings_version_checked_at = 0.0
+
+async def _read_table_version(db, name: str) -> int:
+    """Версия таблицы из table_versions (увеличивается триггерами)"""
+    async with db.execute("SELECT version FROM table_versions WHERE name = ?", (name,)) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+async def _get_bookings_version(db) -> int:
+    """Текущая версия таблицы bookings (с коротким кэшированием)"""
+    global _bookings_version, _bookings_version_checked_at
+    now = monotonic()
+    if _bookings_version is None or now - _bookings_version_checked_at > AVAILABILITY_VERSION_TTL:
+        version = await _read_table_version(db, "bookings")
+        if version != _bookings_version:
+            # Записи со старой версией больше не понадобятся
+            _availability_cache.clear()
+        _bookings_version = version
+        _bookings_version_checked_at = now
+    return _bookings_version
+
+def invalidate_availability():
+    """Сбросить кэш доступности после изменения броней в этом процессе"""
+    global _bookings_version
+    _bookings_version = None
+    _availability_cache.clear()
+    _availability_stats["invalidations"] += 1
+
+def get_availability_cache_stats() -> Dict:
+    """Счетчики кэша доступности"""
+    total = _availability_stats["hits"] + _availability_stats["misses"]
+    return {
+        **_availability_stats,
+        "size": len(_availability_cache),
+        "hit_rate": _availability_stats["hits"] / total if total else 0.0,
+        "version": _bookings_version,
+    }
+
+async def get_day_occupancy(selected_date: str) -> int:
+    """Битовая маска занятости дня с учетом броней соседних дней"""
+    async with acquire() as db:
+        version = await _get_bookings_version(db)
+        cached = _availability_cache.get(selected_date)
+        if cached and cached[0] == version:
+            _availability_stats["hits"] += 1
+            return cached[1]
         
-        # Получаем забронированные времена с длительностью для выбранной даты
+        _availability_stats["misses"] += 1
+        prev_date, next_date = neighbour_dates(selected_date)
         async with db.execute("""
-            SELECT time, duration FROM bookings 
-            WHERE date = ? AND status != 'cancelled'
-        """, (selected_date,)) as cursor:
-            existing_bookings = await cursor.fetchall()
-        
-        # Получаем бронирования с предыдущего дня, которые могут продолжаться на текущий день
-        prev_date = (datetime.strptime(selected_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+            SELECT date, time, duration FROM bookings 
+            WHERE date BETWEEN ? AND ? AND status != 'cancelled'
+        """, (prev_date, next_date)) as cursor:
+            rows = await cursor.fetchall()
+    
+    mask = build_day_mask(rows, selected_date)
+    _availability_cache[selected_date] = (version, mask)
+    return mask
+
+async def get_available_times(selected_date: str, duration: int = 1) -> List[str]:
+    """Получить доступные временные слоты для выбранной даты"""
+    mask = await get_day_occupancy(selected_date)
+    # Для сегодняшней даты бронь не раньше чем за 1 час
+    first_hour = max(OPEN_HOUR, earliest_start_hour(selected_date))
+    return free_start_times(mask, duration, first_hour, CLOSE_HOUR)
+
+async def get_availability_range(start_date: str, end_date: str, duration: int = 1) -> Dict[str, int]:
+    """Количество свободных стартовых слотов по дням периода (одним запросом)"""
+    first_day = date.fromisoformat(start_date)
+    last_day = date.fromisoformat(end_date)
+    if last_day < first_day:
+        return {}
+    
+    query_start = (first_day - timedelta(days=1)).isoformat()
+    query_end = (last_day + timedelta(days=1)).isoformat()
+    async with acquire() as db:
+        version = await _get_bookings_version(db)
         async with db.execute("""
-            SELECT time, duration FROM bookings 
-            WHERE date = ? AND status != 'cancelled'
-        """, (prev_date,)) as cursor:
-            prev_day_bookings = await cursor.fetchall()
-        
-        # Создаем множество заблокированных временных слотов
-        blocked_times = set()
-        
-        # Блокируем времена для бронирований текущего дня
-        for booking_time, booking_duration in existing_bookings:
-            start_time = datetime.strptime(booking_time, '%H:%M')
-            end_time = start_time + timedelta(hours=booking_duration)
-            
-            # Блокируем час ДО начала брони (зазор перед бронированием)
-            buffer_start = start_time - timedelta(hours=1)
-            if buffer_start.hour >= 0:
-                blocked_times.add(buffer_start.strftime('%H:%M'))
-            
-            # Блокируем саму бронь (все часы от начала до конца)
-            for i in range(0, booking_duration):
-                blocked_time = start_time + timedelta(hours=i)
-                blocked_times.add(blocked_time.strftime('%H:%M'))
-            
-            # Блокируем час ПОСЛЕ окончания брони (зазор после бронирования)
-            buffer_end = end_time
-            if buffer_end.hour < 24:
-                blocked_times.add(buffer_end.strftime('%H:%M'))
-        
-        # Блокируем времена для бронирований предыдущего дня, которые продолжаются на текущий день
-        for booking_time, booking_duration in prev_day_bookings:
-            start_time = datetime.strptime(booking_time, '%H:%M')
-            start_hour = start_time.hour
-            
-            # Проверяем, переходит ли бронирование через полночь
-            # Если start_hour + duration >= 24, то бронирование продолжается на следующий день
-            if start_hour + booking_duration >= 24:
-                # Рассчитываем, до какого часа на следующий день продолжается бронирование
-                hours_into_next_day = (start_hour + booking_duration) % 24
-                
-                # Блокируем час ДО начала брони на следующий день (зазор перед бронированием)
-                # Но так как это уже следующий день, зазор учитываем только для времени окончания
-                # Блокируем время с 00:00 до времени окончания + 1 час буфера после
-                end_hour = hours_into_next_day
-                
-                # Блокируем все часы от 00:00 до окончания + 1 час буфера
-                for hour in range(0, min(end_hour + 1, 24)):
-                    blocked_times.add(f"{hour:02d}:00")
-        
-        # Фильтруем слоты по правилу "бронь не раньше чем за 1 час" для сегодняшней даты
-        available = [time for time in all_times if time not in blocked_times]
-        today_str = date.today().strftime("%Y-%m-%d")
-        if selected_date == today_str:
-            now = datetime.now()
-            current_hour = now.hour
-            current_minute = now.minute
-            
-            # Ближайший доступный слот должен быть минимум через 1 час
-            if current_minute == 0:
-                min_hour = current_hour + 1
-            else:
-                min_hour = current_hour + 2
-            
-            if min_hour >= CLOSE_HOUR:
-                available = []
-            else:
-                cutoff_str = f"{min_hour:02d}:00"
-                available = [t for t in available if t >= cutoff_str]
-        
-        # Финальная фильтрация по рабочему времени
-        available = [t for t in available if OPEN_TIME_STR <= t < CLOSE_TIME_STR]
-        
-        return available
+            SELECT date, time, duration FROM bookings 
+            WHERE date BETWEEN ? AND ? AND status != 'cancelled'
+        """, (query_start, query_end)) as cursor:
+            rows = await cursor.fetchall()
+    
+    bookings_by_date = {}
+    for row in rows:
+        bookings_by_date.setdefault(row[0], []).append(row)
+    
+    result = {}
+    now = datetime.now()
+    current = first_day
+    while current <= last_day:
+        day_str = current.isoformat()
+        prev_date, next_date = neighbour_dates(day_str)
+        day_rows = (
+            bookings_by_date.get(prev_date, []) +
+            bookings_by_date.get(day_str, []) +
+            bookings_by_date.get(next_date, [])
+        )
+        mask = build_day_mask(day_rows, day_str)
+        # Заодно прогреваем кэш для последующего выбора времени
+        _availability_cache[day_str] = (version, mask)
+        first_hour = max(OPEN_HOUR, earliest_start_hour(day_str, now))
+        result[day_str] = len(free_start_hours(mask, duration, first_hour, CLOSE_HOUR))
+        current += timedelta(days=1)
+    return result
+
+async def is_time_available(selected_date: str, time: str, duration: int) -> bool:
+    """Свободен ли интервал [time, time + duration) с учетом зазоров"""
+    mask = await get_day_occupancy(selected_date)
+    return not conflicts(mask, hour_of(time), duration)
 
 async def get_available_zones() -> List[Dict]:
     """Получить доступные зоны"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT * FROM zones") as cursor:
             rows = await cursor.fetchall()
             return [{"id": row[0], "name": row[1], "capacity": row[2]} for row in rows]
 
-async def create_booking(user_id: int, date: str, time: str, guests: int, duration: int, zone_id: int = None, notes: str = None) -> int:
-    """Создать бронирование"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Расчет цены (стандартная цена 800 руб/час)
-        price_per_hour = 800
-        total_price = duration * price_per_hour
-        
-        # Добавляем доплату за гостей сверх 8 человек
-        if guests > 8:
-            extra_guests = guests - 8
-            extra_charge = extra_guests * 500  # 500р за каждого сверх 8 человек на всё время
-            total_price += extra_charge
-        
-        await db.execute("""
-            INSERT INTO bookings (user_id, date, time, guests, duration, total_price, notes, created_at) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, date, time, guests, duration, total_price, notes, datetime.now().isoformat()))
-        await db.commit()
-        
-        async with db.execute("SELECT last_insert_rowid()") as cursor:
-            return (await cursor.fetchone())[0]
+# Атомарное создание брони: проверка занятости и вставка в одной транзакции
+# BEGIN IMMEDIATE. Блокировка на запись берется до чтения броней, поэтому два
+# одновременных запроса на один слот (даже из разных процессов) не пройдут оба.
+_OCCUPANCY_QUERY = """
+    SELECT date, time, duration FROM bookings 
+    WHERE date BETWEEN ? AND ? AND status != 'cancelled'
+"""
+_INSERT_BOOKING_QUERY = """
+    INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status, notes, created_at) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _booking_conflict(rows, booking_date: str, booking_time: str, duration: int) -> Optional[str]:
+    """Причина конфликта для новой брони или None"""
+    start_hour = hour_of(booking_time)
+    if start_hour < OPEN_HOUR or start_hour + duration > CLOSE_HOUR:
+        return BOOKING_CONFLICT_HOURS
+    if conflicts(build_day_mask(rows, booking_date), start_hour, duration):
+        return BOOKING_CONFLICT_BUSY
+    return None
+
+async def _insert_booking_if_free(
+    db,
+    user_id: int,
+    booking_date: str,
+    booking_time: str,
+    guests: int,
+    duration: int,
+    total_price: int,
+    status: str,
+    notes: str
+) -> BookingResult:
+    """Проверка занятости и вставка внутри уже открытой транзакции BEGIN IMMEDIATE"""
+    async with db.execute(_OCCUPANCY_QUERY, neighbour_dates(booking_date)) as cursor:
+        rows = await cursor.fetchall()
+    conflict = _booking_conflict(rows, booking_date, booking_time, duration)
+    if conflict:
+        return BookingResult(conflict=conflict)
+    
+    cursor = await db.execute(_INSERT_BOOKING_QUERY, (
+        user_id, booking_date, booking_time, guests, duration, total_price,
+        status, notes, datetime.now().isoformat()
+    ))
+    return BookingResult(booking_id=cursor.lastrowid)
+
+async def book_slot(
+    user_id: int,
+    booking_date: str,
+    booking_time: str,
+    guests: int,
+    duration: int,
+    total_price: int,
+    status: str = "pending",
+    notes: str = None,
+    on_created: Optional[Callable[..., Awaitable]] = None
+) -> BookingResult:
+    """Проверить занятость и создать бронь в одной транзакции
+
+    on_created(db, booking_id) выполняется в той же транзакции
+    (например, чтобы поставить уведомление в outbox).
+    """
+    async with acquire() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            result = await _insert_booking_if_free(
+                db, user_id, booking_date, booking_time, guests, duration, total_price, status, notes
+            )
+            if result.ok:
+                if on_created is not None:
+                    await on_created(db, result.booking_id)
+                await db.commit()
+            else:
+                await db.rollback()
+        except Exception:
+            await db.rollback()
+            raise
+    
+    if result.ok:
+        invalidate_availability()
+    return result
+
+def book_slot_sync(
+    cur: sqlite3.Cursor,
+    user_id: int,
+    booking_date: str,
+    booking_time: str,
+    guests: int,
+    duration: int,
+    total_price: int,
+    status: str = "pending",
+    notes: str = None
+) -> BookingResult:
+    """Синхронный вариант book_slot для веб-сервера
+
+    Вызывается внутри транзакции BEGIN IMMEDIATE, открытой вызывающим кодом;
+    фиксация или откат остаются за ним.
+    """
+    cur.execute(_OCCUPANCY_QUERY, neighbour_dates(booking_date))
+    conflict = _booking_conflict(cur.fetchall(), booking_date, booking_time, duration)
+    if conflict:
+        return BookingResult(conflict=conflict)
+    cur.execute(_INSERT_BOOKING_QUERY, (
+        user_id, booking_date, booking_time, guests, duration, total_price,
+        status, notes, datetime.now().isoformat()
+    ))
+    return BookingResult(booking_id=cur.lastrowid)
+
+async def create_booking(user_id: int, date: str, time: str, guests: int, duration: int, zone_id: int = None, notes: str = None) -> Optional[int]:
+    """Создать бронирование (None, если время занято)"""
+    # Расчет цены (стандартная цена 800 руб/час)
+    price_per_hour = 800
+    total_price = duration * price_per_hour
+    
+    # Добавляем доплату за гостей сверх 8 человек
+    if guests > 8:
+        extra_guests = guests - 8
+        extra_charge = extra_guests * 500  # 500р за каждого сверх 8 человек на всё время
+        total_price += extra_charge
+    
+    result = await book_slot(user_id, date, time, guests, duration, total_price, notes=notes)
+    return result.booking_id
 
 async def get_user_bookings(user_id: int) -> List[Dict]:
     """Получить бронирования пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
-            SELECT * FROM bookings 
+            SELECT id, user_id, date, time, guests, duration, total_price, status, notes
+            FROM bookings 
             WHERE user_id = ? AND status != 'cancelled'
             ORDER BY date DESC, time DESC
         """, (user_id,)) as cursor:
@@ -305,13 +409,14 @@ async def get_user_bookings(user_id: int) -> List[Dict]:
 
 async def cancel_booking(booking_id: int, user_id: int) -> bool:
     """Отменить бронирование"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
             UPDATE bookings 
             SET status = 'cancelled' 
             WHERE id = ? AND user_id = ? AND status != 'cancelled'
         """, (booking_id, user_id)) as cursor:
             await db.commit()
+            invalidate_availability()
             return cursor.rowcount > 0
 
 async def create_booking_by_admin(
@@ -324,53 +429,153 @@ async def create_booking_by_admin(
     telegram_id: int = None,
     total_price: int = None,
     status: str = "confirmed"
-) -> int:
-    """Создать бронирование админом (не изменяет существующие данные пользователя)"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Расчет цены если не указана
-        if total_price is None:
-            total_price = await calculate_booking_price(guests, duration, date, time)
-        
-        # Получаем или создаем пользователя
-        if telegram_id:
-            user_id = await get_or_create_user(telegram_id, None, name)
-            # Обновляем имя и телефон только если они не заданы
-            async with db.execute("SELECT name, phone FROM users WHERE id = ?", (user_id,)) as cursor:
-                user_data = await cursor.fetchone()
+) -> BookingResult:
+    """Создать бронирование админом (не изменяет существующие данные пользователя)
+
+    Занятость проверяется по тем же правилам, что и в клиентском боте;
+    если время занято, бронь и новый пользователь не создаются.
+    """
+    # Расчет цены если не указана
+    if total_price is None:
+        total_price = await calculate_booking_price(guests, duration, date, time)
+    
+    async with acquire() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            if telegram_id:
+                # Пользователь создается в той же транзакции, что и бронь
+                async with db.execute(
+                    "SELECT id, name, phone FROM users WHERE telegram_id = ?", (telegram_id,)
+                ) as cursor:
+                    user_data = await cursor.fetchone()
                 if user_data:
-                    current_name, current_phone = user_data
-                    # Обновляем только если текущие значения пустые или None
+                    user_id, current_name, current_phone = user_data
+                    # Обновляем имя и телефон только если текущие значения пустые или None
                     new_name = name if (not current_name or current_name == "Пользователь") else current_name
                     new_phone = phone if (not current_phone or current_phone == "Не указан") else current_phone
                     await db.execute(
                         "UPDATE users SET name = ?, phone = ? WHERE id = ?",
                         (new_name, new_phone, user_id)
                     )
-        else:
-            # Создаем пользователя без telegram_id для внешних бронирований
-            await db.execute("""
-                INSERT INTO users (name, phone, telegram_id, username, created_at) 
-                VALUES (?, ?, ?, ?, ?)
-            """, (name, phone or "Не указан", None, None, datetime.now().isoformat()))
-            await db.commit()
-            async with db.execute("SELECT last_insert_rowid()") as cursor:
-                user_id = (await cursor.fetchone())[0]
-        
-        # Создаем бронирование
-        await db.execute("""
-            INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status, created_at) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, date, time, guests, duration, total_price, status, datetime.now().isoformat()))
-        await db.commit()
-        
-        async with db.execute("SELECT last_insert_rowid()") as cursor:
-            return (await cursor.fetchone())[0]
+                else:
+                    cursor = await db.execute("""
+                        INSERT INTO users (name, phone, telegram_id, username, created_at) 
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (name, phone, telegram_id, None, datetime.now().isoformat()))
+                    user_id = cursor.lastrowid
+            else:
+                # Создаем пользователя без telegram_id для внешних бронирований
+                cursor = await db.execute("""
+                    INSERT INTO users (name, phone, telegram_id, username, created_at) 
+                    VALUES (?, ?, ?, ?, ?)
+                """, (name, phone or "Не указан", None, None, datetime.now().isoformat()))
+                user_id = cursor.lastrowid
+            
+            # Создаем бронирование
+            result = await _insert_booking_if_free(
+                db, user_id, date, time, guests, duration, total_price, status, None
+            )
+            if result.ok:
+                await db.commit()
+            else:
+                await db.rollback()
+        except Exception:
+            await db.rollback()
+            raise
+    
+    if result.ok:
+        invalidate_availability()
+    return result
+
+# Колонки брони для списков админ-бота: индексы 0-9 (notes на индексе 9),
+# за ними поля пользователя 10-13. Явный список вместо b.*, чтобы новые
+# колонки bookings не сдвигали индексы.
+BOOKING_COLUMNS = "b.id, b.user_id, b.date, b.time, b.guests, b.duration, b.total_price, b.status, b.created_at, b.notes"
+
+# Списки броней для постраничного просмотра: условие и порядок (True - новые первыми).
+# Все списки идут по idx_bookings_date_time в порядке страницы: граница задается
+# по date, а end_at с унарным + проверяется только для отобранных строк - иначе
+# SQLite выбирает индекс по end_at и сортирует всю выборку.
+# past - закончились (end_at <= сейчас, значит и начались не позже сегодня),
+# current - идут сейчас (начались не раньше вчера, бронь короче суток).
+BOOKING_PAGE_SCOPES = {
+    "all": ("b.status != 'cancelled'", True),
+    "find": ("b.status != 'cancelled'", False),
+    "past": (
+        "b.status != 'cancelled' AND b.date <= date('now', 'localtime') "
+        "AND +b.end_at <= datetime('now', 'localtime')",
+        True
+    ),
+    "current": (
+        "b.status != 'cancelled' "
+        "AND b.date BETWEEN date('now', 'localtime', '-1 day') AND date('now', 'localtime') "
+        "AND b.date || ' ' || b.time <= strftime('%Y-%m-%d %H:%M', 'now', 'localtime') "
+        "AND +b.end_at > datetime('now', 'localtime')",
+        False
+    ),
+}
+BOOKINGS_PAGE_SIZE = 10
+
+
+@dataclass(frozen=True)
+class BookingPage:
+    """Страница списка броней и ключи (date, time, id) для перехода к соседним"""
+    rows: list
+    prev_key: Optional[tuple] = None
+    next_key: Optional[tuple] = None
+
+
+async def get_bookings_page(
+    scope: str = "all",
+    key: Optional[tuple] = None,
+    direction: str = "next",
+    limit: int = BOOKINGS_PAGE_SIZE
+) -> BookingPage:
+    """Страница броней с пагинацией по ключу (date, time, id)
+
+    key - ключ последней (direction="next") или первой (direction="prev")
+    брони соседней страницы. Каждая страница - один запрос по индексу
+    idx_bookings_date_time, без OFFSET, на любой глубине.
+    """
+    condition, newest_first = BOOKING_PAGE_SCOPES[scope]
+    # В порядке списка "дальше" - это меньшие ключи для новых первыми и большие для старых первыми
+    forward = direction == "next"
+    descending = newest_first == forward
+    params = []
+    if key:
+        condition += f" AND (b.date, b.time, b.id) {'<' if descending else '>'} (?, ?, ?)"
+        params.extend(key)
+    order = "DESC" if descending else "ASC"
+    async with acquire() as db:
+        async with db.execute(f"""
+            SELECT {BOOKING_COLUMNS}, u.name, u.phone, u.telegram_id, u.username 
+            FROM bookings b 
+            JOIN users u ON b.user_id = u.id 
+            WHERE {condition}
+            ORDER BY b.date {order}, b.time {order}, b.id {order}
+            LIMIT ?
+        """, (*params, limit + 1)) as cursor:
+            rows = list(await cursor.fetchall())
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+    if not rows:
+        return BookingPage(rows=[])
+    
+    first_key = (rows[0][2], rows[0][3], rows[0][0])
+    last_key = (rows[-1][2], rows[-1][3], rows[-1][0])
+    if forward:
+        return BookingPage(rows, first_key if key else None, last_key if has_more else None)
+    return BookingPage(rows, first_key if has_more else None, last_key)
 
 async def get_booking_by_id(booking_id: int) -> Optional[Dict]:
     """Получить бронирование по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
-            SELECT b.*, u.name as user_name 
+            SELECT b.id, b.user_id, b.date, b.time, b.guests, b.duration, b.total_price,
+                   b.status, b.notes, u.name as user_name 
             FROM bookings b 
             JOIN users u ON b.user_id = u.id 
             WHERE b.id = ?
@@ -379,26 +584,26 @@ async def get_booking_by_id(booking_id: int) -> Optional[Dict]:
             if row:
                 return {"id": row[0], "user_id": row[1], "date": row[2], "time": row[3],
                        "guests": row[4], "duration": row[5], "total_price": row[6],
-                       "status": row[7], "notes": row[8], "user_name": row[10]}
+                       "status": row[7], "notes": row[8], "user_name": row[9]}
     return None
 
 async def get_daily_bookings(selected_date: str) -> List[Dict]:
     """Получить все бронирования на определенную дату"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
-            SELECT b.*, u.name as user_name 
+            SELECT b.id, b.time, b.guests, b.duration, b.total_price, u.name as user_name 
             FROM bookings b 
             JOIN users u ON b.user_id = u.id 
             WHERE b.date = ? AND b.status != 'cancelled'
             ORDER BY b.time
         """, (selected_date,)) as cursor:
             rows = await cursor.fetchall()
-            return [{"id": row[0], "time": row[3], "guests": row[4], "duration": row[5],
-                    "total_price": row[6], "user_name": row[10]} for row in rows]
+            return [{"id": row[0], "time": row[1], "guests": row[2], "duration": row[3],
+                    "total_price": row[4], "user_name": row[5]} for row in rows]
 
 async def update_user_phone(telegram_id: int, phone: str) -> bool:
     """Обновить телефон пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
             UPDATE users SET phone = ? WHERE telegram_id = ?
         """, (phone, telegram_id)) as cursor:
@@ -406,17 +611,17 @@ async def update_user_phone(telegram_id: int, phone: str) -> bool:
             return cursor.rowcount > 0
 
 async def get_statistics(days: int = 30) -> Dict:
-    """Получить статистику бронирований"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Получить статистику бронирований (по дневным агрегатам daily_stats)"""
+    async with acquire() as db:
         # Общая статистика
         async with db.execute("""
             SELECT 
-                COUNT(*) as total_bookings,
-                SUM(total_price) as total_revenue,
-                AVG(guests) as avg_guests,
-                AVG(duration) as avg_duration
-            FROM bookings 
-            WHERE status != 'cancelled' 
+                SUM(bookings) as total_bookings,
+                SUM(revenue) as total_revenue,
+                SUM(guests) * 1.0 / SUM(bookings) as avg_guests,
+                SUM(hours) * 1.0 / SUM(bookings) as avg_duration
+            FROM daily_stats 
+            WHERE bookings > 0
             AND date >= date('now', '-{} days')
         """.format(days)) as cursor:
             stats = await cursor.fetchone()
@@ -425,9 +630,9 @@ async def get_statistics(days: int = 30) -> Dict:
         async with db.execute("""
             SELECT 
                 strftime('%w', date) as day_of_week,
-                COUNT(*) as bookings_count
-            FROM bookings 
-            WHERE status != 'cancelled' 
+                SUM(bookings) as bookings_count
+            FROM daily_stats 
+            WHERE bookings > 0
             AND date >= date('now', '-{} days')
             GROUP BY strftime('%w', date)
             ORDER BY bookings_count DESC
@@ -442,13 +647,6 @@ async def get_statistics(days: int = 30) -> Dict:
             'by_day': by_day
         }
 
-# Функции для совместимости с существующими ботами
-def get_db():
-    """Синхронное подключение к базе данных"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 async def is_admin(telegram_id: int) -> bool:
     """Проверить, является ли пользователь администратором"""
     # Для совместимости - всегда возвращаем True для тестирования
@@ -463,7 +661,7 @@ async def is_super_admin(telegram_id: int) -> bool:
 
 async def get_all_admin_ids() -> List[int]:
     """Получить список всех telegram_id администраторов"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         # Проверяем, существует ли таблица admins
         async with db.execute("""
             SELECT name FROM sqlite_master 
@@ -485,22 +683,59 @@ async def get_all_admin_ids() -> List[int]:
             return [row[0] for row in rows if row[0] is not None]
 
 # Функции для работы с настройками бота
+
+# Кэш настроек: все значения загружаются одним запросом и отдаются из памяти.
+# Изменения из другого процесса (админ-бот / основной бот) замечаем по версии
+# bot_settings в table_versions, которую проверяем не чаще раза в секунду.
+SETTINGS_VERSION_TTL = 1.0
+_settings_cache: Optional[Dict[str, str]] = None
+_settings_version: Optional[int] = None
+_settings_checked_at = 0.0
+
+async def _get_settings() -> Dict[str, str]:
+    """Актуальный словарь настроек из кэша"""
+    global _settings_cache, _settings_version, _settings_checked_at
+    now = monotonic()
+    if _settings_cache is not None and now - _settings_checked_at <= SETTINGS_VERSION_TTL:
+        return _settings_cache
+    
+    async with acquire() as db:
+        version = await _read_table_version(db, "bot_settings")
+        if _settings_cache is None or version != _settings_version:
+            async with db.execute("SELECT setting_key, setting_value FROM bot_settings") as cursor:
+                rows = await cursor.fetchall()
+            _settings_cache = {row[0]: row[1] for row in rows}
+            _settings_version = version
+    _settings_checked_at = now
+    return _settings_cache
+
+async def get_settings_version() -> Optional[int]:
+    """Версия настроек, по которой построен кэш (меняется при любой правке)"""
+    await _get_settings()
+    return _settings_version
+
+def invalidate_settings():
+    """Перечитать версию настроек при следующем обращении"""
+    global _settings_checked_at
+    _settings_checked_at = 0.0
+
 async def get_setting(key: str, default_value: str = "") -> str:
     """Получить настройку по ключу"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT setting_value FROM bot_settings WHERE setting_key = ?", (key,)) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else default_value
+    settings = await _get_settings()
+    return settings[key] if key in settings else default_value
 
 async def set_setting(key: str, value: str, setting_type: str = "text") -> bool:
     """Установить настройку"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         try:
             await db.execute("""
                 INSERT OR REPLACE INTO bot_settings (setting_key, setting_value, setting_type, updated_at) 
                 VALUES (?, ?, ?, ?)
             """, (key, value, setting_type, datetime.now().isoformat()))
             await db.commit()
+            if _settings_cache is not None:
+                _settings_cache[key] = value
+            invalidate_settings()
             return True
         except Exception as e:
             print(f"Ошибка при сохранении настройки {key}: {e}")
@@ -508,7 +743,7 @@ async def set_setting(key: str, value: str, setting_type: str = "text") -> bool:
 
 async def get_all_settings() -> Dict[str, Dict]:
     """Получить все настройки"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT setting_key, setting_value, setting_type FROM bot_settings") as cursor:
             rows = await cursor.fetchall()
             return {row[0]: {"value": row[1], "type": row[2]} for row in rows}
@@ -528,19 +763,21 @@ async def get_media_setting(media_type: str, file_type: str = "photo") -> str:
 async def delete_media_setting(media_type: str, file_type: str = "photo") -> bool:
     """Удалить медиа из настроек"""
     key = f"{media_type}_{file_type}"
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         try:
             await db.execute("DELETE FROM bot_settings WHERE setting_key = ?", (key,))
             await db.commit()
+            if _settings_cache is not None:
+                _settings_cache.pop(key, None)
+            invalidate_settings()
             return True
         except Exception as e:
             print(f"Ошибка при удалении медиа {key}: {e}")
             return False
 
-async def init_default_settings():
-    """Инициализация настроек по умолчанию"""
-    default_settings = {
-        "info_text": """🏠 Антикафе «ЧиллиВили»
+# Тексты по умолчанию (создаются при первом запуске, дальше их меняет админ)
+DEFAULT_TEXTS = {
+    "info_text": """🏠 Антикафе «ЧиллиВили»
 
 📍 По всем вопросам поддержка 24/7: @ChilliWiliKirov
 📍 Адрес: ул. Современная, 5
@@ -574,8 +811,8 @@ async def init_default_settings():
 
 Загляни в ЧиллиВили — тут время действительно твоё.
 Только бронируй заранее, особенно в выходные 😉""",
-        
-        "help_text": """🏠 Антикафе «ЧиллиВили» - справка
+    
+    "help_text": """🏠 Антикафе «ЧиллиВили» - справка
 
 💡 Как забронировать:
 1. Нажмите "🏠 Забронировать ЧиллиВили!" для быстрого бронирования
@@ -604,8 +841,8 @@ async def init_default_settings():
 • Оплата почасовая 
 
 📍 По всем вопросам поддержка 24/7: @ChilliWiliKirov""",
-        
-        "welcome_text": """🏠 Добро пожаловать в антикафе «ЧиллиВили»!
+    
+    "welcome_text": """🏠 Добро пожаловать в антикафе «ЧиллиВили»!
 
 Привет, {first_name}! 👋
 
@@ -630,23 +867,23 @@ async def init_default_settings():
 📍 По всем вопросам поддержка 24/7: @ChilliWiliKirov
 
 Выберите действие из меню ниже:"""
-    }
-    
-    for key, value in default_settings.items():
-        await set_setting(key, value, "text")
-    
-    # Инициализация цен по умолчанию
-    price_settings = {
-        "price_per_hour": "800",  # Цена за час до 8 человек
-        "price_per_extra_guest": "500",  # Цена за каждого дополнительного гостя (сверх 8)
-        "max_guests_included": "8"  # Количество гостей, включенных в базовую цену
-    }
-    
-    for key, value in price_settings.items():
-        # Проверяем, не установлена ли уже цена
-        existing = await get_setting(key, "")
-        if not existing:
-            await set_setting(key, value, "number")
+}
+
+# Цены по умолчанию
+DEFAULT_PRICES = {
+    "price_per_hour": "800",  # Цена за час до 8 человек
+    "price_per_extra_guest": "500",  # Цена за каждого дополнительного гостя (сверх 8)
+    "max_guests_included": "8"  # Количество гостей, включенных в базовую цену
+}
+
+DEFAULT_ZONES = [('Зона 1', 10), ('Зона 2', 15), ('Зона 3', 20)]
+
+async def init_default_settings():
+    """Инициализация настроек по умолчанию (без перезаписи существующих)"""
+    async with acquire() as db:
+        await _seed_defaults(db)
+        await db.commit()
+    invalidate_settings()
 
 # Функции для работы с ценами
 async def get_price_per_hour() -> int:
@@ -673,45 +910,53 @@ async def set_max_guests_included(count: int) -> bool:
     """Установить максимальное количество гостей, включенных в базовую цену"""
     return await set_setting("max_guests_included", str(count), "number")
 
+async def quote_many(items: List[tuple]) -> List[Dict]:
+    """Рассчитать стоимость сразу для нескольких броней
+
+    items - список кортежей (date, time, guests, duration); date и time
+    могут быть None, тогда применяются стандартные цены. Для каждой брони
+    возвращается словарь с итоговой стоимостью и примененными ценами.
+    """
+    index = await get_price_rule_index()
+    defaults = {
+        'id': None,
+        'price_per_hour': await get_price_per_hour(),
+        'price_per_extra_guest': await get_price_per_extra_guest(),
+        'max_guests_included': await get_max_guests_included(),
+        'extra_guest_payment_type': DEFAULT_PAYMENT_TYPE,
+    }
+    
+    quotes = []
+    for booking_date, booking_time, guests, duration in items:
+        rule = None
+        if booking_date and booking_time:
+            rule = index.lookup(booking_date, booking_time)
+        prices = rule or defaults
+        quotes.append({
+            'total_price': quote(
+                guests, duration,
+                prices['price_per_hour'],
+                prices['price_per_extra_guest'],
+                prices['max_guests_included'],
+                prices['extra_guest_payment_type'],
+            ),
+            'price_per_hour': prices['price_per_hour'],
+            'price_per_extra_guest': prices['price_per_extra_guest'],
+            'max_guests_included': prices['max_guests_included'],
+            'extra_guest_payment_type': prices['extra_guest_payment_type'],
+            'rule_id': prices['id'],
+        })
+    return quotes
+
 async def calculate_booking_price(guests: int, duration: int, booking_date: str = None, booking_time: str = None) -> int:
     """Рассчитать стоимость бронирования с учетом правил ценообразования"""
-    # Сначала проверяем, есть ли специальное правило для этой даты и времени
-    if booking_date and booking_time:
-        rule = await get_price_rule_for_booking(booking_date, booking_time)
-        if rule:
-            price_per_hour = rule['price_per_hour']
-            price_per_extra = rule['price_per_extra_guest']
-            max_included = rule['max_guests_included']
-            payment_type = rule['extra_guest_payment_type']
-        else:
-            # Используем стандартные настройки
-            price_per_hour = await get_price_per_hour()
-            price_per_extra = await get_price_per_extra_guest()
-            max_included = await get_max_guests_included()
-            payment_type = 'per_booking'  # По умолчанию
-    else:
-        # Используем стандартные настройки
-        price_per_hour = await get_price_per_hour()
-        price_per_extra = await get_price_per_extra_guest()
-        max_included = await get_max_guests_included()
-        payment_type = 'per_booking'  # По умолчанию
-    
-    base_price = duration * price_per_hour
-    
-    if guests > max_included:
-        extra_guests = guests - max_included
-        if payment_type == 'per_hour':
-            extra_price = extra_guests * price_per_extra * duration
-        else:  # per_booking
-            extra_price = extra_guests * price_per_extra
-        return base_price + extra_price
-    
-    return base_price
+    quotes = await quote_many([(booking_date, booking_time, guests, duration)])
+    return quotes[0]['total_price']
 
 # Функции для работы с расходами
 async def add_expense(expense_date: str, amount: int, category: str = None, description: str = None) -> int:
     """Добавить расход"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         await db.execute("""
             INSERT INTO expenses (date, amount, category, description, created_at) 
             VALUES (?, ?, ?, ?, ?)
@@ -721,9 +966,61 @@ async def add_expense(expense_date: str, amount: int, category: str = None, desc
         async with db.execute("SELECT last_insert_rowid()") as cursor:
             return (await cursor.fetchone())[0]
 
+def validate_expense(expense: Dict) -> Optional[str]:
+    """Описание ошибки в записи расхода или None, если запись верна"""
+    try:
+        datetime.strptime(expense.get("date") or "", "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return f"неверная дата {expense.get('date')!r} (нужен формат ГГГГ-ММ-ДД)"
+    amount = expense.get("amount")
+    if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+        return f"неверная сумма {amount!r} (нужно целое число больше нуля)"
+    return None
+
+async def add_expenses_bulk(expenses: List[Dict]) -> List[int]:
+    """Добавить пачку расходов одной транзакцией, вернуть их ID в том же порядке
+
+    Запись: {"date": "ГГГГ-ММ-ДД", "amount": int, "category", "description",
+    "created_at"} (последние три - необязательно). Сначала проверяется вся
+    пачка: если хоть одна запись неверна, ничего не пишется и поднимается
+    ValueError со списком ошибок. Подходит и для импорта старых расходов.
+    """
+    errors = []
+    for number, expense in enumerate(expenses, 1):
+        error = validate_expense(expense)
+        if error:
+            errors.append(f"Запись {number}: {error}")
+    if errors:
+        raise ValueError("\n".join(errors))
+    if not expenses:
+        return []
+    
+    now = datetime.now().isoformat()
+    rows = [
+        (e["date"], e["amount"], e.get("category"), e.get("description"), e.get("created_at") or now)
+        for e in expenses
+    ]
+    async with acquire() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            async with db.execute("SELECT COALESCE(MAX(id), 0) FROM expenses") as cursor:
+                last_id = (await cursor.fetchone())[0]
+            await db.executemany("""
+                INSERT INTO expenses (date, amount, category, description, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            # AUTOINCREMENT под блокировкой записи: новые ID идут подряд после last_id
+            async with db.execute("SELECT id FROM expenses WHERE id > ? ORDER BY id", (last_id,)) as cursor:
+                ids = [row[0] for row in await cursor.fetchall()]
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    return ids
+
 async def get_expenses(start_date: str = None, end_date: str = None, category: str = None) -> List[Dict]:
     """Получить расходы за период"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         query = "SELECT * FROM expenses WHERE 1=1"
         params = []
         
@@ -747,8 +1044,8 @@ async def get_expenses(start_date: str = None, end_date: str = None, category: s
             return [dict(zip(columns, row)) for row in rows]
 
 async def get_expenses_by_month(year: int = None, month: int = None) -> List[Dict]:
-    """Получить расходы по месяцам"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Получить расходы по месяцам (по дневным агрегатам daily_stats)"""
+    async with acquire() as db:
         if year and month:
             # Конкретный месяц
             start_date = f"{year}-{month:02d}-01"
@@ -759,10 +1056,10 @@ async def get_expenses_by_month(year: int = None, month: int = None) -> List[Dic
             query = """
                 SELECT 
                     strftime('%Y-%m', date) as month,
-                    SUM(amount) as total_amount,
-                    COUNT(*) as count
-                FROM expenses 
-                WHERE date >= ? AND date < ?
+                    SUM(expenses) as total_amount,
+                    SUM(expenses_count) as count
+                FROM daily_stats 
+                WHERE date >= ? AND date < ? AND expenses_count > 0
                 GROUP BY month
             """
             async with db.execute(query, (start_date, end_date)) as cursor:
@@ -773,9 +1070,10 @@ async def get_expenses_by_month(year: int = None, month: int = None) -> List[Dic
             query = """
                 SELECT 
                     strftime('%Y-%m', date) as month,
-                    SUM(amount) as total_amount,
-                    COUNT(*) as count
-                FROM expenses 
+                    SUM(expenses) as total_amount,
+                    SUM(expenses_count) as count
+                FROM daily_stats 
+                WHERE expenses_count > 0
                 GROUP BY month
                 ORDER BY month DESC
             """
@@ -785,7 +1083,7 @@ async def get_expenses_by_month(year: int = None, month: int = None) -> List[Dic
 
 async def update_expense(expense_id: int, expense_date: str = None, amount: int = None, category: str = None, description: str = None) -> bool:
     """Обновить расход"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         updates = []
         params = []
         
@@ -814,7 +1112,7 @@ async def update_expense(expense_id: int, expense_date: str = None, amount: int
 
 async def get_expense_by_id(expense_id: int) -> Optional[Dict]:
     """Получить расход по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,)) as cursor:
             row = await cursor.fetchone()
             if not row:
@@ -825,28 +1123,48 @@ async def get_expense_by_id(expense_id: int) -> Optional[Dict]:
 
 async def delete_expense(expense_id: int) -> bool:
     """Удалить расход"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("DELETE FROM expenses WHERE id = ?", (expense_id,)) as cursor:
             await db.commit()
             return cursor.rowcount > 0
 
 # Функции для работы с правилами ценообразования
+
+# Скомпилированный индекс правил; перестраивается только когда меняется
+# версия price_rules в table_versions (проверяем не чаще раза в секунду)
+PRICE_RULES_VERSION_TTL = 1.0
+_price_rule_index: Optional[PriceRuleIndex] = None
+_price_rules_version: Optional[int] = None
+_price_rules_checked_at = 0.0
+
+async def get_price_rule_index() -> PriceRuleIndex:
+    """Актуальный индекс правил ценообразования"""
+    global _price_rule_index, _price_rules_version, _price_rules_checked_at
+    now = monotonic()
+    if _price_rule_index is not None and now - _price_rules_checked_at <= PRICE_RULES_VERSION_TTL:
+        return _price_rule_index
+    
+    async with acquire() as db:
+        version = await _read_table_version(db, "price_rules")
+        if _price_rule_index is None or version != _price_rules_version:
+            async with db.execute("SELECT * FROM price_rules") as cursor:
+                rows = await cursor.fetchall()
+                columns = [column[0] for column in cursor.description]
+            _price_rule_index = PriceRuleIndex([dict(zip(columns, row)) for row in rows])
+            _price_rules_version = version
+    _price_rules_checked_at = now
+    return _price_rule_index
+
+def invalidate_price_rules():
+    """Перечитать версию правил при следующем обращении"""
+    global _price_rules_checked_at
+    _price_rules_checked_at = 0.0
+
 async def get_price_rule_for_booking(booking_date: str, booking_time: str) -> Optional[Dict]:
     """Получить правило ценообразования для конкретной даты и времени"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT * FROM price_rules 
-            WHERE start_date <= ? AND end_date >= ?
-            AND start_time <= ? AND end_time > ?
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (booking_date, booking_date, booking_time, booking_time)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                return None
-            
-            columns = [column[0] for column in cursor.description]
-            return dict(zip(columns, row))
+    index = await get_price_rule_index()
+    rule = index.lookup(booking_date, booking_time)
+    return dict(rule) if rule else None
 
 async def add_price_rule(
     start_date: str,
@@ -859,7 +1177,7 @@ async def add_price_rule(
     max_guests_included: int = 8
 ) -> int:
     """Добавить правило ценообразования"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         await db.execute("""
             INSERT INTO price_rules (
                 start_date, end_date, start_time, end_time,
@@ -874,13 +1192,14 @@ async def add_price_rule(
             datetime.now().isoformat(), datetime.now().isoformat()
         ))
         await db.commit()
+        invalidate_price_rules()
         
         async with db.execute("SELECT last_insert_rowid()") as cursor:
             return (await cursor.fetchone())[0]
 
 async def get_all_price_rules() -> List[Dict]:
     """Получить все правила ценообразования"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("""
             SELECT * FROM price_rules 
             ORDER BY start_date DESC, start_time DESC
@@ -891,7 +1210,7 @@ async def get_all_price_rules() -> List[Dict]:
 
 async def get_price_rule_by_id(rule_id: int) -> Optional[Dict]:
     """Получить правило по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("SELECT * FROM price_rules WHERE id = ?", (rule_id,)) as cursor:
             row = await cursor.fetchone()
             if not row:
@@ -912,7 +1231,7 @@ async def update_price_rule(
     max_guests_included: int = None
 ) -> bool:
     """Обновить правило ценообразования"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         updates = []
         params = []
         
@@ -952,19 +1271,21 @@ async def update_price_rule(
         
         async with db.execute(query, params) as cursor:
             await db.commit()
+            invalidate_price_rules()
             return cursor.rowcount > 0
 
 async def delete_price_rule(rule_id: int) -> bool:
     """Удалить правило ценообразования"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with acquire() as db:
         async with db.execute("DELETE FROM price_rules WHERE id = ?", (rule_id,)) as cursor:
             await db.commit()
+            invalidate_price_rules()
             return cursor.rowcount > 0
 
 # Функции для статистики
 async def get_revenue_by_month(year: int = None, month: int = None) -> List[Dict]:
-    """Получить выручку по месяцам"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Получить выручку по месяцам (по дневным агрегатам daily_stats)"""
+    async with acquire() as db:
         if year and month:
             # Конкретный месяц
             start_date = f"{year}-{month:02d}-01"
@@ -975,10 +1296,10 @@ async def get_revenue_by_month(year: int = None, month: int = None) -> List[Dict
             query = """
                 SELECT 
                     strftime('%Y-%m', date) as month,
-                    SUM(total_price) as total_revenue,
-                    COUNT(*) as bookings_count
-                FROM bookings 
-                WHERE date >= ? AND date < ? AND status != 'cancelled'
+                    SUM(revenue) as total_revenue,
+                    SUM(bookings) as bookings_count
+                FROM daily_stats 
+                WHERE date >= ? AND date < ? AND bookings > 0
                 GROUP BY month
             """
             async with db.execute(query, (start_date, end_date)) as cursor:
@@ -989,10 +1310,10 @@ async def get_revenue_by_month(year: int = None, month: int = None) -> List[Dict
             query = """
                 SELECT 
                     strftime('%Y-%m', date) as month,
-                    SUM(total_price) as total_revenue,
-                    COUNT(*) as bookings_count
-                FROM bookings 
-                WHERE status != 'cancelled'
+                    SUM(revenue) as total_revenue,
+                    SUM(bookings) as bookings_count
+                FROM daily_stats 
+                WHERE bookings > 0
                 GROUP BY month
                 ORDER BY month DESC
             """
@@ -1000,41 +1321,76 @@ async def get_revenue_by_month(year: int = None, month: int = None) -> List[Dict
                 rows = await cursor.fetchall()
                 return [{"month": row[0], "revenue": row[1] or 0, "bookings": row[2]} for row in rows]
 
+EXPORT_BATCH_SIZE = 500
+
+def _export_query(start_date: str = None, end_date: str = None, after: tuple = None):
+    """Запрос выгрузки бронирований с данными пользователей
+
+    after - ключ (date, time, id) последней выданной строки, выгрузка продолжается после него.
+    """
+    query = """
+        SELECT 
+            b.id,
+            b.date,
+            b.time,
+            b.guests,
+            b.duration,
+            b.total_price,
+            b.status,
+            b.notes,
+            b.created_at,
+            u.name,
+            u.phone,
+            u.telegram_id,
+            u.username
+        FROM bookings b
+        JOIN users u ON b.user_id = u.id
+        WHERE b.status != 'cancelled'
+    """
+    params = []
+    
+    if start_date:
+        query += " AND b.date >= ?"
+        params.append(start_date)
+    
+    if end_date:
+        query += " AND b.date <= ?"
+        params.append(end_date)
+    
+    if after:
+        query += " AND (b.date, b.time, b.id) > (?, ?, ?)"
+        params.extend(after)
+    
+    query += " ORDER BY b.date ASC, b.time ASC, b.id ASC"
+    return query, params
+
 async def get_bookings_for_export(start_date: str = None, end_date: str = None) -> List[Dict]:
     """Получить все бронирования с данными пользователей для экспорта"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        query = """
-            SELECT 
-                b.id,
-                b.date,
-                b.time,
-                b.guests,
-                b.duration,
-                b.total_price,
-                b.status,
-                b.notes,
-                b.created_at,
-                u.name,
-                u.phone,
-                u.telegram_id,
-                u.username
-            FROM bookings b
-            JOIN users u ON b.user_id = u.id
-            WHERE b.status != 'cancelled'
-        """
-        params = []
-        
-        if start_date:
-            query += " AND b.date >= ?"
-            params.append(start_date)
-        
-        if end_date:
-            query += " AND b.date <= ?"
-            params.append(end_date)
-        
-        query += " ORDER BY b.date ASC, b.time ASC"
-        
+    query, params = _export_query(start_date, end_date)
+    async with acquire() as db:
         async with db.execute(query, params) as cursor:
             rows = await cursor.fetchall()
             columns = [column[0] for column in cursor.description]
-            return [dict(zip(columns, row)) for row in rows] 
\ No newline at end of file
+            return [dict(zip(columns, row)) for row in rows]
+
+async def iter_bookings_for_export(start_date: str = None, end_date: str = None,
+                                   batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[tuple]]:
+    """Те же бронирования, что и в get_bookings_for_export, пачками из курсора
+
+    Колонки идут в порядке запроса выгрузки. В памяти держится только
+    одна пачка, поэтому выгрузка не растет с числом броней. Каждая пачка
+    читается отдельным запросом по ключу (date, time, id), и подключение
+    возвращается в пул до yield: остановка потребителя на середине его не держит.
+    """
+    after = None
+    while True:
+        query, params = _export_query(start_date, end_date, after)
+        async with acquire() as db:
+            async with db.execute(query + " LIMIT ?", params + [batch_size]) as cursor:
+                rows = await cursor.fetchall()
+        if not rows:
+            break
+        yield rows
+        if len(rows) < batch_size:
+            break
+        after = (rows[-1][1], rows[-1][2], rows[-1][0])
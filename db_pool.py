@@ -0,0 +1,436 @@
+"""
+Общий пул подключений к базе данных антикафе.
+
+Вместо того чтобы открывать новое подключение (а в aiosqlite это ещё и новый
+поток) на каждый запрос, боты берут готовое подключение из пула:
+
+    async with acquire() as db:
+        async with db.execute("SELECT ...") as cursor:
+            ...
+
+Каждое подключение при создании настраивается одинаково (WAL, busy_timeout,
+synchronous=NORMAL). Для синхронного Flask-сервера есть такой же пул
+на sqlite3 — get_sync_connection():
+
+    with get_sync_connection() as conn:
+        conn.execute("UPDATE ...")
+        conn.commit()
+
+Выход из with возвращает подключение в пул даже при исключении, а
+незафиксированная транзакция откатывается. Если все подключения заняты
+дольше DB_POOL_TIMEOUT секунд, выбрасывается PoolTimeoutError.
+
+С DB_DEBUG_BLOCKING=1 включается детектор блокирующих вызовов: каждый
+запрос sqlite3, выполненный прямо в потоке цикла событий (а не в потоке
+aiosqlite), печатается с местом вызова.
+"""
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import aiosqlite
+
+DB_PATH = "chillivili.db"
+
+# Размер пула и таймаут ожидания блокировки можно переопределить через окружение
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Сколько ждать свободное подключение синхронного пула (секунды)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Отладка: сообщать о синхронных запросах sqlite3 в цикле событий
+DB_DEBUG_BLOCKING = os.getenv("DB_DEBUG_BLOCKING", "").lower() in ("1", "true", "yes")
+
+# Настройки, которые применяются к каждому новому подключению
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous=NORMAL",
+)
+
+# Подключение, которое уже держит текущая задача (для вложенных acquire)
+_held_connection: ContextVar[Optional[tuple]] = ContextVar("_held_connection", default=None)
+
+
+def apply_pragmas(conn: sqlite3.Connection):
+    """Применить стандартные PRAGMA к синхронному подключению"""
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
+
+# Детектор блокирующих вызовов: место вызова -> количество
+_blocking_calls: Dict[str, int] = {}
+_original_connect = None
+
+
+def _on_event_loop() -> bool:
+    """Выполняется ли код в потоке с работающим циклом событий"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _report_blocking(what: str):
+    """Запомнить и напечатать блокирующий вызов (один раз на место вызова)"""
+    if not _on_event_loop():
+        return
+    location = "?"
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename != __file__:
+            location = f"{os.path.basename(frame.filename)}:{frame.lineno} ({frame.name})"
+            break
+    count = _blocking_calls.get(location, 0)
+    _blocking_calls[location] = count + 1
+    if count == 0:
+        print(f"[db] ⚠️ Блокирующий вызов sqlite3 в цикле событий: {location}: {what.strip()[:80]}")
+
+
+def enable_blocking_detector():
+    """Следить за синхронными запросами sqlite3 в потоке цикла событий
+
+    Подменяет sqlite3.connect: новые подключения получают trace-callback,
+    который вызывается в потоке, выполняющем запрос. Запросы aiosqlite
+    идут в его собственном потоке и не считаются.
+    """
+    global _original_connect
+    if _original_connect is not None:
+        return
+    _original_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        _report_blocking("connect")
+        conn = _original_connect(*args, **kwargs)
+        conn.set_trace_callback(_report_blocking)
+        return conn
+
+    sqlite3.connect = connect
+
+
+def get_blocking_stats() -> Dict[str, int]:
+    """Найденные блокирующие вызовы: место вызова -> количество"""
+    return dict(_blocking_calls)
+
+
+if DB_DEBUG_BLOCKING:
+    enable_blocking_detector()
+
+
+class ConnectionPool:
+    """Пул асинхронных подключений aiosqlite с метриками ожидания"""
+
+    def __init__(self, db_path: str = DB_PATH, size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._idle = []
+        self._waiters = deque()
+        self._created = 0
+        self._closed = False
+        # Метрики
+        self.checkouts = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def _open(self) -> aiosqlite.Connection:
+        """Открыть и настроить новое подключение"""
+        conn = aiosqlite.connect(self.db_path)
+        # Поток подключения не должен мешать завершению процесса
+        conn.daemon = True
+        await conn
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def _checkout(self) -> aiosqlite.Connection:
+        """Взять подключение: свободное, новое или дождаться освобождения"""
+        if self._idle:
+            return self._idle.pop()
+
+        if self._created < self.size:
+            self._created += 1
+            try:
+                return await self._open()
+            except Exception:
+                self._created -= 1
+                raise
+
+        self.waits += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # Подключение могли передать нам в момент отмены - возвращаем его в пул
+            if waiter.done() and not waiter.cancelled():
+                self._checkin(waiter.result())
+            raise
+
+    def _checkin(self, conn: aiosqlite.Connection):
+        """Вернуть подключение в пул или сразу отдать ожидающему"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            try:
+                waiter.set_result(conn)
+                return
+            except RuntimeError:
+                # Цикл событий ожидающего уже закрыт
+                continue
+        self._idle.append(conn)
+
+    async def _release(self, conn: aiosqlite.Connection):
+        """Завершить незакоммиченную транзакцию и вернуть подключение"""
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+        except Exception as e:
+            print(f"Ошибка при возврате подключения в пул: {e}")
+            self._created -= 1
+            try:
+                await conn.close()
+            except Exception:
+                pass
+            return
+
+        if self._closed:
+            self._created -= 1
+            await conn.close()
+            return
+
+        self._checkin(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Получить подключение из пула на время блока async with"""
+        task = asyncio.current_task()
+        held = _held_connection.get()
+        if held and held[0] is self and held[1] is task:
+            # Вложенный вызов внутри той же задачи - используем то же подключение
+            yield held[2]
+            return
+
+        started = time.perf_counter()
+        conn = await self._checkout()
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+        token = _held_connection.set((self, task, conn))
+        try:
+            yield conn
+        finally:
+            try:
+                _held_connection.reset(token)
+            except ValueError:
+                # Генератор закрыт в другом контексте (например, сборщиком мусора):
+                # токен оттуда не сбросить, снимаем отметку вручную
+                _held_connection.set(None)
+            await self._release(conn)
+
+    async def close(self):
+        """Закрыть все свободные подключения"""
+        self._closed = True
+        while self._idle:
+            conn = self._idle.pop()
+            self._created -= 1
+            try:
+                await conn.close()
+            except Exception as e:
+                print(f"Ошибка при закрытии подключения: {e}")
+
+    def get_stats(self) -> Dict:
+        """Метрики пула"""
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": len(self._idle),
+            "in_use": self._created - len(self._idle),
+            "waiting": sum(1 for w in self._waiters if not w.done()),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "avg_wait_ms": (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Свободное подключение не появилось за отведенное время"""
+
+
+class SyncConnectionPool:
+    """Пул синхронных подключений sqlite3 для Flask-сервера"""
+
+    def __init__(self, db_path: str = DB_PATH, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        # Метрики
+        self.checkouts = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn)
+        return conn
+
+    def acquire(self) -> "PooledConnection":
+        """Получить подключение; with (или conn.close()) вернёт его обратно в пул"""
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                self.waits += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeoutError(
+                        f"Нет свободного подключения к базе за {self.timeout:g} с "
+                        f"(занято {self.size}, DB_POOL_SIZE)"
+                    ) from None
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        """Вернуть подключение в пул"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            print(f"Ошибка при возврате подключения в пул: {e}")
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def get_stats(self) -> Dict:
+        """Метрики пула"""
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "avg_wait_ms": (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class PooledConnection:
+    """Обёртка над sqlite3.Connection: close() или выход из with возвращает подключение в пул.
+
+    В отличие от самого sqlite3.Connection, with не фиксирует транзакцию:
+    commit() нужно вызвать явно, иначе изменения откатятся при возврате.
+    """
+
+    def __init__(self, pool: SyncConnectionPool, conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Подключение уже возвращено в пул")
+        return getattr(self._conn, name)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+_pool: Optional[ConnectionPool] = None
+_sync_pool: Optional[SyncConnectionPool] = None
+
+
+def configure(db_path: str = None, size: int = None):
+    """Изменить путь к базе или размер пулов (до первого использования)"""
+    global DB_PATH, DB_POOL_SIZE, _pool, _sync_pool
+    if db_path is not None:
+        DB_PATH = db_path
+    if size is not None:
+        DB_POOL_SIZE = size
+    _pool = None
+    _sync_pool = None
+
+
+def get_pool() -> ConnectionPool:
+    """Получить общий асинхронный пул процесса"""
+    global _pool
+    if _pool is None or _pool._closed:
+        _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    return _pool
+
+
+def acquire():
+    """Сокращение для get_pool().acquire()"""
+    return get_pool().acquire()
+
+
+async def close_pool():
+    """Закрыть общий асинхронный пул (при остановке ботов)"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_sync_pool() -> SyncConnectionPool:
+    """Получить общий синхронный пул процесса"""
+    global _sync_pool
+    if _sync_pool is None:
+        _sync_pool = SyncConnectionPool(DB_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+    return _sync_pool
+
+
+def get_sync_connection() -> PooledConnection:
+    """Синхронное подключение из пула (row_factory = sqlite3.Row): with get_sync_connection() as conn"""
+    return get_sync_pool().acquire()
+
+
+def get_pool_stats() -> Dict:
+    """Метрики обоих пулов для диагностики"""
+    return {
+        "async": _pool.get_stats() if _pool is not None else None,
+        "sync": _sync_pool.get_stats() if _sync_pool is not None else None,
+    }
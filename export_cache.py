@@ -0,0 +1,140 @@
+"""
+Кэш сформированных файлов выгрузки (PDF, CSV, XLSX).
+
+Ключ файла - хэш от формата, периода и версии данных за этот период:
+суммы версий дней из booking_day_versions. Триггеры увеличивают версию
+дня при любом изменении его броней, а также при изменении имени, телефона
+или Telegram пользователя - только для дней, где у него есть брони.
+Пока данные периода не менялись, повторная выгрузка отдает готовый файл,
+а после первой отправки - и file_id Telegram, без повторной загрузки.
+Закрытые прошлые месяцы не меняются, поэтому формируются один раз.
+
+Файлы лежат в EXPORT_CACHE_DIR; если их суммарный размер превышает
+EXPORT_CACHE_MAX_MB, удаляются давно не использованные (LRU).
+"""
+import hashlib
+import os
+import shutil
+from datetime import datetime
+from typing import Optional, Tuple
+
+from db_pool import acquire
+
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "export_cache"))
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "200"))
+# Увеличить при изменении вида выгрузок, чтобы старые файлы не отдавались
+EXPORT_LAYOUT_VERSION = 1
+
+
+async def get_data_version(start_date: str = None, end_date: str = None) -> str:
+    """Версия данных выгрузки за период (меняется при любом изменении броней периода)"""
+    query = "SELECT COALESCE(SUM(version), 0) FROM booking_day_versions WHERE 1 = 1"
+    params = []
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+
+    async with acquire() as db:
+        async with db.execute(query, params) as cursor:
+            days_version = (await cursor.fetchone())[0]
+    return str(days_version)
+
+
+async def make_key(export_format: str, start_date: str = None, end_date: str = None) -> str:
+    """Ключ кэша для выгрузки периода в формате export_format"""
+    data_version = await get_data_version(start_date, end_date)
+    raw = f"{EXPORT_LAYOUT_VERSION}|{export_format}|{start_date or ''}|{end_date or ''}|{data_version}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def lookup(cache_key: str) -> Optional[Tuple[str, Optional[str]]]:
+    """(путь к файлу, file_id) из кэша или None"""
+    async with acquire() as db:
+        async with db.execute(
+            "SELECT filepath, file_id FROM export_cache WHERE cache_key = ?", (cache_key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            return None
+
+        filepath, file_id = row
+        if not os.path.exists(filepath):
+            # Файл удалили вручную - запись больше не нужна
+            await db.execute("DELETE FROM export_cache WHERE cache_key = ?", (cache_key,))
+            await db.commit()
+            return None
+
+        await db.execute(
+            "UPDATE export_cache SET last_used_at = ? WHERE cache_key = ?",
+            (datetime.now().isoformat(), cache_key)
+        )
+        await db.commit()
+        return filepath, file_id
+
+
+async def store(cache_key: str, source_path: str, extension: str) -> str:
+    """Перенести сформированный файл в кэш, вернуть его новый путь"""
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    filepath = os.path.join(EXPORT_CACHE_DIR, f"{cache_key}.{extension}")
+    shutil.move(source_path, filepath)
+    size = os.path.getsize(filepath)
+    now = datetime.now().isoformat()
+
+    async with acquire() as db:
+        await db.execute("""
+            INSERT INTO export_cache (cache_key, filepath, size, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                filepath = excluded.filepath,
+                size = excluded.size,
+                file_id = NULL,
+                last_used_at = excluded.last_used_at
+        """, (cache_key, filepath, size, now, now))
+        await db.commit()
+
+    await evict(keep_key=cache_key)
+    return filepath
+
+
+async def remember_file_id(cache_key: str, file_id: str):
+    """Запомнить file_id Telegram после первой отправки файла"""
+    async with acquire() as db:
+        await db.execute("UPDATE export_cache SET file_id = ? WHERE cache_key = ?", (file_id, cache_key))
+        await db.commit()
+
+
+async def evict(keep_key: str = None, max_bytes: int = None) -> int:
+    """Удалить давно не использованные файлы сверх лимита, вернуть число удаленных"""
+    if max_bytes is None:
+        max_bytes = EXPORT_CACHE_MAX_MB * 1024 * 1024
+
+    async with acquire() as db:
+        async with db.execute("SELECT COALESCE(SUM(size), 0) FROM export_cache") as cursor:
+            total = (await cursor.fetchone())[0]
+        if total <= max_bytes:
+            return 0
+
+        async with db.execute(
+            "SELECT cache_key, filepath, size FROM export_cache ORDER BY last_used_at ASC"
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        removed = []
+        for cache_key, filepath, size in rows:
+            if total <= max_bytes:
+                break
+            if cache_key == keep_key:
+                continue
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+            removed.append((cache_key,))
+            total -= size
+
+        await db.executemany("DELETE FROM export_cache WHERE cache_key = ?", removed)
+        await db.commit()
+    return len(removed)
@@ -0,0 +1,66 @@
+"""
+Общий HTTP-клиент процесса для запросов к Telegram.
+
+Раньше каждое уведомление и каждая загрузка медиа открывали свою
+aiohttp.ClientSession, то есть заново устанавливали TCP+TLS соединение
+с api.telegram.org. Теперь в процессе одна сессия с пулом keep-alive
+соединений и кэшем DNS, а экземпляры Bot для служебных вызовов
+создаются один раз на токен. Всё закрывается в close_http
+(main.BotManager.shutdown).
+"""
+import os
+from typing import Dict, Optional
+
+import aiohttp
+from aiogram import Bot
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+# Сколько держать открытым простаивающее соединение и адрес из DNS (секунды)
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_DNS_CACHE_TTL = 300
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+_session: Optional[aiohttp.ClientSession] = None
+_bots: Dict[str, Bot] = {}
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Общая сессия процесса (создается при первом обращении)"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+    return _session
+
+
+def get_bot(token: str) -> Bot:
+    """Один экземпляр Bot на токен: его сессия aiogram тоже переиспользуется"""
+    bot = _bots.get(token)
+    if bot is None:
+        bot = Bot(token=token)
+        _bots[token] = bot
+    return bot
+
+
+async def telegram_post(token: str, method: str, payload: Dict, timeout: float = 5) -> aiohttp.ClientResponse:
+    """POST к Bot API через общую сессию; тело ответа прочитано"""
+    url = f"{TELEGRAM_API_URL}/bot{token}/{method}"
+    async with get_http_session().post(url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        await resp.read()
+        return resp
+
+
+async def close_http():
+    """Закрыть общую сессию и сессии служебных ботов (при остановке)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    for bot in _bots.values():
+        await bot.session.close()
+    _bots.clear()
@@ -15,6 +15,7 @@ except Exception as e:
 
 import asyncio
 import logging
+import os
 import signal
 import sys
 from pathlib import Path
@@ -35,6 +36,12 @@ logger = logging.getLogger(__name__)
 try:
     from bot import main as bot_main
     from admin_bot import main as admin_bot_main
+    from db import init_db
+    from db_pool import close_pool, get_pool_stats
+    from pdf_export import shutdown_executor
+    from http_client import close_http
+    from outbox import BOT_ADMIN, BOT_MAIN, start_worker as start_outbox_worker, stop_worker as stop_outbox_worker
+    from broadcast import stop_all as stop_broadcasts
 except ImportError as e:
     logger.error(f"Ошибка импорта модулей: {e}")
     logger.error("Убедитесь, что файлы bot.py и admin_bot.py находятся в той же директории")
@@ -52,6 +59,15 @@ class BotManager:
         logger.info("🚀 Запуск системы ЧиллиВили...")
         
         try:
+            # Схема и начальные данные - один раз для обоих ботов
+            await init_db()
+            
+            # Отправка уведомлений из outbox (один воркер на процесс ботов)
+            start_outbox_worker({
+                BOT_ADMIN: os.getenv("ADMIN_BOT_TOKEN"),
+                BOT_MAIN: os.getenv("API_TOKEN"),
+            })
+            
             # Создаем задачи для каждого бота
             bot_task = asyncio.create_task(
                 self._run_with_error_handling(bot_main, "Основной бот")
@@ -94,6 +110,22 @@ class BotManager:
         # Ждем завершения отмены
         await asyncio.gather(*self.tasks, return_exceptions=True)
         
+        # Останавливаем воркер outbox: неотправленное останется в очереди до следующего запуска
+        await stop_outbox_worker()
+        
+        # Приостанавливаем рассылки после текущей пачки: их можно продолжить после запуска
+        await stop_broadcasts()
+        
+        # Закрываем подключения к базе данных
+        logger.info(f"📊 Пул подключений к БД: {get_pool_stats()['async']}")
+        await close_pool()
+        
+        # Останавливаем процесс выгрузки PDF
+        shutdown_executor()
+        
+        # Закрываем общие HTTP-соединения с Telegram
+        await close_http()
+        
         logger.info("✅ Система корректно завершена")
 
 def setup_signal_handlers(bot_manager):
@@ -0,0 +1,88 @@
+"""
+Перенос фото и видео из админ-бота в основной бот.
+
+file_id одного бота недействителен в другом, поэтому файл нужно заново
+загрузить через основной бот. URLInputFile читает файл со ссылки Telegram
+кусками и сразу передает их в запрос отправки - файл целиком в памяти
+не держится. Полученный file_id основного бота сохраняется в
+media_file_cache по file_unique_id исходного файла (он одинаков для всех
+ботов), поэтому повторная загрузка того же файла не требует ни скачивания,
+ни отправки. Экземпляры Bot берутся из http_client и переиспользуются.
+"""
+import os
+from datetime import datetime
+from typing import Optional
+
+from aiogram.types import URLInputFile
+
+import http_client
+from db_pool import acquire
+
+MEDIA_PHOTO = "photo"
+MEDIA_VIDEO = "video"
+
+# Таймауты чтения файла со ссылки и загрузки в основной бот (секунды)
+MEDIA_DOWNLOAD_TIMEOUT = 120
+MEDIA_UPLOAD_TIMEOUT = 300
+
+
+async def get_cached_file_id(file_unique_id: str, media_type: str) -> Optional[str]:
+    """file_id основного бота для уже перенесенного файла"""
+    async with acquire() as db:
+        async with db.execute(
+            "SELECT file_id FROM media_file_cache WHERE file_unique_id = ? AND media_type = ?",
+            (file_unique_id, media_type)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+
+async def remember_file_id(file_unique_id: str, media_type: str, file_id: str):
+    """Запомнить file_id основного бота для исходного файла"""
+    async with acquire() as db:
+        await db.execute("""
+            INSERT OR REPLACE INTO media_file_cache (file_unique_id, media_type, file_id, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (file_unique_id, media_type, file_id, datetime.now().isoformat()))
+        await db.commit()
+
+
+async def transfer_media(file_id: str, file_unique_id: str, media_type: str,
+                         source_token: str, target_token: str, chat_id: int) -> str:
+    """Вернуть file_id основного бота для файла из админ-бота.
+
+    Файл отправляется в chat_id через основной бот и сразу удаляется,
+    если его file_id еще нет в кэше.
+    """
+    cached = await get_cached_file_id(file_unique_id, media_type)
+    if cached:
+        return cached
+
+    source = http_client.get_bot(source_token)
+    target = http_client.get_bot(target_token)
+    file = await source.get_file(file_id)
+    url = f"{http_client.TELEGRAM_API_URL}/file/bot{source_token}/{file.file_path}"
+    upload = URLInputFile(
+        url, filename=os.path.basename(file.file_path), timeout=MEDIA_DOWNLOAD_TIMEOUT, bot=target
+    )
+
+    if media_type == MEDIA_PHOTO:
+        sent = await target.send_photo(
+            chat_id, photo=upload, disable_notification=True, request_timeout=MEDIA_UPLOAD_TIMEOUT
+        )
+        new_file_id = sent.photo[-1].file_id
+    elif media_type == MEDIA_VIDEO:
+        sent = await target.send_video(
+            chat_id, video=upload, disable_notification=True, request_timeout=MEDIA_UPLOAD_TIMEOUT
+        )
+        new_file_id = sent.video.file_id
+    else:
+        raise ValueError(f"Неизвестный тип медиа: {media_type}")
+
+    try:
+        await target.delete_message(chat_id=chat_id, message_id=sent.message_id)
+    except Exception as e:
+        print(f"[media] не удалось удалить временное сообщение: {e}")
+
+    await remember_file_id(file_unique_id, media_type, new_file_id)
+    return new_file_id
@@ -0,0 +1,589 @@
+"""
+Версионные миграции схемы базы данных.
+
+Номер применённой миграции хранится в PRAGMA user_version. Каждая миграция
+выполняется один раз; все ожидающие миграции применяются в одной транзакции
+BEGIN IMMEDIATE, поэтому два бота, стартующие одновременно, не применят
+одну и ту же миграцию дважды.
+
+Чтобы изменить схему, добавьте новую функцию в конец списка MIGRATIONS.
+Уже выпущенные миграции не редактируются.
+"""
+from typing import List
+
+
+async def _get_columns(db, table: str) -> List[str]:
+    """Получить имена колонок таблицы"""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        return [row[1] for row in await cursor.fetchall()]
+
+
+async def _add_column_if_missing(db, table: str, column: str, definition: str):
+    """Добавить колонку, если её ещё нет"""
+    if column not in await _get_columns(db, table):
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def _migration_1_base_schema(db):
+    """Базовые таблицы антикафе"""
+    # Таблица пользователей
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT,
+            telegram_id INTEGER UNIQUE,
+            username TEXT,
+            created_at TEXT
+        )
+    ''')
+
+    # Таблица бронирований
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            guests INTEGER NOT NULL,
+            duration INTEGER NOT NULL,
+            total_price INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            notes TEXT,
+            created_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Таблица временных слотов
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS time_slots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            time TEXT NOT NULL UNIQUE
+        )
+    ''')
+
+    # Таблица зон антикафе
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS zones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            capacity INTEGER NOT NULL
+        )
+    ''')
+
+    # Таблица настроек бота
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setting_key TEXT UNIQUE NOT NULL,
+            setting_value TEXT,
+            setting_type TEXT DEFAULT 'text',
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+    # Таблица расходов
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            category TEXT,
+            description TEXT,
+            created_at TEXT
+        )
+    ''')
+
+    # Таблица правил ценообразования
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS price_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            price_per_hour INTEGER NOT NULL,
+            price_per_extra_guest INTEGER NOT NULL,
+            extra_guest_payment_type TEXT NOT NULL DEFAULT 'per_booking',
+            max_guests_included INTEGER NOT NULL DEFAULT 8,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+
+async def _migration_2_missing_columns(db):
+    """Колонки, которых нет в базах, созданных старыми версиями ботов"""
+    await _add_column_if_missing(db, "users", "username", "TEXT")
+    await _add_column_if_missing(db, "bookings", "notes", "TEXT")
+
+
+async def _migration_3_user_names(db):
+    """Пустые имена пользователей заменяем на значение по умолчанию"""
+    await db.execute("UPDATE users SET name = 'Пользователь' WHERE name IS NULL")
+
+
+async def _migration_4_indexes(db):
+    """Индексы для частых выборок по дате, пользователю и телефону"""
+    # Доступное время, брони на день: WHERE date = ? AND status != 'cancelled'
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_date_status
+        ON bookings (date, status, time, duration)
+    ''')
+    # Брони пользователя
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_user_status
+        ON bookings (user_id, status)
+    ''')
+    # Поиск пользователя по телефону (веб-приложение)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_phone ON users (phone)")
+    # Расходы за период
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date)")
+    # Правило цены для даты
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_price_rules_dates
+        ON price_rules (start_date, end_date)
+    ''')
+
+
+async def _migration_5_table_versions(db):
+    """Счетчик версий таблицы bookings для кэша доступности"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    await db.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('bookings', 0)")
+    # Триггеры увеличивают версию при любой записи, в том числе из другого процесса
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        await db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_bookings_version_{event.lower()}
+            AFTER {event} ON bookings
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'bookings';
+            END
+        ''')
+
+
+async def _migration_6_settings_version(db):
+    """Счетчик версий настроек бота для кэша настроек"""
+    await db.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('bot_settings', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        await db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_bot_settings_version_{event.lower()}
+            AFTER {event} ON bot_settings
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'bot_settings';
+            END
+        ''')
+
+
+async def _migration_7_price_rules_version(db):
+    """Счетчик версий правил ценообразования для индекса цен"""
+    await db.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('price_rules', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        await db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_price_rules_version_{event.lower()}
+            AFTER {event} ON price_rules
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'price_rules';
+            END
+        ''')
+
+
+async def _migration_8_admins(db):
+    """Таблица администраторов (раньше создавалась админ-ботом при старте)"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            username TEXT,
+            name TEXT,
+            role TEXT DEFAULT 'admin',
+            created_at TEXT,
+            created_by INTEGER
+        )
+    ''')
+
+
+async def _migration_9_daily_stats(db):
+    """Дневные агрегаты броней и расходов для статистики"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            date TEXT PRIMARY KEY,
+            bookings INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            guests INTEGER NOT NULL DEFAULT 0,
+            hours INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0,
+            expenses_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Брони учитываются, пока они не отменены
+    add_booking = '''
+        INSERT INTO daily_stats (date, bookings, revenue, guests, hours)
+        SELECT NEW.date, 1, NEW.total_price, NEW.guests, NEW.duration
+        WHERE NEW.status != 'cancelled'
+        ON CONFLICT (date) DO UPDATE SET
+            bookings = bookings + 1,
+            revenue = revenue + excluded.revenue,
+            guests = guests + excluded.guests,
+            hours = hours + excluded.hours;
+    '''
+    remove_booking = '''
+        UPDATE daily_stats SET
+            bookings = bookings - 1,
+            revenue = revenue - OLD.total_price,
+            guests = guests - OLD.guests,
+            hours = hours - OLD.duration
+        WHERE date = OLD.date AND OLD.status != 'cancelled';
+    '''
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_stats_bookings_insert
+        AFTER INSERT ON bookings
+        BEGIN {add_booking} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_stats_bookings_update
+        AFTER UPDATE OF date, status, total_price, guests, duration ON bookings
+        BEGIN {remove_booking} {add_booking} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_stats_bookings_delete
+        AFTER DELETE ON bookings
+        BEGIN {remove_booking} END
+    """)
+
+    add_expense = '''
+        INSERT INTO daily_stats (date, expenses, expenses_count)
+        VALUES (NEW.date, NEW.amount, 1)
+        ON CONFLICT (date) DO UPDATE SET
+            expenses = expenses + excluded.expenses,
+            expenses_count = expenses_count + 1;
+    '''
+    remove_expense = '''
+        UPDATE daily_stats SET
+            expenses = expenses - OLD.amount,
+            expenses_count = expenses_count - 1
+        WHERE date = OLD.date;
+    '''
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_stats_expenses_insert
+        AFTER INSERT ON expenses
+        BEGIN {add_expense} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_stats_expenses_update
+        AFTER UPDATE OF date, amount ON expenses
+        BEGIN {remove_expense} {add_expense} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_stats_expenses_delete
+        AFTER DELETE ON expenses
+        BEGIN {remove_expense} END
+    """)
+
+    # Заполняем по уже существующим данным
+    await db.execute("DELETE FROM daily_stats")
+    await db.execute('''
+        INSERT INTO daily_stats (date, bookings, revenue, guests, hours)
+        SELECT date, COUNT(*), COALESCE(SUM(total_price), 0), COALESCE(SUM(guests), 0), COALESCE(SUM(duration), 0)
+        FROM bookings
+        WHERE status != 'cancelled'
+        GROUP BY date
+    ''')
+    await db.execute('''
+        INSERT INTO daily_stats (date, expenses, expenses_count)
+        SELECT date, COALESCE(SUM(amount), 0), COUNT(*)
+        FROM expenses
+        WHERE true
+        GROUP BY date
+        ON CONFLICT (date) DO UPDATE SET
+            expenses = excluded.expenses,
+            expenses_count = excluded.expenses_count
+    ''')
+
+
+async def _migration_10_booking_end_at(db):
+    """Время окончания брони end_at с индексом для выборок по периоду"""
+    await _add_column_if_missing(db, "bookings", "end_at", "TEXT")
+    end_at = "datetime(NEW.date || ' ' || NEW.time, '+' || NEW.duration || ' hours')"
+    # end_at не входит в список колонок UPDATE OF, поэтому триггер не зацикливается
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_end_at_insert
+        AFTER INSERT ON bookings
+        BEGIN
+            UPDATE bookings SET end_at = {end_at} WHERE id = NEW.id;
+        END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_end_at_update
+        AFTER UPDATE OF date, time, duration ON bookings
+        BEGIN
+            UPDATE bookings SET end_at = {end_at} WHERE id = NEW.id;
+        END
+    ''')
+    await db.execute('''
+        UPDATE bookings SET end_at = datetime(date || ' ' || time, '+' || duration || ' hours')
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_end_at ON bookings (end_at)")
+
+
+async def _migration_11_bookings_date_time_index(db):
+    """Индекс для постраничного просмотра броней по (date, time, id)"""
+    # id - это rowid, он входит в любой индекс таблицы
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_date_time ON bookings (date, time)")
+
+
+async def _migration_12_booking_day_versions(db):
+    """Версии броней по дням и счетчик изменений пользователей для кэша выгрузок"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS booking_day_versions (
+            date TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    bump = '''
+        INSERT INTO booking_day_versions (date, version) VALUES ({day}, 1)
+        ON CONFLICT (date) DO UPDATE SET version = version + 1;
+    '''
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_day_versions_insert
+        AFTER INSERT ON bookings
+        BEGIN {bump.format(day="NEW.date")} END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_day_versions_update
+        AFTER UPDATE ON bookings
+        BEGIN {bump.format(day="OLD.date")} {bump.format(day="NEW.date")} END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_day_versions_delete
+        AFTER DELETE ON bookings
+        BEGIN {bump.format(day="OLD.date")} END
+    ''')
+
+    # Имя, телефон и Telegram пользователя тоже попадают в выгрузку
+    await db.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('users', 0)")
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_version_update
+        AFTER UPDATE OF name, phone, telegram_id, username ON users
+        WHEN OLD.name IS NOT NEW.name OR OLD.phone IS NOT NEW.phone
+            OR OLD.telegram_id IS NOT NEW.telegram_id OR OLD.username IS NOT NEW.username
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'users';
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_version_delete
+        AFTER DELETE ON users
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'users';
+        END
+    ''')
+
+
+async def _migration_13_export_cache(db):
+    """Кэш сформированных файлов выгрузки"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS export_cache (
+            cache_key TEXT PRIMARY KEY,
+            filepath TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            file_id TEXT,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_export_cache_last_used ON export_cache (last_used_at)")
+
+
+async def _migration_14_notification_log(db):
+    """Журнал доставки служебных уведомлений"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS notification_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            ok INTEGER NOT NULL,
+            status INTEGER,
+            error TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notification_log_created ON notification_log (created_at)")
+
+
+async def _migration_15_outbox(db):
+    """Очередь исходящих уведомлений (outbox)"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bot TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (status, next_attempt_at)")
+
+
+async def _migration_16_broadcasts(db):
+    """Рассылки по сегментам пользователей с точкой продолжения"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            segment_days INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    ''')
+    # Кому уже отправлено: один чат получает рассылку не больше одного раза
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            broadcast_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            ok INTEGER NOT NULL,
+            error TEXT,
+            PRIMARY KEY (broadcast_id, chat_id)
+        )
+    ''')
+
+
+async def _migration_17_outbox_events(db):
+    """Тип события в outbox для дайджеста уведомлений админам"""
+    await _add_column_if_missing(db, "outbox", "event", "TEXT")
+
+
+async def _migration_18_media_file_cache(db):
+    """file_id основного бота для медиа, загруженных через админ-бот"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS media_file_cache (
+            file_unique_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (file_unique_id, media_type)
+        )
+    ''')
+
+
+async def _migration_19_outbox_leases(db):
+    """Аренда очереди outbox: один воркер на бота для всей базы"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS outbox_leases (
+            bot TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )
+    ''')
+
+
+async def _migration_20_user_booking_days(db):
+    """Изменение пользователя меняет версии только тех дней, где есть его брони"""
+    # Общий счетчик users сбрасывал кэш всех выгрузок, включая закрытые месяцы
+    await db.execute("DROP TRIGGER IF EXISTS trg_users_version_update")
+    await db.execute("DROP TRIGGER IF EXISTS trg_users_version_delete")
+    await db.execute("DELETE FROM table_versions WHERE name = 'users'")
+    bump = '''
+        INSERT INTO booking_day_versions (date, version)
+        SELECT DISTINCT date, 1 FROM bookings WHERE user_id = {user}
+        ON CONFLICT (date) DO UPDATE SET version = version + 1;
+    '''
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_users_booking_days_update
+        AFTER UPDATE OF name, phone, telegram_id, username ON users
+        WHEN OLD.name IS NOT NEW.name OR OLD.phone IS NOT NEW.phone
+            OR OLD.telegram_id IS NOT NEW.telegram_id OR OLD.username IS NOT NEW.username
+        BEGIN {bump.format(user="NEW.id")} END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_users_booking_days_delete
+        AFTER DELETE ON users
+        BEGIN {bump.format(user="OLD.id")} END
+    ''')
+
+
+# Порядок важен: номер миграции = позиция в списке + 1
+MIGRATIONS = [
+    _migration_1_base_schema,
+    _migration_2_missing_columns,
+    _migration_3_user_names,
+    _migration_4_indexes,
+    _migration_5_table_versions,
+    _migration_6_settings_version,
+    _migration_7_price_rules_version,
+    _migration_8_admins,
+    _migration_9_daily_stats,
+    _migration_10_booking_end_at,
+    _migration_11_bookings_date_time_index,
+    _migration_12_booking_day_versions,
+    _migration_13_export_cache,
+    _migration_14_notification_log,
+    _migration_15_outbox,
+    _migration_16_broadcasts,
+    _migration_17_outbox_events,
+    _migration_18_media_file_cache,
+    _migration_19_outbox_leases,
+    _migration_20_user_booking_days,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version(db) -> int:
+    """Текущая версия схемы базы"""
+    async with db.execute("PRAGMA user_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def apply_pending_migrations(db) -> int:
+    """Применить недостающие миграции внутри уже открытой транзакции
+
+    Вызывающий код должен держать BEGIN IMMEDIATE: версия перечитывается
+    под блокировкой, потому что другой процесс мог успеть раньше.
+    Возвращает количество применённых миграций.
+    """
+    current = await get_schema_version(db)
+    applied = 0
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        await migration(db)
+        await db.execute(f"PRAGMA user_version = {version}")
+        print(f"[db] Применена миграция {version}: {migration.__doc__}")
+        applied += 1
+    return applied
+
+
+async def run_migrations(db) -> int:
+    """Применить все недостающие миграции, вернуть итоговую версию схемы"""
+    if await get_schema_version(db) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        await apply_pending_migrations(db)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    return SCHEMA_VERSION
@@ -0,0 +1,68 @@
+"""
+Отправка сообщений через Bot API для очереди уведомлений и рассылок.
+
+send_message отправляет одно сообщение и возвращает DeliveryResult
+(с retry_after для ответа 429); одновременно идет не более
+NOTIFY_CONCURRENCY запросов. Очередь outbox (outbox.py) записывает
+результаты доставки в notification_log через record_results.
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+import http_client
+from db_pool import acquire
+
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "5"))
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+@dataclass(frozen=True)
+class DeliveryResult:
+    """Результат отправки одному получателю"""
+    chat_id: int
+    ok: bool
+    status: Optional[int] = None
+    error: Optional[str] = None
+    # Для ответа 429: через сколько секунд Telegram разрешает повторить
+    retry_after: Optional[int] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    return _semaphore
+
+
+async def send_message(token: str, chat_id: int, text: str) -> DeliveryResult:
+    """Отправить одно сообщение, не больше NOTIFY_CONCURRENCY одновременно"""
+    async with _get_semaphore():
+        try:
+            resp = await http_client.telegram_post(token, "sendMessage", {"chat_id": chat_id, "text": text})
+            if resp.status == 200:
+                return DeliveryResult(chat_id, True, resp.status)
+            retry_after = None
+            if resp.status == 429:
+                try:
+                    retry_after = int((await resp.json(content_type=None))["parameters"]["retry_after"])
+                except (ValueError, KeyError, TypeError):
+                    retry_after = None
+            return DeliveryResult(chat_id, False, resp.status, await resp.text(), retry_after)
+        except Exception as e:
+            return DeliveryResult(chat_id, False, error=str(e) or type(e).__name__)
+
+
+async def record_results(kind: str, results: List[DeliveryResult]):
+    """Записать результаты доставки в notification_log"""
+    now = datetime.now().isoformat()
+    async with acquire() as db:
+        await db.executemany("""
+            INSERT INTO notification_log (kind, chat_id, ok, status, error, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(kind, r.chat_id, int(r.ok), r.status, r.error, now) for r in results])
+        await db.commit()
+
@@ -0,0 +1,113 @@
+"""
+Занятость антикафе в виде битовой маски часов.
+
+Одна маска покрывает три дня подряд: предыдущий (биты 0-23), выбранный
+(биты 24-47) и следующий (биты 48-71). Бит установлен, если час занят
+бронированием или зазором вокруг него. Благодаря этому брони, переходящие
+через полночь, учитываются без отдельных веток, а проверки сводятся
+к нескольким побитовым операциям.
+
+Правила едины для бота, админ-бота и веб-приложения:
+- вокруг каждой брони держим зазор BUFFER_HOURS до начала и после окончания;
+- на сегодня бронировать можно не раньше чем через час от текущего времени.
+"""
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+HOURS_PER_DAY = 24
+BUFFER_HOURS = 1
+
+# Смещение выбранного дня внутри маски
+_DAY_BASE = HOURS_PER_DAY
+
+
+def hour_of(time_str: str) -> int:
+    """Час из строки "HH:MM" """
+    return int(time_str[:2])
+
+
+def neighbour_dates(selected_date: str) -> Tuple[str, str]:
+    """Предыдущая и следующая даты в формате YYYY-MM-DD"""
+    day = date.fromisoformat(selected_date)
+    return (day - timedelta(days=1)).isoformat(), (day + timedelta(days=1)).isoformat()
+
+
+def span_mask(start_hour: int, duration: int) -> int:
+    """Маска интервала [start, start + duration) выбранного дня"""
+    return ((1 << duration) - 1) << (_DAY_BASE + start_hour)
+
+
+def booking_mask(start_hour: int, duration: int, day_shift: int = 0) -> int:
+    """Маска брони вместе с зазорами (day_shift: -1 вчера, 0 выбранный день, 1 завтра)"""
+    start = _DAY_BASE * (day_shift + 1) + start_hour - BUFFER_HOURS
+    end = _DAY_BASE * (day_shift + 1) + start_hour + duration + BUFFER_HOURS
+    start = max(start, 0)
+    return ((1 << (end - start)) - 1) << start
+
+
+def build_day_mask(bookings: Iterable[Tuple[str, str, int]], selected_date: str) -> int:
+    """Маска занятости выбранного дня по строкам (date, time, duration)
+
+    Брони вне трёх соседних дней игнорируются, так что можно передавать
+    результат одного запроса за более широкий период.
+    """
+    prev_date, next_date = neighbour_dates(selected_date)
+    shifts = {prev_date: -1, selected_date: 0, next_date: 1}
+    mask = 0
+    for booking_date, booking_time, booking_duration in bookings:
+        shift = shifts.get(booking_date)
+        if shift is None:
+            continue
+        mask |= booking_mask(hour_of(booking_time), booking_duration, shift)
+    return mask
+
+
+def conflicts(mask: int, start_hour: int, duration: int) -> bool:
+    """Пересекается ли [start, start + duration) с занятыми часами"""
+    return bool(mask & span_mask(start_hour, duration))
+
+
+def free_start_hours(mask: int, duration: int, first_hour: int, last_end_hour: int) -> List[int]:
+    """Часы начала, с которых свободно duration часов подряд
+
+    Бронь должна начинаться не раньше first_hour и заканчиваться
+    не позже last_end_hour выбранного дня.
+    """
+    last_start = last_end_hour - duration
+    if duration <= 0 or last_start < first_hour:
+        return []
+
+    # Бит t в free установлен, если свободны все часы t .. t + duration - 1
+    free = ~mask
+    for offset in range(1, duration):
+        free &= ~mask >> offset
+
+    window = ((1 << (last_start - first_hour + 1)) - 1) << (_DAY_BASE + first_hour)
+    free &= window
+
+    hours = []
+    while free:
+        lowest = free & -free
+        hours.append(lowest.bit_length() - 1 - _DAY_BASE)
+        free ^= lowest
+    return hours
+
+
+def free_start_times(mask: int, duration: int, first_hour: int, last_end_hour: int) -> List[str]:
+    """То же, что free_start_hours, но в виде строк "HH:00" """
+    return [f"{hour:02d}:00" for hour in free_start_hours(mask, duration, first_hour, last_end_hour)]
+
+
+def earliest_start_hour(selected_date: str, now: Optional[datetime] = None) -> int:
+    """Самый ранний час начала брони с учетом правила "не раньше чем за 1 час"
+
+    Для будущих дат ограничения нет (0). Если на сегодня уже поздно,
+    возвращается HOURS_PER_DAY.
+    """
+    now = now or datetime.now()
+    if selected_date != now.date().isoformat():
+        return 0
+    # Ближайший доступный слот должен быть минимум через 1 час
+    if now.minute == 0:
+        return now.hour + 1
+    return now.hour + 2
@@ -0,0 +1,461 @@
+"""
+Надежная доставка уведомлений через таблицу outbox.
+
+Уведомление записывается в outbox в той же транзакции, что и изменение
+брони (enqueue / enqueue_admins, для Flask - *_sync), поэтому оно
+не теряется при падении процесса или недоступности Telegram.
+Фоновый OutboxWorker (запускается в main.py) выбирает пачку готовых
+к отправке записей, отправляет их параллельно (notifications.send_message)
+и записывает состояние доставки:
+
+- 200 - sent;
+- 429 - повтор через retry_after из ответа, отправка этим ботом
+  приостанавливается на то же время (попытка не засчитывается);
+- 400/403/404 - failed сразу (чат не найден, бот заблокирован);
+- остальные ошибки - повтор с экспоненциальной задержкой, после
+  OUTBOX_MAX_ATTEMPTS попыток - failed.
+
+Режим дайджеста (ADMIN_DIGEST_WINDOW > 0): события о бронях для админов
+(новая заявка, отмена, изменение) не отправляются по одному, а копятся
+в outbox со статусом buffered. Через ADMIN_DIGEST_WINDOW секунд после
+первого накопленного события воркер собирает их в одну сводку на каждого
+админа. Срочные события - бронь начинается раньше чем через
+ADMIN_URGENT_HOURS часов - отправляются сразу, как и без дайджеста.
+
+Воркер запускается в процессе каждого бота (start_worker в bot.main,
+admin_bot.main и main.py; в одном процессе он общий). Чтобы очередь
+одного бота не отправляли два процесса сразу, воркер берет аренду
+(outbox_leases) на каждого своего бота и обслуживает только арендованных;
+аренда продлевается, пока воркер жив, и переходит другому процессу через
+OUTBOX_LEASE_TTL секунд после его остановки. Веб-сервер (server.py) только
+пишет в outbox: уведомления уйдут, когда запущен хотя бы один из ботов.
+Если записи ждут отправки дольше OUTBOX_STALE_WARNING секунд, воркер
+пишет предупреждение.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import notifications
+from db_pool import acquire
+
+# Каким ботом отправлять
+BOT_ADMIN = "admin"
+BOT_MAIN = "main"
+
+OUTBOX_PENDING = "pending"
+OUTBOX_SENT = "sent"
+OUTBOX_FAILED = "failed"
+# Событие ждет дайджеста / уже вошло в отправленный дайджест
+OUTBOX_BUFFERED = "buffered"
+OUTBOX_DIGESTED = "digested"
+
+# Типы событий о бронях для дайджеста админам
+EVENT_NEW = "new"
+EVENT_CANCELLED = "cancelled"
+EVENT_CHANGED = "changed"
+EVENT_DIGEST = "digest"
+DIGEST_SECTIONS = (
+    (EVENT_NEW, "🆕 Новые заявки"),
+    (EVENT_CANCELLED, "❌ Отменены"),
+    (EVENT_CHANGED, "✏️ Изменены"),
+)
+# Ограничение Telegram на длину сообщения - 4096 символов
+DIGEST_MAX_LENGTH = 4000
+
+# Окно дайджеста для админов (секунды), 0 - отправлять каждое событие сразу
+ADMIN_DIGEST_WINDOW = float(os.getenv("ADMIN_DIGEST_WINDOW", "0"))
+# Брони, до начала которых меньше стольких часов, сообщаются сразу
+ADMIN_URGENT_HOURS = float(os.getenv("ADMIN_URGENT_HOURS", "3"))
+
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_POLL_INTERVAL = 2.0
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE = 2.0
+OUTBOX_BACKOFF_MAX = 600.0
+# Аренда очереди бота одним воркером и как часто ее продлевать (секунды)
+OUTBOX_LEASE_TTL = 30.0
+OUTBOX_LEASE_RENEW = 10.0
+# Через сколько секунд ожидания предупреждать о неотправленных записях
+OUTBOX_STALE_WARNING = 300.0
+# Ответы, после которых повтор бесполезен
+PERMANENT_STATUSES = {400, 403, 404}
+
+_ENQUEUE_SQL = """
+    INSERT INTO outbox (bot, chat_id, text, status, attempts, next_attempt_at, created_at, event)
+    VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+"""
+_ENQUEUE_ADMINS_SQL = """
+    INSERT INTO outbox (bot, chat_id, text, status, attempts, next_attempt_at, created_at, event)
+    SELECT 'admin', telegram_id, ?, ?, 0, ?, ?, ?
+    FROM admins WHERE telegram_id IS NOT NULL
+"""
+
+_worker: Optional["OutboxWorker"] = None
+_worker_task: Optional[asyncio.Task] = None
+
+
+def _timestamp(moment: datetime = None) -> str:
+    return (moment or datetime.now()).isoformat(timespec="milliseconds")
+
+
+def _fallback_admin_id() -> Optional[int]:
+    """ADMIN_USER_ID из окружения, если в таблице admins никого нет"""
+    admin_id = os.getenv("ADMIN_USER_ID")
+    return int(admin_id) if admin_id and admin_id.isdigit() else None
+
+
+def format_booking_line(booking_id, date: str, time: str, guests=None, duration=None, name: str = None) -> str:
+    """Краткая строка о брони для дайджеста"""
+    parts = [f"{date} {time}"]
+    if guests:
+        parts.append(f"{guests} чел.")
+    if duration:
+        parts.append(f"{duration} ч.")
+    line = ", ".join(parts)
+    if name:
+        line += f" - {name}"
+    return f"{line} (#{booking_id})"
+
+
+def is_urgent(starts_at: Optional[str], now: datetime = None) -> bool:
+    """Бронь начинается раньше чем через ADMIN_URGENT_HOURS часов (starts_at - 'ГГГГ-ММ-ДД ЧЧ:ММ')"""
+    if not starts_at:
+        return False
+    try:
+        start = datetime.strptime(starts_at, "%Y-%m-%d %H:%M")
+    except ValueError:
+        # Непонятное время - лучше сообщить сразу
+        return True
+    return start - (now or datetime.now()) <= timedelta(hours=ADMIN_URGENT_HOURS)
+
+
+def _admin_params(text: str, event: Optional[str], summary: Optional[str], starts_at: Optional[str]) -> Tuple:
+    """Параметры записи для админов: сразу в отправку или в буфер дайджеста"""
+    now = datetime.now()
+    if event and ADMIN_DIGEST_WINDOW > 0 and not is_urgent(starts_at, now):
+        # next_attempt_at буферной записи - когда ее можно включить в дайджест
+        flush_at = now + timedelta(seconds=ADMIN_DIGEST_WINDOW)
+        return summary or text, OUTBOX_BUFFERED, _timestamp(flush_at), _timestamp(now), event
+    return text, OUTBOX_PENDING, _timestamp(now), _timestamp(now), event
+
+
+async def enqueue(db, bot: str, chat_id: int, text: str):
+    """Поставить сообщение в очередь внутри открытой транзакции db"""
+    now = _timestamp()
+    await db.execute(_ENQUEUE_SQL, (bot, chat_id, text, OUTBOX_PENDING, now, now, None))
+
+
+async def enqueue_admins(db, text: str, event: str = None, summary: str = None, starts_at: str = None):
+    """Поставить сообщение всем администраторам внутри открытой транзакции db.
+
+    event (EVENT_*) и summary - краткая строка для дайджеста; starts_at
+    ('ГГГГ-ММ-ДД ЧЧ:ММ') - начало брони, по нему срочные события идут сразу.
+    """
+    params = _admin_params(text, event, summary, starts_at)
+    cursor = await db.execute(_ENQUEUE_ADMINS_SQL, params)
+    if cursor.rowcount == 0 and _fallback_admin_id():
+        await db.execute(_ENQUEUE_SQL, (BOT_ADMIN, _fallback_admin_id(), *params))
+
+
+def enqueue_sync(cur, bot: str, chat_id: int, text: str):
+    """То же, что enqueue, для синхронного курсора (Flask)"""
+    now = _timestamp()
+    cur.execute(_ENQUEUE_SQL, (bot, chat_id, text, OUTBOX_PENDING, now, now, None))
+
+
+def enqueue_admins_sync(cur, text: str, event: str = None, summary: str = None, starts_at: str = None):
+    """То же, что enqueue_admins, для синхронного курсора (Flask)"""
+    params = _admin_params(text, event, summary, starts_at)
+    cur.execute(_ENQUEUE_ADMINS_SQL, params)
+    if cur.rowcount == 0 and _fallback_admin_id():
+        cur.execute(_ENQUEUE_SQL, (BOT_ADMIN, _fallback_admin_id(), *params))
+
+
+async def notify(bot: str, chat_id: int, text: str):
+    """Поставить одно сообщение в очередь отдельной транзакцией и разбудить воркер"""
+    async with acquire() as db:
+        await enqueue(db, bot, chat_id, text)
+        await db.commit()
+    wake()
+
+
+async def notify_admins(text: str):
+    """Поставить сообщение всем администраторам отдельной транзакцией"""
+    async with acquire() as db:
+        await enqueue_admins(db, text)
+        await db.commit()
+    wake()
+
+
+def wake():
+    """Сообщить воркеру этого процесса, что в очереди есть новые записи"""
+    if _worker is not None:
+        _worker.wake()
+
+
+def format_digest(events: List[Tuple[str, str]]) -> str:
+    """Текст сводки из событий (event, summary) по разделам"""
+    lines = [f"📋 Сводка по броням: {len(events)} событий"]
+    length = len(lines[0])
+    shown = 0
+    for event, title in DIGEST_SECTIONS:
+        items = [summary for item_event, summary in events if item_event == event]
+        if not items:
+            continue
+        section = ["", f"{title} ({len(items)}):"] + [f"• {summary}" for summary in items]
+        for line in section:
+            if length + len(line) + 1 > DIGEST_MAX_LENGTH:
+                lines.append(f"… и еще {len(events) - shown} событий")
+                return "\n".join(lines)
+            lines.append(line)
+            length += len(line) + 1
+            if line.startswith("• "):
+                shown += 1
+    return "\n".join(lines)
+
+
+def backoff_delay(attempts: int, base: float = OUTBOX_BACKOFF_BASE, limit: float = OUTBOX_BACKOFF_MAX) -> float:
+    """Задержка перед следующей попыткой после attempts неудачных"""
+    return min(base * 2 ** max(attempts - 1, 0), limit)
+
+
+class OutboxWorker:
+    """Фоновая отправка записей из outbox"""
+
+    def __init__(self, tokens: Dict[str, str], batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 backoff_base: float = OUTBOX_BACKOFF_BASE, lease_ttl: float = OUTBOX_LEASE_TTL,
+                 lease_renew: float = OUTBOX_LEASE_RENEW):
+        # Боты без токена не отправляют, их записи ждут в очереди
+        self.tokens = {bot: token for bot, token in tokens.items() if token}
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = lease_ttl
+        # Как часто продлевать свою аренду и пробовать взять освободившуюся
+        self.lease_renew = min(lease_renew, lease_ttl / 3)
+        self._leased: List[str] = []
+        self._lease_renewed_at: Optional[datetime] = None
+        self._stale_checked_at: Optional[datetime] = None
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        # До какого момента бот приостановлен после 429
+        self.paused_until: Dict[str, datetime] = {}
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def add_tokens(self, tokens: Dict[str, str]):
+        """Обслуживать еще и этих ботов (второй бот в том же процессе)"""
+        self.tokens.update({bot: token for bot, token in tokens.items() if token})
+        self._lease_renewed_at = None
+
+    async def _acquire_leases(self, now: datetime) -> List[str]:
+        """Боты, чью очередь обслуживает этот воркер (аренда в outbox_leases)"""
+        if self._lease_renewed_at is not None and now - self._lease_renewed_at < timedelta(seconds=self.lease_renew):
+            return self._leased
+        if not self.tokens:
+            return []
+        expires_at = _timestamp(now + timedelta(seconds=self.lease_ttl))
+        bots = list(self.tokens)
+        placeholders = ", ".join("?" * len(bots))
+        async with acquire() as db:
+            # Чужая аренда перехватывается только после ее истечения
+            await db.executemany("""
+                INSERT INTO outbox_leases (bot, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(bot) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE outbox_leases.owner = excluded.owner OR outbox_leases.expires_at < ?
+            """, [(bot, self.owner, expires_at, _timestamp(now)) for bot in bots])
+            await db.commit()
+            async with db.execute(
+                f"SELECT bot FROM outbox_leases WHERE owner = ? AND bot IN ({placeholders})",
+                (self.owner, *bots)
+            ) as cursor:
+                self._leased = [row[0] for row in await cursor.fetchall()]
+        self._lease_renewed_at = now
+        return self._leased
+
+    async def release_leases(self):
+        """Отдать аренду (при остановке), чтобы другой процесс подхватил очередь сразу"""
+        async with acquire() as db:
+            await db.execute("DELETE FROM outbox_leases WHERE owner = ?", (self.owner,))
+            await db.commit()
+        self._leased = []
+        self._lease_renewed_at = None
+
+    async def _warn_stale(self, now: datetime):
+        """Предупредить, если записи давно ждут отправки (нет процесса с токеном бота)"""
+        if self._stale_checked_at is not None and now - self._stale_checked_at < timedelta(seconds=OUTBOX_STALE_WARNING):
+            return
+        self._stale_checked_at = now
+        async with acquire() as db:
+            async with db.execute("""
+                SELECT bot, COUNT(*) FROM outbox
+                WHERE status = 'pending' AND created_at < ?
+                GROUP BY bot
+            """, (_timestamp(now - timedelta(seconds=OUTBOX_STALE_WARNING)),)) as cursor:
+                rows = await cursor.fetchall()
+        for bot, count in rows:
+            print(f"[outbox] {count} уведомлений для бота '{bot}' ждут отправки дольше "
+                  f"{OUTBOX_STALE_WARNING:g} с: проверьте, что запущен бот с его токеном")
+
+    def _active_bots(self, leased: List[str], now: datetime) -> List[str]:
+        return [bot for bot in leased if self.paused_until.get(bot, now) <= now]
+
+    async def flush_digests(self, now: datetime = None, bots: List[str] = None) -> int:
+        """Собрать накопленные события в сводки для чатов, у которых истекло окно"""
+        now = now or datetime.now()
+        bots = list(self.tokens) if bots is None else bots
+        if not bots:
+            return 0
+        placeholders = ", ".join("?" * len(bots))
+        async with acquire() as db:
+            async with db.execute(f"""
+                SELECT id, bot, chat_id, event, text FROM outbox
+                WHERE status = 'buffered' AND (bot, chat_id) IN (
+                    SELECT bot, chat_id FROM outbox
+                    WHERE status = 'buffered' AND bot IN ({placeholders})
+                    GROUP BY bot, chat_id
+                    HAVING MIN(next_attempt_at) <= ?
+                )
+                ORDER BY id
+            """, (*bots, _timestamp(now))) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                return 0
+
+            digests: Dict[Tuple[str, int], List[Tuple[str, str]]] = {}
+            for _, bot, chat_id, event, text in rows:
+                digests.setdefault((bot, chat_id), []).append((event, text))
+            timestamp = _timestamp(now)
+            await db.executemany(_ENQUEUE_SQL, [
+                (bot, chat_id, format_digest(events), OUTBOX_PENDING, timestamp, timestamp, EVENT_DIGEST)
+                for (bot, chat_id), events in digests.items()
+            ])
+            # Записи, добавленные после выборки, останутся в буфере до следующей сводки
+            placeholders = ", ".join("?" * len(rows))
+            await db.execute(
+                f"UPDATE outbox SET status = 'digested' WHERE id IN ({placeholders})",
+                [row[0] for row in rows]
+            )
+            await db.commit()
+        return len(digests)
+
+    async def run_once(self) -> int:
+        """Отправить одну пачку, вернуть число обработанных записей"""
+        now = datetime.now()
+        leased = await self._acquire_leases(now)
+        await self._warn_stale(now)
+        await self.flush_digests(now, leased)
+        bots = self._active_bots(leased, now)
+        if not bots:
+            return 0
+
+        placeholders = ", ".join("?" * len(bots))
+        async with acquire() as db:
+            async with db.execute(f"""
+                SELECT id, bot, chat_id, text, attempts FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ? AND bot IN ({placeholders})
+                ORDER BY id
+                LIMIT ?
+            """, (_timestamp(now), *bots, self.batch_size)) as cursor:
+                rows = await cursor.fetchall()
+        if not rows:
+            return 0
+
+        results = await asyncio.gather(*(
+            notifications.send_message(self.tokens[bot], chat_id, text)
+            for _, bot, chat_id, text, _ in rows
+        ))
+
+        now = datetime.now()
+        updates = []
+        for (outbox_id, bot, _, _, attempts), result in zip(rows, results):
+            if result.ok:
+                updates.append((OUTBOX_SENT, attempts + 1, _timestamp(now), None, _timestamp(now), outbox_id))
+            elif result.status == 429:
+                retry_at = now + timedelta(seconds=result.retry_after or self.backoff_base)
+                self.paused_until[bot] = max(self.paused_until.get(bot, retry_at), retry_at)
+                updates.append((OUTBOX_PENDING, attempts, _timestamp(retry_at), result.error, None, outbox_id))
+            else:
+                attempts += 1
+                if result.status in PERMANENT_STATUSES or attempts >= self.max_attempts:
+                    status, retry_at = OUTBOX_FAILED, now
+                else:
+                    status = OUTBOX_PENDING
+                    retry_at = now + timedelta(seconds=backoff_delay(attempts, self.backoff_base))
+                updates.append((status, attempts, _timestamp(retry_at), result.error, None, outbox_id))
+
+        async with acquire() as db:
+            await db.executemany("""
+                UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, sent_at = ?
+                WHERE id = ?
+            """, updates)
+            await db.commit()
+
+        for bot in {row[1] for row in rows}:
+            try:
+                await notifications.record_results(
+                    f"outbox_{bot}", [result for row, result in zip(rows, results) if row[1] == bot]
+                )
+            except Exception as e:
+                print(f"[outbox] не удалось записать журнал доставки: {e}")
+        return len(rows)
+
+    async def run(self):
+        """Цикл воркера: пачка за пачкой, между ними - ожидание wake() или poll_interval"""
+        global _worker
+        _worker = self
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    processed = await self.run_once()
+                except Exception as e:
+                    print(f"[outbox] ошибка обработки очереди: {e}")
+                    processed = 0
+                if processed >= self.batch_size:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if _worker is self:
+                _worker = None
+            try:
+                await self.release_leases()
+            except Exception as e:
+                print(f"[outbox] не удалось освободить аренду: {e}")
+
+
+def start_worker(tokens: Dict[str, str]) -> "OutboxWorker":
+    """Запустить воркер процесса или добавить токены в уже запущенный"""
+    global _worker, _worker_task
+    if _worker is not None and _worker_task is not None and not _worker_task.done():
+        _worker.add_tokens(tokens)
+        return _worker
+    worker = OutboxWorker(tokens)
+    _worker = worker
+    _worker_task = asyncio.ensure_future(worker.run())
+    return worker
+
+
+async def stop_worker():
+    """Остановить воркер процесса; неотправленное останется в очереди"""
+    global _worker_task
+    task, _worker_task = _worker_task, None
+    if task is not None and not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def get_outbox_stats() -> Dict[str, int]:
+    """Число записей outbox по состояниям"""
+    async with acquire() as db:
+        async with db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status") as cursor:
+            return {status: count for status, count in await cursor.fetchall()}
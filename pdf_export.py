@@ -0,0 +1,298 @@
+"""
+Выгрузка сводной таблицы бронирований в PDF.
+
+Отрисовка reportlab занимает процессор надолго, поэтому она выполняется
+в отдельном процессе (ProcessPoolExecutor), а цикл событий ботов в это
+время продолжает обрабатывать сообщения. Таблица разбивается на куски
+по ROWS_PER_TABLE строк: reportlab не пересчитывает одну огромную таблицу
+при переносе на каждую страницу. Номера готовых страниц процесс-рендерер
+передает через очередь multiprocessing.Manager, а export_bookings_pdf
+сообщает о них через on_progress.
+
+Процесс-рендерер и Manager запускаются методом spawn: fork процесса,
+в котором работают потоки (aiosqlite, asyncio.to_thread), может унаследовать
+захваченные блокировки. Запуск процессов блокирует, поэтому он выполняется
+в отдельном потоке при первой выгрузке.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import platform
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+# Строк данных в одной таблице
+ROWS_PER_TABLE = 40
+# Строк на странице альбомного A4 (для оценки числа страниц)
+ROWS_PER_PAGE = 23
+# Как часто проверять очередь прогресса (секунды)
+PROGRESS_POLL_INTERVAL = 0.5
+
+COLUMN_WIDTHS = [1*cm, 2*cm, 2*cm, 1*cm, 1*cm, 2*cm, 2.5*cm, 2.5*cm, 2*cm, 1.5*cm]
+HEADERS = [
+    'ID', 'Дата', 'Время', 'Гости', 'Длит.',
+    'Стоимость', 'Имя', 'Телефон', 'TG ID', 'Статус'
+]
+STATUS_NAMES = {
+    'pending': 'Ожидает',
+    'confirmed': 'Подтверждено',
+    'cancelled': 'Отменено'
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_manager = None
+_start_lock: Optional[asyncio.Lock] = None
+_mp_context = multiprocessing.get_context("spawn")
+
+
+def register_cyrillic_font():
+    """Регистрирует кириллический шрифт для PDF"""
+    # Пробуем найти системные шрифты с поддержкой кириллицы
+    system = platform.system()
+    font_paths = []
+
+    if system == 'Windows':
+        # Пути к шрифтам Windows
+        windir = os.environ.get('WINDIR', 'C:\\Windows')
+        font_paths = [
+            os.path.join(windir, 'Fonts', 'arial.ttf'),
+            os.path.join(windir, 'Fonts', 'arialbd.ttf'),
+            os.path.join(windir, 'Fonts', 'Arial.ttf'),
+            os.path.join(windir, 'Fonts', 'Arialbd.ttf'),
+            os.path.join(windir, 'Fonts', 'tahoma.ttf'),
+            os.path.join(windir, 'Fonts', 'tahomabd.ttf'),
+            os.path.join(windir, 'Fonts', 'Tahoma.ttf'),
+            os.path.join(windir, 'Fonts', 'Tahomabd.ttf'),
+        ]
+    elif system == 'Linux':
+        # Пути к шрифтам Linux
+        font_paths = [
+            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+            '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+            '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+            '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
+        ]
+    elif system == 'Darwin':  # macOS
+        font_paths = [
+            '/Library/Fonts/Arial.ttf',
+            '/Library/Fonts/Arial Bold.ttf',
+        ]
+
+    # Регистрируем шрифты
+    regular_font = None
+    bold_font = None
+
+    for font_path in font_paths:
+        if os.path.exists(font_path):
+            try:
+                if 'bold' in font_path.lower() or 'bd' in font_path.lower():
+                    if not bold_font:
+                        pdfmetrics.registerFont(TTFont('CyrillicBold', font_path))
+                        bold_font = 'CyrillicBold'
+                else:
+                    if not regular_font:
+                        pdfmetrics.registerFont(TTFont('Cyrillic', font_path))
+                        regular_font = 'Cyrillic'
+                if regular_font and bold_font:
+                    break
+            except Exception as e:
+                print(f"Ошибка регистрации шрифта {font_path}: {e}")
+                continue
+
+    # Если не нашли системные шрифты, используем встроенные (но они могут не поддерживать кириллицу)
+    if not regular_font:
+        regular_font = 'Helvetica'
+        bold_font = 'Helvetica-Bold'
+        print("⚠️ Кириллические шрифты не найдены, используется Helvetica (может отображаться некорректно)")
+
+    return regular_font, bold_font
+
+
+def estimate_pages(rows_count: int) -> int:
+    """Примерное число страниц PDF"""
+    return max(1, math.ceil(rows_count / ROWS_PER_PAGE))
+
+
+def _booking_row(booking: Dict) -> List[str]:
+    """Строка таблицы для одной брони"""
+    date_str = datetime.strptime(booking['date'], '%Y-%m-%d').strftime('%d.%m.%Y')
+    end_time = (datetime.strptime(booking['time'], '%H:%M') + timedelta(hours=booking['duration'])).strftime('%H:%M')
+    tg_info = f"@{booking['username']}" if booking['username'] else f"ID:{booking['telegram_id']}" if booking['telegram_id'] else "—"
+    return [
+        str(booking['id']),
+        date_str,
+        f"{booking['time']}-{end_time}",
+        str(booking['guests']),
+        f"{booking['duration']}ч",
+        f"{booking['total_price']:,} ₽",
+        booking['name'] or '—',
+        booking['phone'] or '—',
+        tg_info,
+        STATUS_NAMES.get(booking['status'], booking['status'])
+    ]
+
+
+def render_bookings_pdf(bookings: List[Dict], period_name: str, filepath: str, progress=None) -> str:
+    """Отрисовать PDF (выполняется в процессе-рендерере)
+
+    progress - очередь, в которую кладется номер каждой готовой страницы.
+    """
+    cyrillic_font, cyrillic_bold = register_cyrillic_font()
+
+    # Альбомная ориентация для широкой таблицы
+    doc = SimpleDocTemplate(filepath, pagesize=landscape(A4))
+    story = []
+
+    # Стили
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#1a1a1a'),
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        fontName=cyrillic_bold
+    )
+    normal_style = ParagraphStyle(
+        'CyrillicNormal',
+        parent=styles['Normal'],
+        fontName=cyrillic_font
+    )
+
+    # Заголовок
+    story.append(Paragraph(f"Сводная таблица бронирований - {period_name}", title_style))
+    story.append(Spacer(1, 0.5*cm))
+
+    # Информация о периоде и общая статистика
+    total_revenue = sum(b['total_price'] for b in bookings)
+    info_text = f"<b>Период:</b> {period_name}<br/>"
+    info_text += f"<b>Всего бронирований:</b> {len(bookings)}<br/>"
+    info_text += f"<b>Общая выручка:</b> {total_revenue:,} ₽"
+    story.append(Paragraph(info_text, normal_style))
+    story.append(Spacer(1, 0.5*cm))
+
+    table_style = TableStyle([
+        # Заголовок
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a90e2')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), cyrillic_bold),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('TOPPADDING', (0, 0), (-1, 0), 12),
+
+        # Данные
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 1), (-1, -1), cyrillic_font),
+        ('FONTSIZE', (0, 1), (-1, -1), 7),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+
+        # Чередование цветов строк
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
+    ])
+
+    # Таблица кусками: у каждого куска свой заголовок, при переносе он повторяется
+    for start in range(0, len(bookings), ROWS_PER_TABLE):
+        chunk = [HEADERS] + [_booking_row(b) for b in bookings[start:start + ROWS_PER_TABLE]]
+        table = Table(chunk, colWidths=COLUMN_WIDTHS, repeatRows=1)
+        table.setStyle(table_style)
+        story.append(table)
+
+    def on_page(canvas, _doc):
+        if progress is not None:
+            progress.put(canvas.getPageNumber())
+
+    doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
+    return filepath
+
+
+def _start_renderer():
+    """Запустить пул процессов и Manager (блокирует, пока стартуют процессы)"""
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=_mp_context)
+    try:
+        manager = _mp_context.Manager()
+    except Exception:
+        executor.shutdown(wait=False)
+        raise
+    return executor, manager
+
+
+async def _get_executor():
+    """Пул процессов для отрисовки и Manager (создаются при первой выгрузке)"""
+    global _executor, _manager, _start_lock
+    if _start_lock is None:
+        _start_lock = asyncio.Lock()
+    async with _start_lock:
+        if _executor is None:
+            _executor, _manager = await asyncio.to_thread(_start_renderer)
+    return _executor, _manager
+
+
+def shutdown_executor():
+    """Остановить процесс-рендерер (при остановке ботов)"""
+    global _executor, _manager
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
+def _last_page(progress, default: int) -> int:
+    """Номер последней готовой страницы из очереди (или default, если новых нет)"""
+    page = default
+    try:
+        while True:
+            page = progress.get_nowait()
+    except queue.Empty:
+        return page
+
+
+async def export_bookings_pdf(
+    bookings: List[Dict],
+    period_name: str,
+    filepath: str,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> str:
+    """Отрисовать PDF в отдельном процессе, сообщая о готовых страницах
+
+    on_progress(страница, примерно_страниц) вызывается не чаще раза
+    в PROGRESS_POLL_INTERVAL секунд.
+    """
+    executor, manager = await _get_executor()
+    # Создание очереди - обращение к процессу Manager
+    progress = await asyncio.to_thread(manager.Queue)
+    total_pages = estimate_pages(len(bookings))
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, render_bookings_pdf, bookings, period_name, filepath, progress)
+
+    last_reported = 0
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=PROGRESS_POLL_INTERVAL)
+        # Чтение очереди Manager - обращение к другому процессу, поэтому не в цикле событий
+        page = await asyncio.to_thread(_last_page, progress, last_reported)
+        if on_progress and page > last_reported and not done:
+            last_reported = page
+            try:
+                await on_progress(page, max(total_pages, page))
+            except Exception as e:
+                print(f"Ошибка обновления прогресса PDF: {e}")
+        if done:
+            return future.result()
@@ -0,0 +1,67 @@
+"""
+Расчет стоимости бронирований по правилам ценообразования.
+
+Правила из таблицы price_rules компилируются в PriceRuleIndex: отрезки дат,
+на которых набор действующих правил не меняется, отсортированы, и для
+каждого отрезка хранится список правил от самого нового к самому старому.
+Поиск правила - бинарный поиск по дате и проверка времени; при пересечении
+правил побеждает самое новое (как ORDER BY created_at DESC в прежнем SQL).
+"""
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+DEFAULT_PAYMENT_TYPE = 'per_booking'
+
+
+class PriceRuleIndex:
+    """Скомпилированный индекс правил ценообразования"""
+
+    def __init__(self, rules: List[Dict]):
+        # Самые новые правила первыми
+        ordered = sorted(rules, key=lambda r: (r.get('created_at') or '', r['id']), reverse=True)
+
+        boundaries = set()
+        for rule in ordered:
+            boundaries.add(rule['start_date'])
+            boundaries.add(self._next_day(rule['end_date']))
+        self._boundaries = sorted(boundaries)
+
+        # Для каждого отрезка [boundaries[i], boundaries[i + 1]) - действующие правила
+        self._segments = []
+        for segment_start in self._boundaries[:-1]:
+            self._segments.append([
+                rule for rule in ordered
+                if rule['start_date'] <= segment_start <= rule['end_date']
+            ])
+        self.rules_count = len(ordered)
+
+    @staticmethod
+    def _next_day(date_str: str) -> str:
+        return (date.fromisoformat(date_str) + timedelta(days=1)).isoformat()
+
+    def lookup(self, booking_date: str, booking_time: str) -> Optional[Dict]:
+        """Правило для даты и времени начала брони или None"""
+        index = bisect_right(self._boundaries, booking_date) - 1
+        if index < 0 or index >= len(self._segments):
+            return None
+        for rule in self._segments[index]:
+            if rule['start_time'] <= booking_time < rule['end_time']:
+                return rule
+        return None
+
+
+def quote(guests: int, duration: int, price_per_hour: int, price_per_extra_guest: int,
+          max_guests_included: int, payment_type: str = DEFAULT_PAYMENT_TYPE) -> int:
+    """Стоимость брони при заданных ценах"""
+    base_price = duration * price_per_hour
+
+    if guests > max_guests_included:
+        extra_guests = guests - max_guests_included
+        if payment_type == 'per_hour':
+            extra_price = extra_guests * price_per_extra_guest * duration
+        else:  # per_booking
+            extra_price = extra_guests * price_per_extra_guest
+        return base_price + extra_price
+
+    return base_price
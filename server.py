@@ -1,45 +1,30 @@
-import os
-import sqlite3
 from flask import Flask, send_from_directory, request, jsonify
 from datetime import datetime, date, timedelta
-import requests
 import hashlib
 import hmac
 import urllib.parse
+from db_pool import get_sync_connection
+from db import OPEN_HOUR, CLOSE_HOUR, BOOKING_CONFLICT_HOURS, book_slot_sync
+import outbox
+from occupancy import build_day_mask, earliest_start_hour, free_start_times, neighbour_dates
 
 app = Flask(__name__)
 WEBAPP_DIR = "webapp"
-DB_PATH = "chillivili.db"
 
 # --- Вспомогательные функции ---
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Подключение из общего пула: with get_db() as conn возвращает его обратно
+    return get_sync_connection()
 
-ADMIN_BOT_TOKEN = "API"
-ADMIN_USER_ID = "ADMIN_USER_ID"
-
-def notify_admin(text):
-    url = f"https://api.telegram.org/bot{ADMIN_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": ADMIN_USER_ID, "text": text}
-    try:
-        response = requests.post(url, data=payload, timeout=5)
-        if response.status_code != 200:
-            print(f"[admin notify error] Status: {response.status_code}, Response: {response.text}")
-    except Exception as e:
-        print(f"[admin notify error] {e}")
-
-MAIN_BOT_TOKEN = "API"
-def notify_user(user_id, text):
-    url = f"https://api.telegram.org/bot{MAIN_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": user_id, "text": text}
-    try:
-        response = requests.post(url, data=payload, timeout=5)
-        if response.status_code != 200:
-            print(f"[user notify error] Status: {response.status_code}, Response: {response.text}")
-    except Exception as e:
-        print(f"[user notify error] {e}")
+def get_day_mask(date_str):
+    """Битовая маска занятости дня (см. occupancy.py)"""
+    prev_date, next_date = neighbour_dates(date_str)
+    with get_db() as conn:
+        rows = conn.execute("""
+            SELECT date, time, duration FROM bookings 
+            WHERE date BETWEEN ? AND ? AND status != 'cancelled'
+        """, (prev_date, next_date)).fetchall()
+    return build_day_mask(rows, date_str)
 
 # --- Маршруты для статики ---
 @app.route('/')
@@ -79,48 +64,12 @@ def telegram_auth():
 def get_available_times(date_str):
     try:
         duration = int(request.args.get('duration', 1))
-        conn = get_db()
-        cur = conn.cursor()
+        mask = get_day_mask(date_str)
         
-        # Получаем все временные слоты
-        cur.execute("SELECT time FROM time_slots ORDER BY time")
-        all_times = [row[0] for row in cur.fetchall()]
-        
-        # Получаем забронированные времена с длительностью для выбранной даты
-        cur.execute("""
-            SELECT time, duration FROM bookings 
-            WHERE date = ? AND status != 'cancelled'
-        """, (date_str,))
-        existing_bookings = cur.fetchall()
-        
-        # Создаем множество заблокированных временных слотов
-        blocked_times = set()
-        
-        for booking_time, booking_duration in existing_bookings:
-            # Вычисляем все временные слоты, которые заблокированы этим бронированием
-            start_time = datetime.strptime(booking_time, '%H:%M')
-            for i in range(booking_duration):
-                blocked_time = start_time + timedelta(hours=i)
-                blocked_times.add(blocked_time.strftime('%H:%M'))
-        
-        # Формируем список доступных стартовых слотов
-        available_times = []
-        for start_time in all_times:
-            # Проверяем, можно ли начать бронирование в это время
-            start_datetime = datetime.strptime(start_time, '%H:%M')
-            can_book = True
-            
-            for i in range(duration):
-                check_time = start_datetime + timedelta(hours=i)
-                check_time_str = check_time.strftime('%H:%M')
-                if check_time_str in blocked_times:
-                    can_book = False
-                    break
-            
-            if can_book:
-                available_times.append(start_time)
+        # Те же правила, что и в боте: зазоры вокруг броней, рабочее время, бронь не раньше чем за 1 час
+        first_hour = max(OPEN_HOUR, earliest_start_hour(date_str))
+        available_times = free_start_times(mask, duration, first_hour, CLOSE_HOUR)
         
-        conn.close()
         return jsonify({"success": True, "times": available_times})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -141,67 +90,50 @@ def create_booking():
             return jsonify({"success": False, "error": "Имя и номер телефона обязательны для бронирования."}), 400
         
         # Создаем анонимного пользователя или находим существующего по телефону
-        conn = get_db()
-        cur = conn.cursor()
-        
-        # Ищем пользователя по телефону
-        cur.execute("SELECT id FROM users WHERE phone = ?", (phone,))
-        user = cur.fetchone()
-        
-        if user:
-            user_id = user[0]
-            # Обновляем имя если оно изменилось
-            cur.execute("UPDATE users SET name = ? WHERE id = ?", (name, user_id))
-        else:
-            # Создаем нового пользователя
-            cur.execute(
-                "INSERT INTO users (name, phone, created_at) VALUES (?, ?, ?)",
-                (name, phone, datetime.now().isoformat())
+        # Выход из with возвращает подключение в пул и откатывает незавершенную транзакцию
+        with get_db() as conn:
+            cur = conn.cursor()
+            # Пользователь, проверка занятости и бронь - в одной транзакции
+            cur.execute("BEGIN IMMEDIATE")
+            
+            # Ищем пользователя по телефону
+            cur.execute("SELECT id FROM users WHERE phone = ?", (phone,))
+            user = cur.fetchone()
+            
+            if user:
+                user_id = user[0]
+                # Обновляем имя если оно изменилось
+                cur.execute("UPDATE users SET name = ? WHERE id = ?", (name, user_id))
+            else:
+                # Создаем нового пользователя
+                cur.execute(
+                    "INSERT INTO users (name, phone, created_at) VALUES (?, ?, ?)",
+                    (name, phone, datetime.now().isoformat())
+                )
+                user_id = cur.lastrowid
+            
+            total_price = data['guests'] * data['duration'] * 500
+            
+            # Проверяем доступность времени и создаем бронирование
+            result = book_slot_sync(
+                cur, user_id, data['date'], data['time'], data['guests'], data['duration'], total_price
             )
-            user_id = cur.lastrowid
-        
-        total_price = data['guests'] * data['duration'] * 500
-        
-        # Проверяем доступность времени
-        start_time = data['time']
-        duration = data['duration']
-        
-        # Получаем все занятые временные слоты для этой даты
-        cur.execute("""
-            SELECT time, duration FROM bookings 
-            WHERE date = ? AND status != 'cancelled'
-        """, (data['date'],))
-        existing_bookings = cur.fetchall()
-        
-        # Создаем множество заблокированных временных слотов
-        blocked_times = set()
-        
-        for existing_time, existing_duration in existing_bookings:
-            # Вычисляем все временные слоты, которые заблокированы этим бронированием
-            start_time_existing = datetime.strptime(existing_time, '%H:%M')
-            for i in range(existing_duration):
-                blocked_time = start_time_existing + timedelta(hours=i)
-                blocked_times.add(blocked_time.strftime('%H:%M'))
-        
-        # Проверяем, не пересекается ли новое бронирование с существующими
-        booking_start = datetime.strptime(start_time, '%H:%M')
-        for i in range(duration):
-            check_time = booking_start + timedelta(hours=i)
-            check_time_str = check_time.strftime('%H:%M')
-            if check_time_str in blocked_times:
-                return jsonify({"success": False, "error": f"Время {start_time} уже занято"}), 400
-        
-        # Создаем бронирование
-        cur.execute(
-            "INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status, created_at) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
-            (user_id, data['date'], data['time'], data['guests'], data['duration'], total_price, datetime.now().isoformat())
-        )
-        conn.commit()
-        booking_id = cur.lastrowid
-        conn.close()
-        
-        # Уведомляем админа
-        notify_admin(f"Новая заявка!\nИмя: {name}\nТелефон: {phone}\nДата: {data['date']}\nВремя: {data['time']}\nГости: {data['guests']}\nДлительность: {data['duration']} ч.\nID брони: {booking_id}")
+            if result.conflict:
+                conn.rollback()
+                if result.conflict == BOOKING_CONFLICT_HOURS:
+                    return jsonify({"success": False, "error": f"Бронирование возможно с {OPEN_HOUR:02d}:00 до {CLOSE_HOUR:02d}:00"}), 400
+                return jsonify({"success": False, "error": f"Время {data['time']} уже занято"}), 400
+            booking_id = result.booking_id
+            
+            # Уведомление админам - в outbox в той же транзакции, отправит воркер ботов
+            outbox.enqueue_admins_sync(
+                cur,
+                f"Новая заявка!\nИмя: {name}\nТелефон: {phone}\nДата: {data['date']}\nВремя: {data['time']}\nГости: {data['guests']}\nДлительность: {data['duration']} ч.\nID брони: {booking_id}",
+                event=outbox.EVENT_NEW,
+                summary=outbox.format_booking_line(booking_id, data['date'], data['time'], data['guests'], data['duration'], name),
+                starts_at=f"{data['date']} {data['time']}"
+            )
+            conn.commit()
         
         return jsonify({"success": True, "booking_id": booking_id, "total_price": total_price, "message": "Бронирование успешно создано!"})
     except Exception as e:
@@ -211,33 +143,32 @@ def create_booking():
 @app.route('/api/bookings', methods=['GET'])
 def get_user_bookings():
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        
-        # Получаем все бронирования с информацией о пользователях
-        cur.execute("""
-            SELECT b.id, b.date, b.time, b.guests, b.duration, b.total_price, b.status, 
-                   u.name, u.phone
-            FROM bookings b
-            JOIN users u ON b.user_id = u.id
-            ORDER BY b.date DESC, b.time DESC
-        """)
-        
-        bookings = []
-        for row in cur.fetchall():
-            bookings.append({
-                'id': row[0],
-                'date': row[1],
-                'time': row[2],
-                'guests': row[3],
-                'duration': row[4],
-                'total_price': row[5],
-                'status': row[6],
-                'name': row[7],
-                'phone': row[8]
-            })
-        
-        conn.close()
+        with get_db() as conn:
+            cur = conn.cursor()
+            
+            # Получаем все бронирования с информацией о пользователях
+            cur.execute("""
+                SELECT b.id, b.date, b.time, b.guests, b.duration, b.total_price, b.status, 
+                       u.name, u.phone
+                FROM bookings b
+                JOIN users u ON b.user_id = u.id
+                ORDER BY b.date DESC, b.time DESC
+            """)
+            
+            bookings = []
+            for row in cur.fetchall():
+                bookings.append({
+                    'id': row[0],
+                    'date': row[1],
+                    'time': row[2],
+                    'guests': row[3],
+                    'duration': row[4],
+                    'total_price': row[5],
+                    'status': row[6],
+                    'name': row[7],
+                    'phone': row[8]
+                })
+            
         return jsonify({"success": True, "bookings": bookings})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -246,26 +177,31 @@ def get_user_bookings():
 @app.route('/api/bookings/<int:booking_id>/cancel', methods=['POST'])
 def cancel_booking(booking_id):
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        
-        # Получаем информацию о бронировании перед отменой
-        cur.execute("SELECT u.telegram_id, b.date, b.time FROM bookings b JOIN users u ON b.user_id = u.id WHERE b.id = ?", (booking_id,))
-        booking_info = cur.fetchone()
-        
-        cur.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ? AND status != 'cancelled'", (booking_id,))
-        conn.commit()
-        affected = cur.rowcount
-        conn.close()
-        
-        if affected > 0:
-            # Уведомляем админа
-            notify_admin(f"Заявка отменена!\nID: {booking_id}")
+        with get_db() as conn:
+            cur = conn.cursor()
             
-            # Уведомляем пользователя если есть telegram_id
-            if booking_info and booking_info[0]:
-                notify_user(booking_info[0], f"Ваша бронь отменена!\nДата: {booking_info[1]}\nВремя: {booking_info[2]}")
+            # Получаем информацию о бронировании перед отменой
+            cur.execute("SELECT u.telegram_id, b.date, b.time FROM bookings b JOIN users u ON b.user_id = u.id WHERE b.id = ?", (booking_id,))
+            booking_info = cur.fetchone()
             
+            cur.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ? AND status != 'cancelled'", (booking_id,))
+            affected = cur.rowcount
+            
+            if affected > 0:
+                # Уведомления - в outbox в той же транзакции, что и отмена
+                outbox.enqueue_admins_sync(
+                    cur, f"Заявка отменена!\nID: {booking_id}",
+                    event=outbox.EVENT_CANCELLED,
+                    summary=outbox.format_booking_line(booking_id, booking_info[1], booking_info[2]) if booking_info else f"#{booking_id}",
+                    starts_at=f"{booking_info[1]} {booking_info[2]}" if booking_info else None
+                )
+            
+                # Уведомляем пользователя если есть telegram_id
+                if booking_info and booking_info[0]:
+                    outbox.enqueue_sync(cur, outbox.BOT_MAIN, booking_info[0], f"Ваша бронь отменена!\nДата: {booking_info[1]}\nВремя: {booking_info[2]}")
+            conn.commit()
+        
+        if affected > 0:
             return jsonify({"success": True, "message": "Бронирование успешно отменено!"})
         else:
             return jsonify({"success": False, "error": "Бронирование не найдено или уже отменено"}), 404
@@ -278,38 +214,37 @@ def admin_get_all_bookings():
     try:
         date_filter = request.args.get('date')
         today = datetime.now().date().isoformat()
-        conn = get_db()
-        cur = conn.cursor()
-        base_query = '''
-            SELECT b.id, b.user_id, u.name, u.phone, b.date, b.time, b.guests, b.duration, b.total_price, b.status, b.created_at
-            FROM bookings b
-            LEFT JOIN users u ON b.user_id = u.id
-        '''
-        params = []
-        if date_filter:
-            base_query += ' WHERE b.date = ?'
-            params.append(date_filter)
-        else:
-            base_query += ' WHERE b.date >= ?'
-            params.append(today)
-        base_query += ' ORDER BY b.date DESC, b.time DESC'
-        cur.execute(base_query, params)
-        bookings = []
-        for row in cur.fetchall():
-            bookings.append({
-                "id": row[0],
-                "user_id": row[1],
-                "name": row[2],
-                "phone": row[3],
-                "date": row[4],
-                "time": row[5],
-                "guests": row[6],
-                "duration": row[7],
-                "total_price": row[8],
-                "status": row[9],
-                "created_at": row[10]
-            })
-        conn.close()
+        with get_db() as conn:
+            cur = conn.cursor()
+            base_query = '''
+                SELECT b.id, b.user_id, u.name, u.phone, b.date, b.time, b.guests, b.duration, b.total_price, b.status, b.created_at
+                FROM bookings b
+                LEFT JOIN users u ON b.user_id = u.id
+            '''
+            params = []
+            if date_filter:
+                base_query += ' WHERE b.date = ?'
+                params.append(date_filter)
+            else:
+                base_query += ' WHERE b.date >= ?'
+                params.append(today)
+            base_query += ' ORDER BY b.date DESC, b.time DESC'
+            cur.execute(base_query, params)
+            bookings = []
+            for row in cur.fetchall():
+                bookings.append({
+                    "id": row[0],
+                    "user_id": row[1],
+                    "name": row[2],
+                    "phone": row[3],
+                    "date": row[4],
+                    "time": row[5],
+                    "guests": row[6],
+                    "duration": row[7],
+                    "total_price": row[8],
+                    "status": row[9],
+                    "created_at": row[10]
+                })
         return jsonify({"success": True, "bookings": bookings})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -317,12 +252,11 @@ def admin_get_all_bookings():
 @app.route('/api/admin/bookings/<int:booking_id>/cancel', methods=['POST'])
 def admin_cancel_booking(booking_id):
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ? AND status != 'cancelled'", (booking_id,))
-        conn.commit()
-        affected = cur.rowcount
-        conn.close()
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ? AND status != 'cancelled'", (booking_id,))
+            conn.commit()
+            affected = cur.rowcount
         if affected > 0:
             return jsonify({"success": True, "message": "Бронирование успешно отменено!"})
         else:
@@ -344,12 +278,22 @@ def admin_edit_booking(booking_id):
         if not set_clauses:
             return jsonify({"success": False, "error": "Нет данных для обновления."}), 400
         values.append(booking_id)
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute(f"UPDATE bookings SET {', '.join(set_clauses)} WHERE id = ?", values)
-        conn.commit()
-        affected = cur.rowcount
-        conn.close()
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(f"UPDATE bookings SET {', '.join(set_clauses)} WHERE id = ?", values)
+            affected = cur.rowcount
+            if affected > 0:
+                cur.execute("SELECT date, time, guests, duration FROM bookings WHERE id = ?", (booking_id,))
+                booking = cur.fetchone()
+                changes = ", ".join(f"{field}: {data[field]}" for field in allowed_fields if field in data)
+                # Уведомление админам - в outbox в той же транзакции, что и изменение
+                outbox.enqueue_admins_sync(
+                    cur, f"Заявка изменена через панель!\nID: {booking_id}\n{changes}",
+                    event=outbox.EVENT_CHANGED,
+                    summary=f"{outbox.format_booking_line(booking_id, *booking)}: {changes}",
+                    starts_at=f"{booking[0]} {booking[1]}"
+                )
+            conn.commit()
         if affected > 0:
             return jsonify({"success": True, "message": "Бронирование успешно обновлено!"})
         else:
@@ -360,12 +304,11 @@ def admin_edit_booking(booking_id):
 @app.route('/api/admin/bookings/<int:booking_id>/delete', methods=['POST'])
 def admin_delete_booking(booking_id):
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
-        conn.commit()
-        affected = cur.rowcount
-        conn.close()
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+            conn.commit()
+            affected = cur.rowcount
         if affected > 0:
             return jsonify({"success": True, "message": "Бронирование полностью удалено!"})
         else:
@@ -0,0 +1,92 @@
+"""
+Плоская выгрузка бронирований для бухгалтерии: CSV (gzip) и XLSX.
+
+Строки читаются пачками по ключу (db.iter_bookings_for_export) и сразу
+дописываются в файл, поэтому расход памяти не зависит от числа броней.
+Запись пачки и сжатие выполняются в отдельном потоке, чтобы не задерживать
+цикл событий ботов.
+
+openpyxl - необязательная зависимость: без нее доступен только CSV.
+"""
+import asyncio
+import csv
+import gzip
+from typing import Optional
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+from db import iter_bookings_for_export
+
+FORMAT_CSV = "csv"
+FORMAT_XLSX = "xlsx"
+FILE_EXTENSIONS = {
+    FORMAT_CSV: "csv.gz",
+    FORMAT_XLSX: "xlsx",
+}
+
+# Заголовки в порядке колонок запроса выгрузки
+HEADERS = [
+    "ID", "Дата", "Время", "Гости", "Длительность, ч", "Стоимость, ₽", "Статус",
+    "Комментарий", "Создано", "Имя", "Телефон", "Telegram ID", "Username"
+]
+
+
+def is_xlsx_available() -> bool:
+    """Установлен ли openpyxl"""
+    return Workbook is not None
+
+
+async def export_bookings_csv(filepath: str, start_date: str = None, end_date: str = None) -> int:
+    """Выгрузить бронирования в CSV, сжатый gzip. Возвращает число строк"""
+    # utf-8-sig - чтобы Excel сразу открыл кириллицу
+    with gzip.open(filepath, "wt", encoding="utf-8-sig", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(HEADERS)
+        count = 0
+        batches = iter_bookings_for_export(start_date, end_date)
+        try:
+            async for rows in batches:
+                await asyncio.to_thread(writer.writerows, rows)
+                count += len(rows)
+        finally:
+            # Закрываем генератор здесь же, а не в сборщике мусора
+            await batches.aclose()
+    return count
+
+
+async def export_bookings_xlsx(filepath: str, start_date: str = None, end_date: str = None) -> int:
+    """Выгрузить бронирования в XLSX. Возвращает число строк
+
+    Книга в режиме write_only: строки сразу уходят во временный файл openpyxl.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Бронирования")
+    sheet.append(HEADERS)
+    count = 0
+    batches = iter_bookings_for_export(start_date, end_date)
+    try:
+        async for rows in batches:
+            await asyncio.to_thread(_append_rows, sheet, rows)
+            count += len(rows)
+    finally:
+        await batches.aclose()
+    await asyncio.to_thread(workbook.save, filepath)
+    return count
+
+
+def _append_rows(sheet, rows):
+    for row in rows:
+        sheet.append(row)
+
+
+async def export_bookings_table(export_format: str, filepath: str, start_date: str = None,
+                                end_date: str = None) -> Optional[int]:
+    """Выгрузить бронирования в нужном формате (None - формат недоступен)"""
+    if export_format == FORMAT_CSV:
+        return await export_bookings_csv(filepath, start_date, end_date)
+    if export_format == FORMAT_XLSX and is_xlsx_available():
+        return await export_bookings_xlsx(filepath, start_date, end_date)
+    return None
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки брони, созданной админом (db.create_booking_by_admin)
+"""
+
+import asyncio
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+import db
+import db_pool
+from conftest import seed_booking, seed_user
+
+
+async def count_users():
+    async with db_pool.acquire() as conn:
+        async with conn.execute("SELECT COUNT(*) FROM users") as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def check_admin_booking():
+    day = (date.today() + timedelta(days=1)).isoformat()
+    async with db_pool.acquire() as conn:
+        await seed_user(conn)
+        await seed_booking(conn, day)
+        await conn.commit()
+
+    # Время занято - новый пользователь с telegram_id не остается в базе
+    result = await db.create_booking_by_admin(
+        day, "13:00", 2, 2, "Новый гость", "+71111111111", telegram_id=777, total_price=1000
+    )
+    assert not result.ok and result.conflict
+    assert await count_users() == 1
+    assert await db.get_user_by_telegram_id(777) is None
+
+    # Время свободно - пользователь и бронь создаются вместе
+    result = await db.create_booking_by_admin(
+        day, "16:00", 2, 2, "Новый гость", "+71111111111", telegram_id=777, total_price=1000
+    )
+    assert result.ok
+    user = await db.get_user_by_telegram_id(777)
+    assert user["name"] == "Новый гость" and user["phone"] == "+71111111111", user
+    assert await count_users() == 2
+
+
+def test_admin_booking(temp_db):
+    print("🧪 Проверка брони от админа...")
+    asyncio.run(check_admin_booking())
+    print("   ✅ При занятом времени не остается ни брони, ни нового пользователя")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки тепловой карты загрузки (analytics.py)
+"""
+
+import random
+
+import analytics
+
+
+def reference_heatmap(bookings, day_counts):
+    """Та же тепловая карта, посчитанная циклом по часам каждой брони"""
+    booked = [[0] * 24 for _ in range(7)]
+    guests = [[0.0] * 24 for _ in range(7)]
+    revenue = [[0.0] * 24 for _ in range(7)]
+    for weekday, start_hour, duration, party, price in bookings:
+        for offset in range(duration):
+            slot = (weekday * 24 + start_hour + offset) % (7 * 24)
+            day, hour = divmod(slot, 24)
+            booked[day][hour] += 1
+            guests[day][hour] += party
+            revenue[day][hour] += price / duration
+    return booked, guests, revenue
+
+
+def test_heatmap_matches_loop():
+    """Векторный расчет совпадает с расчетом в цикле, включая брони через полночь"""
+    if not analytics.is_available():
+        print("   ⚠️ numpy не установлен, тест пропущен")
+        return
+    np = analytics.np
+    print("🧪 Сравнение тепловой карты с расчетом в цикле...")
+    random.seed(5)
+    bookings = [
+        (random.randint(0, 6), random.randint(10, 23), random.randint(1, 6),
+         random.randint(1, 15), random.randint(1, 60) * 100)
+        for _ in range(400)
+    ]
+    arrays = {
+        "weekday": np.array([b[0] for b in bookings]),
+        "start_hour": np.array([b[1] for b in bookings]),
+        "duration": np.array([b[2] for b in bookings]),
+        "guests": np.array([b[3] for b in bookings], dtype=float),
+        "price": np.array([b[4] for b in bookings], dtype=float),
+    }
+    day_counts = analytics.weekday_counts("2030-01-01", "2030-03-31")
+    assert day_counts.sum() == 90
+
+    heatmap = analytics.compute_heatmap(arrays, day_counts)
+    booked, guests, revenue = reference_heatmap(bookings, day_counts)
+    for day in range(7):
+        for hour in range(24):
+            assert np.isclose(heatmap["utilisation"][day, hour], booked[day][hour] / day_counts[day])
+            if booked[day][hour]:
+                assert np.isclose(heatmap["avg_guests"][day, hour], guests[day][hour] / booked[day][hour])
+                assert np.isclose(heatmap["revenue_per_hour"][day, hour], revenue[day][hour] / booked[day][hour])
+    assert heatmap["booked_hours"] == sum(b[2] for b in bookings)
+    print("   ✅ Результаты совпадают")
+
+
+def test_weekday_counts():
+    """2030-01-07 - понедельник"""
+    if not analytics.is_available():
+        return
+    assert list(analytics.weekday_counts("2030-01-07", "2030-01-07")) == [1, 0, 0, 0, 0, 0, 0]
+    assert list(analytics.weekday_counts("2030-01-07", "2030-01-20")) == [2] * 7
+
+
+if __name__ == "__main__":
+    test_heatmap_matches_loop()
+    test_weekday_counts()
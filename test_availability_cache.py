@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша доступности и настроек (db.py)
+"""
+
+import asyncio
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+import db
+import db_pool
+from conftest import seed_booking, seed_user
+
+
+def write_from_other_process(db_path, query, params=()):
+    """Запись отдельным подключением - как из веб-сервера или другого бота"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(query, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def read_table_version(db_path, name):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT version FROM table_versions WHERE name = ?", (name,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+async def check_availability_cache(db_path):
+    tomorrow = date.today() + timedelta(days=1)
+    days = [(tomorrow + timedelta(days=i)).isoformat() for i in range(7)]
+    async with db_pool.acquire() as conn:
+        await seed_user(conn)
+        # Разная занятость по дням, в том числе бронь через полночь и отмененная
+        for day, time, duration, status in (
+            (days[0], "12:00", 2, "confirmed"),
+            (days[0], "18:00", 3, "pending"),
+            (days[2], "20:00", 6, "confirmed"),
+            (days[3], "10:00", 4, "cancelled"),
+            (days[5], "14:00", 1, "confirmed"),
+        ):
+            await seed_booking(conn, day, time, duration, status)
+        await conn.execute(
+            "INSERT INTO bot_settings (setting_key, setting_value) VALUES ('welcome_text', 'Привет')"
+        )
+        await conn.commit()
+
+    # Календарь на неделю совпадает с выбором времени по каждому дню
+    for duration in (1, 2, 3):
+        counts = await db.get_availability_range(days[0], days[-1], duration)
+        assert list(counts) == days
+        db.invalidate_availability()
+        for day in days:
+            times = await db.get_available_times(day, duration)
+            assert counts[day] == len(times), (day, duration, counts[day], times)
+    assert await db.get_availability_range(days[1], days[0]) == {}
+
+    # Повторное чтение дня - из кэша
+    before = db.get_availability_cache_stats()
+    free_before = await db.get_available_times(days[1], 1)
+    assert db.get_availability_cache_stats()["hits"] == before["hits"] + 1
+
+    # Бронь из другого процесса увеличивает версию bookings, следующее чтение - промах
+    version = read_table_version(db_path, "bookings")
+    write_from_other_process(
+        db_path,
+        "INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status) "
+        "VALUES (1, ?, '15:00', 2, 2, 1000, 'confirmed')", (days[1],)
+    )
+    assert read_table_version(db_path, "bookings") > version
+    stats = db.get_availability_cache_stats()
+    free_after = await db.get_available_times(days[1], 1)
+    assert db.get_availability_cache_stats()["misses"] == stats["misses"] + 1
+    assert "15:00" in free_before and "15:00" not in free_after
+
+    # Настройка, измененная другим процессом, видна после проверки версии
+    assert await db.get_setting("welcome_text") == "Привет"
+    version = await db.get_settings_version()
+    write_from_other_process(
+        db_path, "UPDATE bot_settings SET setting_value = 'Здравствуйте' WHERE setting_key = 'welcome_text'"
+    )
+    assert read_table_version(db_path, "bot_settings") > version
+    assert await db.get_setting("welcome_text") == "Здравствуйте"
+    assert await db.get_settings_version() == read_table_version(db_path, "bot_settings")
+
+
+def test_availability_cache(temp_db, monkeypatch):
+    print("🧪 Проверка кэша доступности и настроек...")
+    # Версии таблиц перечитываются при каждом обращении
+    monkeypatch.setattr(db, "AVAILABILITY_VERSION_TTL", 0)
+    monkeypatch.setattr(db, "SETTINGS_VERSION_TTL", 0)
+    asyncio.run(check_availability_cache(temp_db))
+    print("   ✅ Календарь совпадает с выбором времени, запись из другого процесса сбрасывает кэш")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки постраничного просмотра броней (db.get_bookings_page)
+"""
+
+import asyncio
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import db
+import db_pool
+from conftest import seed_booking, seed_user
+
+
+async def check_past_pages():
+    today = date.today()
+    now = datetime.now()
+    finished = now - timedelta(hours=2)
+    started = now - timedelta(hours=1)
+    async with db_pool.acquire() as conn:
+        await seed_user(conn)
+        # 25 прошедших броней, отмененная и будущая в список не попадают
+        for day in range(1, 26):
+            await seed_booking(conn, (today - timedelta(days=day)).isoformat())
+        await seed_booking(conn, (today - timedelta(days=3)).isoformat(), status="cancelled")
+        await seed_booking(conn, (today + timedelta(days=1)).isoformat(), status="pending")
+        # Закончилась час назад - прошедшая; началась час назад на 3 часа - идет сейчас
+        await seed_booking(conn, finished.strftime("%Y-%m-%d"), finished.strftime("%H:%M"), duration=1)
+        await seed_booking(conn, started.strftime("%Y-%m-%d"), started.strftime("%H:%M"), duration=3)
+        await conn.commit()
+
+        # Первая страница идет по индексу (date, time) без сортировки всей выборки
+        for scope in ("past", "current"):
+            condition, newest_first = db.BOOKING_PAGE_SCOPES[scope]
+            order = "DESC" if newest_first else "ASC"
+            async with conn.execute(f"""
+                EXPLAIN QUERY PLAN SELECT b.id FROM bookings b JOIN users u ON b.user_id = u.id
+                WHERE {condition} ORDER BY b.date {order}, b.time {order}, b.id {order} LIMIT 11
+            """) as cursor:
+                plan = " ".join(row[3] for row in await cursor.fetchall())
+            assert "idx_bookings_date_time" in plan and "TEMP B-TREE" not in plan, (scope, plan)
+
+    dates = []
+    page = await db.get_bookings_page("past")
+    while True:
+        dates.extend(row[2] for row in page.rows)
+        if not page.next_key:
+            break
+        page = await db.get_bookings_page("past", page.next_key, "next")
+    expected = [finished.strftime("%Y-%m-%d")] + [(today - timedelta(days=day)).isoformat() for day in range(1, 26)]
+    assert dates == expected, dates
+
+    # Назад с последней страницы - предыдущие 10 броней
+    page = await db.get_bookings_page("past", page.prev_key, "prev")
+    assert [row[2] for row in page.rows] == expected[10:20]
+
+    # Идущая сейчас бронь - только в своем списке
+    page = await db.get_bookings_page("current")
+    assert [(row[2], row[3]) for row in page.rows] == [(started.strftime("%Y-%m-%d"), started.strftime("%H:%M"))]
+
+
+def test_past_pages(temp_db):
+    print("🧪 Проверка страниц прошедших броней...")
+    asyncio.run(check_past_pages())
+    print("   ✅ Прошедшие и идущие брони идут по индексу (date, time) без пропусков и повторов")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки рассылки (broadcast.py)
+
+Вместо api.telegram.org запросы принимает локальный aiohttp-сервер.
+"""
+
+import asyncio
+import sys
+import time
+
+import pytest
+from aiohttp import web
+
+import broadcast
+import db_pool
+import http_client
+from conftest import seed_user
+
+
+async def check_broadcast(monkeypatch):
+    async with db_pool.acquire() as db:
+        for user_id in range(1, 121):
+            # Пользователь без Telegram не попадает в рассылку
+            telegram_id = None if user_id == 7 else 1000 + user_id
+            await seed_user(db, user_id, f"Гость {user_id}", f"+7{user_id:010d}", telegram_id)
+        await db.commit()
+
+    calls = []
+    limited = {"done": False}
+    failed_once = {"done": False}
+
+    async def send_message(request):
+        data = await request.json()
+        calls.append(data["chat_id"])
+        if data["chat_id"] == 1010 and not limited["done"]:
+            limited["done"] = True
+            return web.json_response(
+                {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}}, status=429
+            )
+        if data["chat_id"] == 1020:
+            return web.json_response({"ok": False, "description": "Forbidden"}, status=403)
+        if data["chat_id"] == 1030 and not failed_once["done"]:
+            failed_once["done"] = True
+            return web.json_response({"ok": False, "description": "Bad Gateway"}, status=502)
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    monkeypatch.setattr(http_client, "TELEGRAM_API_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(broadcast, "_bucket", broadcast.TokenBucket(rate=200, capacity=20))
+    monkeypatch.setattr(broadcast, "BROADCAST_RETRY_DELAY", 0.01)
+    try:
+        assert await broadcast.count_recipients(broadcast.SEGMENT_ALL) == 119
+        broadcast_id = await broadcast.create_broadcast("Акция!", broadcast.SEGMENT_ALL)
+
+        # Пауза после первой пачки
+        progress = []
+
+        async def on_progress(item):
+            progress.append(item)
+            broadcast.pause_broadcast(broadcast_id)
+
+        assert broadcast.start_broadcast(broadcast_id, "MAIN", on_progress)
+        assert not broadcast.start_broadcast(broadcast_id, "MAIN")
+        await broadcast._running[broadcast_id]
+        item = await broadcast.get_broadcast(broadcast_id)
+        assert item["status"] == broadcast.BROADCAST_PAUSED, item
+        # Первая пачка - 50 пользователей с Telegram (id 7 пропущен)
+        assert item["last_user_id"] == broadcast.BROADCAST_BATCH_SIZE + 1
+        assert [u["id"] for u in await broadcast.list_unfinished_broadcasts()] == [broadcast_id]
+
+        # Продолжение с точки: никто не получает сообщение дважды
+        item = await broadcast.run_broadcast(broadcast_id, "MAIN")
+        assert item["status"] == broadcast.BROADCAST_DONE, item
+        assert item["sent"] == 118 and item["failed"] == 1, item
+        assert calls.count(1010) == 2
+        # 502 повторяется, 403 - нет
+        assert calls.count(1030) == 2 and calls.count(1020) == 1
+        assert len([chat_id for chat_id in calls if chat_id not in (1010, 1030)]) == 117
+        assert not await broadcast.list_unfinished_broadcasts()
+    finally:
+        await http_client.close_http()
+        await runner.cleanup()
+
+
+async def check_token_bucket():
+    bucket = broadcast.TokenBucket(rate=50, capacity=5)
+    started = time.monotonic()
+    for _ in range(30):
+        await bucket.acquire()
+    # 5 сразу из запаса, остальные 25 - со скоростью 50 в секунду
+    return time.monotonic() - started
+
+
+def test_token_bucket():
+    elapsed = asyncio.run(check_token_bucket())
+    assert 0.4 <= elapsed < 1.5, elapsed
+
+
+def test_broadcast_resume(temp_db, monkeypatch):
+    print("🧪 Проверка рассылки с паузой и продолжением...")
+    asyncio.run(check_broadcast(monkeypatch))
+    print("   ✅ Рассылка продолжается с точки без повторных сообщений")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки дневных агрегатов daily_stats (триггеры миграции 9)
+"""
+
+import asyncio
+import random
+
+import aiosqlite
+
+from migrations import run_migrations
+
+
+async def fetch(db, query, params=()):
+    async with db.execute(query, params) as cursor:
+        return await cursor.fetchall()
+
+
+async def check_rollup():
+    """После случайных изменений агрегаты совпадают с расчетом по исходным таблицам"""
+    random.seed(11)
+    async with aiosqlite.connect(":memory:") as db:
+        await run_migrations(db)
+        await db.execute("INSERT INTO users (name) VALUES ('Тест')")
+
+        dates = [f"2030-03-{day:02d}" for day in range(1, 6)]
+        for _ in range(300):
+            action = random.random()
+            if action < 0.4:
+                await db.execute(
+                    "INSERT INTO bookings (user_id, date, time, guests, duration, total_price, status) "
+                    "VALUES (1, ?, '12:00', ?, ?, ?, ?)",
+                    (random.choice(dates), random.randint(1, 12), random.randint(1, 4),
+                     random.randint(1, 50) * 100, random.choice(["pending", "confirmed", "cancelled"]))
+                )
+            elif action < 0.6:
+                await db.execute(
+                    "UPDATE bookings SET status = ?, date = ?, total_price = total_price + 100 "
+                    "WHERE id = (SELECT id FROM bookings ORDER BY RANDOM() LIMIT 1)",
+                    (random.choice(["pending", "confirmed", "cancelled"]), random.choice(dates))
+                )
+            elif action < 0.7:
+                await db.execute("DELETE FROM bookings WHERE id = (SELECT id FROM bookings ORDER BY RANDOM() LIMIT 1)")
+            elif action < 0.85:
+                await db.execute(
+                    "INSERT INTO expenses (date, amount) VALUES (?, ?)",
+                    (random.choice(dates), random.randint(1, 30) * 100)
+                )
+            elif action < 0.95:
+                await db.execute(
+                    "UPDATE expenses SET amount = ?, date = ? "
+                    "WHERE id = (SELECT id FROM expenses ORDER BY RANDOM() LIMIT 1)",
+                    (random.randint(1, 30) * 100, random.choice(dates))
+                )
+            else:
+                await db.execute("DELETE FROM expenses WHERE id = (SELECT id FROM expenses ORDER BY RANDOM() LIMIT 1)")
+
+        for day in dates:
+            expected = (await fetch(db, """
+                SELECT COUNT(*), COALESCE(SUM(total_price), 0), COALESCE(SUM(guests), 0), COALESCE(SUM(duration), 0)
+                FROM bookings WHERE date = ? AND status != 'cancelled'
+            """, (day,)))[0] + (await fetch(db, """
+                SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM expenses WHERE date = ?
+            """, (day,)))[0]
+            rows = await fetch(db, """
+                SELECT bookings, revenue, guests, hours, expenses, expenses_count
+                FROM daily_stats WHERE date = ?
+            """, (day,))
+            actual = rows[0] if rows else (0, 0, 0, 0, 0, 0)
+            assert tuple(actual) == tuple(expected), (day, actual, expected)
+
+
+def test_daily_stats_rollup():
+    print("🧪 Проверка дневных агрегатов...")
+    asyncio.run(check_rollup())
+    print("   ✅ Агрегаты совпадают с исходными данными")
+
+
+if __name__ == "__main__":
+    test_daily_stats_rollup()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки пакетного добавления расходов (db.add_expenses_bulk)
+"""
+
+import asyncio
+import sys
+
+import pytest
+
+import db
+import db_pool
+
+
+async def count_expenses():
+    async with db_pool.acquire() as conn:
+        async with conn.execute("SELECT COUNT(*) FROM expenses") as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def check_expenses_bulk():
+    first = await db.add_expense("2025-01-01", 1500, "Продукты", "до пачки")
+
+    # Одна неверная запись - не пишется вся пачка
+    bad_batch = [
+        {"date": "2025-01-02", "amount": 100, "category": "Продукты"},
+        {"date": "02.01.2025", "amount": 200},
+        {"date": "2025-01-03", "amount": 300},
+    ]
+    try:
+        await db.add_expenses_bulk(bad_batch)
+    except ValueError as e:
+        assert "Запись 2" in str(e), e
+    else:
+        raise AssertionError("ожидалась ValueError")
+    assert await count_expenses() == 1
+
+    batch = [
+        {"date": "2025-01-0%d" % day, "amount": day * 100, "description": f"расход {day}"}
+        for day in range(1, 8)
+    ]
+    ids = await db.add_expenses_bulk(batch)
+    assert ids == list(range(first + 1, first + 1 + len(batch))), ids
+    assert await count_expenses() == 1 + len(batch)
+
+    # ID соответствуют записям пачки по порядку
+    async with db_pool.acquire() as conn:
+        async with conn.execute(
+            "SELECT id, amount, description FROM expenses WHERE id > ? ORDER BY id", (first,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+    assert [(row[1], row[2]) for row in rows] == [(e["amount"], e["description"]) for e in batch]
+    assert [row[0] for row in rows] == ids
+
+
+def test_expenses_bulk(temp_db):
+    print("🧪 Проверка пакетного добавления расходов...")
+    asyncio.run(check_expenses_bulk())
+    print("   ✅ Неверная пачка не пишется, ID верной пачки идут подряд и по порядку")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша файлов выгрузки (export_cache.py)
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+import db_pool
+import export_cache
+from conftest import seed_booking, seed_user
+
+
+async def check_cache(workdir):
+    async with db_pool.acquire() as db:
+        await seed_user(db, 1, "Тест")
+        await seed_user(db, 2, "Гость февраля")
+        await seed_booking(db, "2030-01-10", total_price=1600)
+        await db.commit()
+
+    january = await export_cache.make_key("pdf", "2030-01-01", "2030-01-31")
+    february = await export_cache.make_key("pdf", "2030-02-01", "2030-02-28")
+    assert january != await export_cache.make_key("csv", "2030-01-01", "2030-01-31")
+
+    source = os.path.join(workdir, "export.pdf")
+    with open(source, "wb") as file:
+        file.write(b"x" * 100)
+    filepath = await export_cache.store(january, source, "pdf")
+    await export_cache.remember_file_id(january, "FILE_ID")
+    assert await export_cache.lookup(january) == (filepath, "FILE_ID")
+
+    # Изменение брони февраля не трогает ключ января
+    async with db_pool.acquire() as db:
+        await seed_booking(db, "2030-02-05", total_price=1600)
+        await db.commit()
+    assert await export_cache.make_key("pdf", "2030-01-01", "2030-01-31") == january
+    assert await export_cache.make_key("pdf", "2030-02-01", "2030-02-28") != february
+
+    # Изменение брони января и данных пользователя - меняют
+    async with db_pool.acquire() as db:
+        await db.execute("UPDATE bookings SET guests = 3 WHERE date = '2030-01-10'")
+        await db.commit()
+    changed = await export_cache.make_key("pdf", "2030-01-01", "2030-01-31")
+    assert changed != january
+    async with db_pool.acquire() as db:
+        await db.execute("UPDATE users SET phone = '+7000' WHERE id = 1")
+        await db.commit()
+    assert await export_cache.make_key("pdf", "2030-01-01", "2030-01-31") != changed
+
+    # Пользователь с бронями только в феврале не трогает январь
+    async with db_pool.acquire() as db:
+        await seed_booking(db, "2030-02-07", total_price=1600, user_id=2)
+        await db.commit()
+    january_now = await export_cache.make_key("pdf", "2030-01-01", "2030-01-31")
+    february_now = await export_cache.make_key("pdf", "2030-02-01", "2030-02-28")
+    async with db_pool.acquire() as db:
+        await db.execute("UPDATE users SET name = 'Гость' WHERE id = 2")
+        await db.commit()
+    assert await export_cache.make_key("pdf", "2030-01-01", "2030-01-31") == january_now
+    assert await export_cache.make_key("pdf", "2030-02-01", "2030-02-28") != february_now
+
+    # LRU: при превышении лимита удаляется давно не использованный файл
+    source = os.path.join(workdir, "export2.pdf")
+    with open(source, "wb") as file:
+        file.write(b"y" * 100)
+    await export_cache.store(changed, source, "pdf")
+    assert await export_cache.evict(keep_key=changed, max_bytes=150) == 1
+    assert await export_cache.lookup(january) is None
+    assert not os.path.exists(filepath)
+    assert await export_cache.lookup(changed) is not None
+
+
+def test_export_cache(temp_db, tmp_path, monkeypatch):
+    print("🧪 Проверка кэша выгрузок...")
+    monkeypatch.setattr(export_cache, "EXPORT_CACHE_DIR", str(tmp_path / "cache"))
+    asyncio.run(check_cache(str(tmp_path)))
+    print("   ✅ Ключи и вытеснение работают верно")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки переноса медиа в основной бот (media_bridge.py)
+
+Вместо api.telegram.org запросы принимает локальный aiohttp-сервер.
+"""
+
+import asyncio
+import sys
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+import http_client
+import media_bridge
+
+FILE_SIZE = 3 * 1024 * 1024
+ADMIN_TOKEN = "111:ADMIN"
+MAIN_TOKEN = "222:MAIN"
+
+
+class FakeTelegram:
+    """Локальная замена Bot API для getFile, скачивания файла и sendPhoto"""
+
+    def __init__(self):
+        self.calls = []
+        self.uploaded = 0
+
+    async def get_file(self, request):
+        self.calls.append("getFile")
+        return web.json_response({"ok": True, "result": {
+            "file_id": "ADMIN_ID", "file_unique_id": "UNIQUE", "file_path": "photos/file_1.jpg"
+        }})
+
+    async def download(self, request):
+        self.calls.append("download")
+        assert request.match_info["token"] == ADMIN_TOKEN
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(FILE_SIZE // 65536):
+            await response.write(b"\xff" * 65536)
+        await response.write_eof()
+        return response
+
+    async def send_photo(self, request):
+        self.calls.append("sendPhoto")
+        assert request.match_info["token"] == MAIN_TOKEN
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename:
+                while chunk := await part.read_chunk():
+                    self.uploaded += len(chunk)
+        return web.json_response({"ok": True, "result": {
+            "message_id": 7, "date": 0, "chat": {"id": 1, "type": "private"},
+            "photo": [{"file_id": "MAIN_ID", "file_unique_id": "OTHER", "width": 1, "height": 1}]
+        }})
+
+    async def delete_message(self, request):
+        self.calls.append("deleteMessage")
+        return web.json_response({"ok": True, "result": True})
+
+
+async def check_transfer(monkeypatch):
+    fake = FakeTelegram()
+    app = web.Application(client_max_size=FILE_SIZE * 2)
+    app.router.add_post("/bot{token}/getFile", fake.get_file)
+    app.router.add_get("/file/bot{token}/{path:.+}", fake.download)
+    app.router.add_post("/bot{token}/sendPhoto", fake.send_photo)
+    app.router.add_post("/bot{token}/deleteMessage", fake.delete_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    monkeypatch.setattr(http_client, "TELEGRAM_API_URL", base_url)
+    api = TelegramAPIServer.from_base(base_url)
+    for token in (ADMIN_TOKEN, MAIN_TOKEN):
+        http_client._bots[token] = Bot(token=token, session=AiohttpSession(api=api))
+    try:
+        args = ("ADMIN_ID", "UNIQUE", media_bridge.MEDIA_PHOTO, ADMIN_TOKEN, MAIN_TOKEN, 1)
+        assert await media_bridge.transfer_media(*args) == "MAIN_ID"
+        assert fake.calls == ["getFile", "sendPhoto", "download", "deleteMessage"], fake.calls
+        assert fake.uploaded == FILE_SIZE, fake.uploaded
+
+        # Повторная загрузка того же файла - из кэша, без запросов
+        assert await media_bridge.transfer_media(*args) == "MAIN_ID"
+        assert len(fake.calls) == 4, fake.calls
+    finally:
+        await http_client.close_http()
+        await runner.cleanup()
+
+
+def test_transfer_media(temp_db, monkeypatch):
+    print("🧪 Проверка переноса фото в основной бот...")
+    asyncio.run(check_transfer(monkeypatch))
+    print("   ✅ Файл передан потоком, повторная загрузка взята из кэша")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки битовой маски занятости (occupancy.py)
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from occupancy import build_day_mask, conflicts, earliest_start_hour, free_start_hours
+
+OPEN_HOUR = 10
+CLOSE_HOUR = 22
+
+
+def reference_blocked_hours(bookings, selected_date):
+    """Прежняя логика блокировки из db.get_available_times (на множествах строк)"""
+    prev_date = (datetime.strptime(selected_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    blocked = set()
+    for booking_date, booking_time, duration in bookings:
+        start = int(booking_time[:2])
+        if booking_date == selected_date:
+            blocked.update(range(max(start - 1, 0), min(start + duration + 1, 24)))
+        elif booking_date == prev_date and start + duration >= 24:
+            blocked.update(range(0, min((start + duration) % 24 + 1, 24)))
+    return blocked
+
+
+def test_single_booking_buffers():
+    """Бронь 15:00 на 2 часа блокирует 14:00-17:00 включительно"""
+    print("🧪 Проверка зазоров вокруг брони...")
+    mask = build_day_mask([("2030-05-10", "15:00", 2)], "2030-05-10")
+    free = free_start_hours(mask, 1, OPEN_HOUR, CLOSE_HOUR)
+    print(f"   📋 Свободно: {free}")
+    assert 13 in free and 18 in free
+    for hour in (14, 15, 16, 17):
+        assert hour not in free
+    # 11:00 на 3 часа заканчивается ровно к зазору, на 4 часа - заходит в него
+    assert not conflicts(mask, 11, 3)
+    assert conflicts(mask, 11, 4)
+    print("   ✅ Зазоры учитываются")
+
+
+def test_cross_midnight():
+    """Бронь 22:00 на 4 часа занимает утро следующего дня"""
+    print("🧪 Проверка брони через полночь...")
+    mask = build_day_mask([("2030-05-09", "22:00", 4)], "2030-05-10")
+    assert conflicts(mask, 2, 1)
+    assert not conflicts(mask, 3, 1)
+    # Бронь следующего дня с утра не даёт занять вечер выбранного дня
+    mask = build_day_mask([("2030-05-11", "00:00", 2)], "2030-05-10")
+    assert conflicts(mask, 22, 2)
+    assert not conflicts(mask, 20, 3)
+    print("   ✅ Соседние дни учитываются")
+
+
+def test_matches_reference():
+    """Для длительности 1 час результат совпадает с прежней логикой"""
+    print("🧪 Сравнение с прежней логикой на случайных данных...")
+    random.seed(7)
+    day = "2030-05-10"
+    for _ in range(500):
+        bookings = []
+        for _ in range(random.randint(0, 4)):
+            booking_date = random.choice(["2030-05-09", day])
+            start = random.randint(0, 23)
+            bookings.append((booking_date, f"{start:02d}:00", random.randint(1, 6)))
+        expected = [h for h in range(OPEN_HOUR, CLOSE_HOUR)
+                    if h not in reference_blocked_hours(bookings, day)]
+        mask = build_day_mask(bookings, day)
+        assert free_start_hours(mask, 1, OPEN_HOUR, CLOSE_HOUR) == expected, bookings
+
+        # Проверка длительности D: каждый час интервала должен быть свободен
+        duration = random.randint(1, 5)
+        for start in free_start_hours(mask, duration, OPEN_HOUR, CLOSE_HOUR):
+            assert start + duration <= CLOSE_HOUR
+            assert not conflicts(mask, start, duration)
+    print("   ✅ Результаты совпадают")
+
+
+def test_earliest_start_hour():
+    """Правило "не раньше чем за 1 час" для сегодняшней даты"""
+    now = datetime(2030, 5, 10, 14, 30)
+    assert earliest_start_hour("2030-05-10", now) == 16
+    assert earliest_start_hour("2030-05-10", now.replace(minute=0)) == 15
+    assert earliest_start_hour("2030-05-11", now) == 0
+    print("   ✅ Ограничение на сегодня работает")
+
+
+if __name__ == "__main__":
+    test_single_booking_buffers()
+    test_cross_midnight()
+    test_matches_reference()
+    test_earliest_start_hour()
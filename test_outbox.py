@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки очереди уведомлений (outbox.py)
+
+Вместо api.telegram.org запросы принимает локальный aiohttp-сервер.
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import web
+
+import db_pool
+import http_client
+import outbox
+
+
+class FakeTelegram:
+    """Локальная замена Bot API: отвечает по сценарию для каждого chat_id"""
+
+    def __init__(self, scenarios):
+        # chat_id -> список (status, json) по очереди; последний ответ повторяется
+        self.scenarios = scenarios
+        self.calls = []
+        self.texts = []
+
+    async def send_message(self, request):
+        data = await request.json()
+        chat_id = data["chat_id"]
+        self.calls.append((request.match_info["token"], chat_id))
+        self.texts.append((chat_id, data["text"]))
+        answers = self.scenarios[chat_id]
+        status, body = answers.pop(0) if len(answers) > 1 else answers[0]
+        return web.json_response(body, status=status)
+
+
+async def seed_admins():
+    async with db_pool.acquire() as db:
+        await db.execute("INSERT INTO admins (telegram_id, name) VALUES (1, 'Админ 1')")
+        await db.execute("INSERT INTO admins (telegram_id, name) VALUES (2, 'Админ 2')")
+        await db.commit()
+
+
+async def start_fake(fake, monkeypatch):
+    """Запустить замену Bot API и направить на нее http_client"""
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", fake.send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(http_client, "TELEGRAM_API_URL", f"http://127.0.0.1:{port}")
+    return runner
+
+
+async def check_outbox(monkeypatch):
+    await seed_admins()
+    ok = (200, {"ok": True})
+    fake = FakeTelegram({
+        1: [ok],
+        # 429: повтор через retry_after, бот приостанавливается
+        2: [(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}}), ok],
+        # 502: повтор с экспоненциальной задержкой
+        3: [(502, {"ok": False}), (502, {"ok": False}), ok],
+        # 403: бот заблокирован - без повторов
+        4: [(403, {"ok": False, "description": "Forbidden: bot was blocked by the user"})],
+    })
+    runner = await start_fake(fake, monkeypatch)
+    try:
+        # Запись в outbox откатывается вместе с транзакцией
+        async with db_pool.acquire() as db:
+            await outbox.enqueue_admins(db, "не отправится")
+            await db.rollback()
+
+        async with db_pool.acquire() as db:
+            await outbox.enqueue_admins(db, "Новая заявка")
+            await outbox.enqueue(db, outbox.BOT_MAIN, 3, "Бронь подтверждена")
+            await outbox.enqueue(db, outbox.BOT_MAIN, 4, "Бронь отменена")
+            await db.commit()
+
+        worker = outbox.OutboxWorker(
+            {outbox.BOT_ADMIN: "ADMIN", outbox.BOT_MAIN: "MAIN"}, backoff_base=0.1
+        )
+        for _ in range(60):
+            await worker.run_once()
+            stats = await outbox.get_outbox_stats()
+            if not stats.get(outbox.OUTBOX_PENDING):
+                break
+            await asyncio.sleep(0.1)
+
+        assert stats == {outbox.OUTBOX_SENT: 3, outbox.OUTBOX_FAILED: 1}, stats
+        # Админам - админ-ботом, пользователям - основным
+        assert ("ADMIN", 1) in fake.calls and ("MAIN", 3) in fake.calls
+        assert fake.calls.count(("ADMIN", 2)) == 2
+        assert fake.calls.count(("MAIN", 3)) == 3
+        assert fake.calls.count(("MAIN", 4)) == 1
+
+        async with db_pool.acquire() as db:
+            async with db.execute("SELECT chat_id, attempts, last_error FROM outbox ORDER BY chat_id") as cursor:
+                rows = await cursor.fetchall()
+        attempts = {chat_id: count for chat_id, count, _ in rows}
+        # 429 не считается неудачной попыткой
+        assert attempts == {1: 1, 2: 1, 3: 3, 4: 1}, attempts
+        assert "blocked" in rows[3][2]
+    finally:
+        await http_client.close_http()
+        await runner.cleanup()
+
+
+async def check_digest(monkeypatch):
+    await seed_admins()
+    ok = (200, {"ok": True})
+    fake = FakeTelegram({1: [ok], 2: [ok]})
+    runner = await start_fake(fake, monkeypatch)
+    monkeypatch.setattr(outbox, "ADMIN_DIGEST_WINDOW", 0.5)
+    try:
+        later = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
+        soon = datetime.now() + timedelta(hours=1)
+        async with db_pool.acquire() as db:
+            for booking_id in (10, 11, 12):
+                await outbox.enqueue_admins(
+                    db, f"Новая заявка {booking_id}", event=outbox.EVENT_NEW,
+                    summary=outbox.format_booking_line(booking_id, later, "18:00", 4, 2, "Гость"),
+                    starts_at=f"{later} 18:00"
+                )
+            await outbox.enqueue_admins(
+                db, "Заявка отменена 13", event=outbox.EVENT_CANCELLED,
+                summary=outbox.format_booking_line(13, later, "20:00"), starts_at=f"{later} 20:00"
+            )
+            # Бронь через час - срочно, без дайджеста
+            await outbox.enqueue_admins(
+                db, "Срочно: отмена 14", event=outbox.EVENT_CANCELLED,
+                summary="14", starts_at=soon.strftime("%Y-%m-%d %H:%M")
+            )
+            await db.commit()
+
+        worker = outbox.OutboxWorker({outbox.BOT_ADMIN: "ADMIN"})
+        await worker.run_once()
+        assert sorted(fake.texts) == [(1, "Срочно: отмена 14"), (2, "Срочно: отмена 14")], fake.texts
+
+        await asyncio.sleep(0.6)
+        await worker.run_once()
+        digests = fake.texts[2:]
+        # Одна сводка на админа вместо четырех сообщений
+        assert sorted(chat_id for chat_id, _ in digests) == [1, 2], digests
+        text = digests[0][1]
+        assert "4 событий" in text and "Новые заявки (3)" in text and "Отменены (1)" in text, text
+        assert f"{later} 18:00, 4 чел., 2 ч. - Гость (#10)" in text, text
+
+        stats = await outbox.get_outbox_stats()
+        assert stats == {outbox.OUTBOX_SENT: 4, outbox.OUTBOX_DIGESTED: 8}, stats
+    finally:
+        await http_client.close_http()
+        await runner.cleanup()
+
+
+async def check_leases(monkeypatch):
+    await seed_admins()
+    fake = FakeTelegram({1: [(200, {"ok": True})], 2: [(200, {"ok": True})]})
+    runner = await start_fake(fake, monkeypatch)
+    try:
+        # Два процесса с токеном админ-бота: очередь обслуживает только один
+        first = outbox.OutboxWorker({outbox.BOT_ADMIN: "ADMIN"}, lease_renew=0)
+        second = outbox.OutboxWorker({outbox.BOT_ADMIN: "ADMIN"})
+        await outbox.notify_admins("Новая заявка")
+        assert await second.run_once() == 2
+        assert await first.run_once() == 0
+
+        await outbox.notify_admins("Еще заявка")
+        assert await first.run_once() == 0
+        # После остановки аренда переходит к другому воркеру сразу
+        await second.release_leases()
+        assert await first.run_once() == 2
+        assert len(fake.calls) == 4, fake.calls
+
+        # Второй бот в том же процессе добавляет токен в общий воркер
+        worker = outbox.start_worker({outbox.BOT_ADMIN: "ADMIN"})
+        assert outbox.start_worker({outbox.BOT_MAIN: "MAIN"}) is worker
+        assert set(worker.tokens) == {outbox.BOT_ADMIN, outbox.BOT_MAIN}
+        await outbox.stop_worker()
+    finally:
+        await http_client.close_http()
+        await runner.cleanup()
+
+
+def test_worker_leases(temp_db, monkeypatch):
+    asyncio.run(check_leases(monkeypatch))
+
+
+def test_format_digest_limit():
+    events = [(outbox.EVENT_NEW, "x" * 100)] * 60
+    text = outbox.format_digest(events)
+    assert len(text) <= outbox.DIGEST_MAX_LENGTH
+    assert text.endswith("событий") and "… и еще" in text
+
+
+def test_backoff_delay():
+    assert [outbox.backoff_delay(n, 2, 30) for n in range(1, 6)] == [2, 4, 8, 16, 30]
+
+
+def test_outbox_delivery(temp_db, monkeypatch):
+    print("🧪 Проверка доставки из outbox...")
+    asyncio.run(check_outbox(monkeypatch))
+    print("   ✅ 429, повторы и отказы обрабатываются верно")
+
+
+def test_admin_digest(temp_db, monkeypatch):
+    print("🧪 Проверка дайджеста уведомлений админам...")
+    asyncio.run(check_digest(monkeypatch))
+    print("   ✅ События собираются в сводку, срочные уходят сразу")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
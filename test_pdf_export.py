@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки выгрузки броней в PDF (pdf_export.export_bookings_pdf)
+"""
+
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+import db
+import db_pool
+import pdf_export
+from conftest import seed_booking, seed_user
+
+BOOKINGS = 600
+
+
+async def check_pdf_export(workdir):
+    start = date.today()
+    async with db_pool.acquire() as conn:
+        await seed_user(conn, telegram_id=1001, username="guest")
+        for i in range(BOOKINGS):
+            await seed_booking(conn, (start + timedelta(days=i % 30)).isoformat())
+        await conn.commit()
+
+    bookings = await db.get_bookings_for_export()
+    assert len(bookings) == BOOKINGS
+
+    reports = []
+
+    async def on_progress(page, total):
+        reports.append((page, total))
+
+    filepath = os.path.join(workdir, "bookings.pdf")
+    try:
+        result = await pdf_export.export_bookings_pdf(bookings, "Тест", filepath, on_progress)
+    finally:
+        pdf_export.shutdown_executor()
+    assert result == filepath
+    with open(filepath, "rb") as f:
+        assert f.read(5) == b"%PDF-"
+
+    assert reports, "прогресс не пришел"
+    pages = [page for page, _ in reports]
+    assert pages == sorted(set(pages)), reports
+    assert all(page <= total for page, total in reports), reports
+
+
+def test_pdf_export(temp_db, tmp_path, monkeypatch):
+    print("🧪 Проверка выгрузки броней в PDF...")
+    # Опрашиваем очередь чаще, чтобы прогресс успел прийти до конца отрисовки
+    monkeypatch.setattr(pdf_export, "PROGRESS_POLL_INTERVAL", 0.01)
+    asyncio.run(check_pdf_export(str(tmp_path)))
+    print("   ✅ PDF отрисован в отдельном процессе, прогресс по страницам приходит")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
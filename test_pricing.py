@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки индекса правил ценообразования (pricing.py)
+"""
+
+import random
+import sqlite3
+
+from pricing import PriceRuleIndex, quote
+
+
+def make_rules(count):
+    """Случайные пересекающиеся правила"""
+    rules = []
+    for rule_id in range(1, count + 1):
+        start_day = random.randint(1, 25)
+        end_day = random.randint(start_day, 28)
+        start_hour = random.randint(10, 20)
+        end_hour = random.randint(start_hour + 1, 22)
+        rules.append({
+            'id': rule_id,
+            'start_date': f"2030-02-{start_day:02d}",
+            'end_date': f"2030-02-{end_day:02d}",
+            'start_time': f"{start_hour:02d}:00",
+            'end_time': f"{end_hour:02d}:00",
+            'price_per_hour': 100 * rule_id,
+            'price_per_extra_guest': 50,
+            'extra_guest_payment_type': 'per_booking',
+            'max_guests_included': 8,
+            'created_at': f"2030-01-01T00:00:{random.randint(0, 59):02d}.{rule_id:06d}",
+        })
+    return rules
+
+
+def test_index_matches_sql():
+    """Индекс выбирает то же правило, что и прежний SQL-запрос"""
+    print("🧪 Сравнение индекса правил с SQL-запросом...")
+    random.seed(3)
+    rules = make_rules(15)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE price_rules (id INTEGER, start_date TEXT, end_date TEXT, start_time TEXT,
+        end_time TEXT, created_at TEXT)
+    """)
+    conn.executemany(
+        "INSERT INTO price_rules VALUES (?, ?, ?, ?, ?, ?)",
+        [(r['id'], r['start_date'], r['end_date'], r['start_time'], r['end_time'], r['created_at']) for r in rules]
+    )
+    index = PriceRuleIndex(rules)
+
+    for day in range(1, 29):
+        for hour in range(8, 24):
+            booking_date = f"2030-02-{day:02d}"
+            booking_time = f"{hour:02d}:00"
+            row = conn.execute("""
+                SELECT id FROM price_rules
+                WHERE start_date <= ? AND end_date >= ?
+                AND start_time <= ? AND end_time > ?
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (booking_date, booking_date, booking_time, booking_time)).fetchone()
+            rule = index.lookup(booking_date, booking_time)
+            assert (rule['id'] if rule else None) == (row[0] if row else None), (booking_date, booking_time)
+    assert index.lookup("2030-03-01", "12:00") is None
+    print("   ✅ Правила совпадают")
+
+
+def test_quote():
+    """Доплата за гостей за всю бронь и за каждый час"""
+    assert quote(8, 3, 800, 500, 8) == 2400
+    assert quote(10, 3, 800, 500, 8) == 2400 + 1000
+    assert quote(10, 3, 800, 500, 8, 'per_hour') == 2400 + 3000
+    print("   ✅ Стоимость считается верно")
+
+
+if __name__ == "__main__":
+    test_index_matches_sql()
+    test_quote()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша готовых ответов /start, «Информация» и «Помощь»
+"""
+
+import asyncio
+import sys
+
+import pytest
+
+import bot
+import db
+
+
+async def check_rendered():
+    await db.init_db()
+    db.invalidate_settings()
+
+    info = await bot.get_rendered_response("info")
+    assert info.media_kind is None and info.text == db.DEFAULT_TEXTS["info_text"].strip()
+    # Повторный запрос - тот же объект из кэша
+    assert await bot.get_rendered_response("info") is info
+
+    welcome = await bot.get_rendered_response("welcome")
+    assert welcome.keyboard is not None
+    text, caption = welcome.personalize("Аня")
+    assert "Привет, Аня!" in text and caption == text[:bot.CAPTION_MAX_LENGTH]
+
+    # Изменение медиа в админ-боте сбрасывает кэш
+    await db.set_media_setting("info", "PHOTO_ID", "photo")
+    info = await bot.get_rendered_response("info")
+    assert (info.media_kind, info.file_id) == ("photo", "PHOTO_ID")
+    await db.set_media_setting("info", "VIDEO_ID", "video")
+    info = await bot.get_rendered_response("info")
+    assert (info.media_kind, info.file_id) == ("video", "VIDEO_ID")
+
+    await db.set_setting("help_text", "x" * 2000)
+    help_response = await bot.get_rendered_response("help")
+    assert len(help_response.caption) == bot.CAPTION_MAX_LENGTH
+
+
+def test_rendered_responses(temp_db):
+    print("🧪 Проверка кэша готовых ответов...")
+    asyncio.run(check_rendered())
+    print("   ✅ Ответы берутся из кэша и обновляются после правки настроек")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
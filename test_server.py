@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки API веб-сервера (server.py) на временной базе
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+import db_pool
+from conftest import GUEST_NAME, GUEST_PHONE
+
+
+def check_bad_request_releases_connection():
+    db_pool.configure(size=2)
+    import server
+    client = server.app.test_client()
+    booking = {
+        "date": (date.today() + timedelta(days=2)).isoformat(),
+        "time": "ab:00",
+        "guests": 2,
+        "duration": 2,
+        "name": GUEST_NAME,
+        "phone": GUEST_PHONE,
+    }
+    # Ошибка внутри транзакции: 500, но подключение и блокировка записи освобождены
+    for _ in range(3):
+        response = client.post("/api/book", json=booking)
+        assert response.status_code == 500, response.json
+
+    booking["time"] = "15:00"
+    response = client.post("/api/book", json=booking)
+    assert response.status_code == 200 and response.json["success"], response.json
+
+    stats = db_pool.get_pool_stats()["sync"]
+    assert stats["idle"] == stats["created"], stats
+
+
+def check_pool_checkout(workdir):
+    pool = db_pool.SyncConnectionPool(os.path.join(workdir, "pool.db"), size=1, timeout=0.2)
+    # Исключение внутри with: транзакция откатывается, подключение возвращается
+    try:
+        with pool.acquire() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("ошибка обработчика")
+    except RuntimeError:
+        pass
+    with pool.acquire() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        # Все подключения заняты: ожидание ограничено таймаутом
+        try:
+            pool.acquire()
+            raise AssertionError("ожидалась PoolTimeoutError")
+        except db_pool.PoolTimeoutError:
+            pass
+    assert pool.get_stats()["idle"] == 1
+
+
+def test_sync_pool_checkout(tmp_path):
+    check_pool_checkout(str(tmp_path))
+
+
+def test_bad_booking_request(temp_db):
+    print("🧪 Проверка ошибочной заявки через веб-сервер...")
+    check_bad_request_releases_connection()
+    print("   ✅ После ошибки подключение возвращается в пул, следующая заявка проходит")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
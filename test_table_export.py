@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки потоковой выгрузки броней в CSV (table_export)
+"""
+
+import asyncio
+import csv
+import gc
+import gzip
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+import db
+import db_pool
+import table_export
+from conftest import seed_booking, seed_user
+
+# Больше одной пачки курсора, чтобы проверить склейку пачек
+BOOKINGS = db.EXPORT_BATCH_SIZE * 2 + 37
+
+
+async def check_csv_export(workdir):
+    start = date.today()
+    async with db_pool.acquire() as conn:
+        await seed_user(conn, telegram_id=1001, username="guest")
+        for i in range(BOOKINGS):
+            await seed_booking(conn, (start + timedelta(days=i % 30)).isoformat())
+        # Отмененная бронь в выгрузку не попадает
+        await seed_booking(conn, start.isoformat(), status="cancelled")
+        await conn.commit()
+
+    filepath = os.path.join(workdir, "bookings.csv.gz")
+    count = await table_export.export_bookings_table(table_export.FORMAT_CSV, filepath)
+    assert count == BOOKINGS, count
+
+    with gzip.open(filepath, "rt", encoding="utf-8-sig", newline="") as file:
+        rows = list(csv.reader(file, delimiter=";"))
+    assert rows[0] == table_export.HEADERS, rows[0]
+    assert len(rows) == BOOKINGS + 1, len(rows)
+    ids = [int(row[0]) for row in rows[1:]]
+    assert len(set(ids)) == BOOKINGS
+
+    # Запись пачки упала - выгрузка прерывается, подключение возвращено в пул
+    class BrokenWriter:
+        def writerow(self, row):
+            pass
+
+        def writerows(self, rows):
+            raise OSError("диск заполнен")
+
+    original_writer = table_export.csv.writer
+    table_export.csv.writer = lambda *args, **kwargs: BrokenWriter()
+    try:
+        await table_export.export_bookings_csv(filepath)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("ожидалась OSError")
+    finally:
+        table_export.csv.writer = original_writer
+    assert db_pool.get_pool_stats()["async"]["in_use"] == 0
+
+    # Потребитель бросил генератор после первой пачки без aclose
+    batches = db.iter_bookings_for_export()
+    first = await batches.__anext__()
+    assert len(first) == db.EXPORT_BATCH_SIZE
+    del batches
+    gc.collect()
+    await asyncio.sleep(0)
+    assert db_pool.get_pool_stats()["async"]["in_use"] == 0
+    assert db_pool._held_connection.get() is None
+
+    # Пул по-прежнему рабочий
+    count = await table_export.export_bookings_csv(filepath)
+    assert count == BOOKINGS, count
+
+
+def test_csv_export(temp_db, tmp_path):
+    print("🧪 Проверка потоковой выгрузки в CSV...")
+    asyncio.run(check_csv_export(str(tmp_path)))
+    print("   ✅ Все пачки попали в файл, прерванная выгрузка не держит подключение")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))